@@ -0,0 +1,225 @@
+# app/analytics.py
+"""
+Analisi del parco dispositivi sulle misure delle verifiche (verification_measurements)
+per individuare i dispositivi che si stanno avvicinando ai limiti prima che una
+verifica fallisca.
+
+Le misure con un limite vengono lette a blocchi in array NumPy, con test e
+parti applicate codificati come interi; ogni serie (test + parametro +
+dispositivo + parte applicata) viene poi elaborata in modo vettoriale, senza
+cicli Python sulle misure:
+- tendenza: pendenza della retta dei minimi quadrati (unità/anno);
+- margine: distanza dell'ultima misura dal limite, in frazione del limite;
+- giorni al limite: quando la retta raggiunge il limite, se la tendenza è in salita;
+- z-score: ultima misura e pendenza rispetto al resto del parco per lo stesso test.
+I limiti sono massimi (valore <= limite), come in widgets.py.
+
+I risultati di analyze_fleet vengono riusati finché la versione dei dati del parco
+(data_versions 'fleet', incrementata dai trigger) resta la stessa.
+"""
+import csv
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import date
+
+import numpy as np
+
+import database
+
+MIN_TREND_POINTS = 3  # Misure necessarie per stimare una tendenza
+DAYS_PER_YEAR = 365.25
+MAX_PROJECTION_YEARS = 20  # Oltre questo orizzonte la proiezione al limite non viene riportata
+_JULIAN_DAY_OF_ORDINAL_ZERO = 1721424.5  # julianday('0001-01-01') - 1
+FLEET_CACHE_SIZE = 16  # Combinazioni di parametri (cliente, test, ...) tenute in memoria
+
+# Ultimi risultati di analyze_fleet per parametri: {chiave: (versione dei dati, righe)}
+_fleet_cache = OrderedDict()
+_fleet_cache_lock = threading.Lock()
+
+EXPORT_COLUMNS = [
+    ("customer_name", "CLIENTE"), ("destination_name", "DESTINAZIONE"), ("description", "DENOMINAZIONE"),
+    ("manufacturer", "MARCA"), ("model", "MODELLO"), ("serial_number", "MATRICOLA"), ("ams_inventory", "INVENTARIO AMS"),
+    ("test_name", "TEST"), ("parameter", "PARAMETRO"), ("applied_part", "PARTE APPLICATA"), ("unit", "UNITÀ"),
+    ("points", "N. MISURE"), ("first_date", "PRIMA MISURA"), ("last_date", "ULTIMA MISURA"),
+    ("last_value", "ULTIMO VALORE"), ("limit_value", "LIMITE"), ("margin_pct", "MARGINE %"),
+    ("slope_per_year", "TENDENZA/ANNO"), ("days_to_limit", "GIORNI AL LIMITE"), ("projected_date", "DATA PREVISTA"),
+    ("z_score", "Z-SCORE VALORE"), ("slope_z_score", "Z-SCORE TENDENZA"),
+]
+
+
+def _julian_to_iso(day: float) -> str:
+    return date.fromordinal(int(day - _JULIAN_DAY_OF_ORDINAL_ZERO)).isoformat()
+
+def _optional(value: float):
+    return None if np.isnan(value) else float(value)
+
+def load_measurements(customer_id: int = None, batch_size: int = 50_000) -> dict:
+    """
+    Misure con limite come array NumPy allineati (test, device, part, day, value,
+    limit), lette a blocchi. 'tests' e 'parts' decodificano i codici interi di
+    test (test_name, parameter) e parti applicate.
+    """
+    # Codice progressivo assegnato alla prima occorrenza di ogni test/parte applicata
+    test_codes, part_codes = defaultdict(), defaultdict()
+    test_codes.default_factory, part_codes.default_factory = test_codes.__len__, part_codes.__len__
+    chunks = {"test": [], "device": [], "part": [], "day": [], "value": [], "limit": []}
+    for rows in database.iter_measurement_series(customer_id, batch_size):
+        test, parameter, device, part, day, value, limit = zip(*rows)
+        count = len(rows)
+        chunks["test"].append(np.fromiter(map(test_codes.__getitem__, zip(test, parameter)), np.int64, count))
+        chunks["device"].append(np.fromiter(device, np.int64, count))
+        chunks["part"].append(np.fromiter(map(part_codes.__getitem__, part), np.int64, count))
+        chunks["day"].append(np.fromiter(day, np.float64, count))
+        chunks["value"].append(np.fromiter(value, np.float64, count))
+        chunks["limit"].append(np.fromiter(limit, np.float64, count))
+    arrays = {name: np.concatenate(parts) if parts else np.empty(0, np.int64 if name in ("test", "device", "part") else np.float64)
+              for name, parts in chunks.items()}
+    arrays["tests"] = list(test_codes)
+    arrays["parts"] = list(part_codes)
+    return arrays
+
+def _zscore(values: np.ndarray) -> np.ndarray:
+    finite = np.isfinite(values)
+    if finite.sum() < 2:
+        return np.full(values.shape, np.nan)
+    std = values[finite].std()
+    if std == 0:
+        return np.zeros(values.shape)
+    return (values - values[finite].mean()) / std
+
+def compute_drift(m: dict, min_points: int = MIN_TREND_POINTS) -> dict:
+    """
+    Indicatori di ogni serie degli array di load_measurements(). Restituisce
+    array allineati, uno per serie (test, device, part sono codici/id interi).
+    """
+    if not len(m["device"]):
+        return {"test": np.empty(0, np.int64), "device": np.empty(0, np.int64)}
+    n_devices, n_parts = int(m["device"].max()) + 1, max(len(m["parts"]), 1)
+    key = (m["test"] * n_parts + m["part"]) * n_devices + m["device"]
+    series_keys, s = np.unique(key, return_inverse=True)
+    order = np.lexsort((m["day"], s))
+    s, day, value, limit = s[order], m["day"][order], m["value"][order], m["limit"][order]
+
+    n = np.bincount(s)
+    ends = np.cumsum(n) - 1
+    starts = ends - n + 1
+    mean_day = np.bincount(s, day) / n
+    mean_value = np.bincount(s, value) / n
+    # Giorni centrati sulla media della serie: evita la perdita di precisione sui giorni giuliani
+    dt = day - mean_day[s]
+    sxx = np.bincount(s, dt * dt)
+    sxy = np.bincount(s, dt * (value - mean_value[s]))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where((n >= min_points) & (sxx > 0), sxy / sxx, np.nan)  # unità/giorno
+        last_day, last_value, last_limit = day[ends], value[ends], limit[ends]
+        valid_limit = last_limit > 0
+        margin = np.where(valid_limit, (last_limit - last_value) / last_limit, np.nan)
+        fitted_last = mean_value + np.nan_to_num(slope) * (last_day - mean_day)
+        rising = valid_limit & (slope > 0)
+        days_to_limit = np.where(rising, np.maximum((last_limit - fitted_last) / slope, 0.0), np.nan)
+        days_to_limit[days_to_limit > MAX_PROJECTION_YEARS * DAYS_PER_YEAR] = np.nan
+
+    test = series_keys // (n_parts * n_devices)
+    # z-score calcolati all'interno di ogni test: i valori di test diversi non sono confrontabili
+    z_score, slope_z_score = np.full(len(n), np.nan), np.full(len(n), np.nan)
+    for code in np.unique(test):
+        mask = test == code
+        z_score[mask] = _zscore(last_value[mask])
+        slope_z_score[mask] = _zscore(slope[mask])
+
+    return {
+        "test": test, "part": (series_keys // n_devices) % n_parts, "device": series_keys % n_devices,
+        "points": n, "first_day": day[starts], "last_day": last_day, "last_value": last_value,
+        "limit": last_limit, "margin": margin, "slope": slope, "days_to_limit": days_to_limit,
+        "z_score": z_score, "slope_z_score": slope_z_score,
+    }
+
+def rank_by_risk(drift: dict) -> np.ndarray:
+    """Indici delle serie dalla più a rischio: giorni al limite (assenti in fondo), poi margine."""
+    days = drift["days_to_limit"]
+    return np.lexsort((np.where(np.isnan(drift["margin"]), np.inf, drift["margin"]), np.where(np.isnan(days), np.inf, days)))
+
+def analyze_fleet(customer_id: int = None, tests: list = None, min_points: int = MIN_TREND_POINTS,
+                  limit: int = None, batch_size: int = 50_000) -> list:
+    """
+    Analizza le serie di misure con un limite dei dispositivi attivi (di un
+    cliente, se indicato) e restituisce le righe ordinate per rischio, con i
+    dati del dispositivo. tests limita l'analisi ad alcuni (test_name, parameter);
+    limit limita le righe restituite. Se i dati non sono cambiati dall'ultima
+    analisi con gli stessi parametri, restituisce una copia di quei risultati.
+    """
+    key = (customer_id, None if tests is None else frozenset(tuple(t) for t in tests), min_points, limit)
+    # La versione viene letta prima dei dati: se cambia durante l'analisi, il risultato risulta già superato
+    version = database.get_fleet_data_version()
+    with _fleet_cache_lock:
+        cached = _fleet_cache.get(key)
+        if version is not None and cached is not None and cached[0] == version:
+            _fleet_cache.move_to_end(key)
+            # Righe sempre nuove: chi le modifica non altera la cache
+            return [dict(row) for row in cached[1]]
+
+    start = time.perf_counter()
+    m = load_measurements(customer_id, batch_size)
+    if tests is not None:
+        wanted = {tuple(t) for t in tests}
+        keep = np.isin(m["test"], [code for code, key in enumerate(m["tests"]) if key in wanted])
+        m.update({k: m[k][keep] for k in ("test", "device", "part", "day", "value", "limit")})
+    drift = compute_drift(m, min_points)
+    order = rank_by_risk(drift)[:limit] if len(drift["device"]) else []
+
+    devices = database.get_devices_overview({int(drift["device"][i]) for i in order})
+    units = {}
+    results = []
+    for i in order:
+        test_name, parameter = m["tests"][drift["test"][i]]
+        if (test_name, parameter) not in units:
+            units[(test_name, parameter)] = database.get_measurement_unit(test_name, parameter)
+        device_id, days_left = int(drift["device"][i]), drift["days_to_limit"][i]
+        slope = drift["slope"][i]
+        results.append({
+            "device_id": device_id, **devices.get(device_id, {}),
+            "test_name": test_name, "parameter": parameter, "applied_part": m["parts"][drift["part"][i]] or None,
+            "unit": units[(test_name, parameter)], "points": int(drift["points"][i]),
+            "first_date": _julian_to_iso(drift["first_day"][i]), "last_date": _julian_to_iso(drift["last_day"][i]),
+            "last_value": float(drift["last_value"][i]), "limit_value": float(drift["limit"][i]),
+            "margin_pct": float(drift["margin"][i]) * 100,
+            "slope_per_year": None if np.isnan(slope) else float(slope) * DAYS_PER_YEAR,
+            "days_to_limit": None if np.isnan(days_left) else int(days_left),
+            "projected_date": None if np.isnan(days_left) else _julian_to_iso(drift["last_day"][i] + days_left),
+            "z_score": _optional(drift["z_score"][i]), "slope_z_score": _optional(drift["slope_z_score"][i]),
+        })
+    logging.info(f"Analisi del parco: {len(drift['device'])} serie da {len(m['device'])} misure "
+                 f"in {time.perf_counter() - start:.2f}s ({len(results)} restituite).")
+    if version is not None:
+        with _fleet_cache_lock:
+            _fleet_cache[key] = (version, [dict(row) for row in results])
+            _fleet_cache.move_to_end(key)
+            while len(_fleet_cache) > FLEET_CACHE_SIZE:
+                _fleet_cache.popitem(last=False)
+    return results
+
+def export_drift_report(rows: list, output_path: str) -> int:
+    """Esporta le righe di analyze_fleet() in Excel (.xlsx) o CSV (altre estensioni)."""
+    values = ([row.get(key) for key, _ in EXPORT_COLUMNS] for row in rows)
+    if output_path.lower().endswith(".xlsx"):
+        import xlsxwriter
+        workbook = xlsxwriter.Workbook(output_path, {'constant_memory': True})
+        try:
+            worksheet = workbook.add_worksheet("Analisi parco")
+            header_format = workbook.add_format({'bold': True, 'text_wrap': True, 'valign': 'vcenter', 'fg_color': '#D7E4BC', 'border': 1})
+            worksheet.write_row(0, 0, [title for _, title in EXPORT_COLUMNS], header_format)
+            for row_num, row in enumerate(values, start=1):
+                worksheet.write_row(row_num, 0, ["" if v is None else v for v in row])
+            worksheet.autofilter(0, 0, max(len(rows), 1), len(EXPORT_COLUMNS) - 1)
+            worksheet.freeze_panes(1, 0)
+        finally:
+            workbook.close()
+    else:
+        with open(output_path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow([title for _, title in EXPORT_COLUMNS])
+            writer.writerows(values)
+    return len(rows)
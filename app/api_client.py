@@ -0,0 +1,132 @@
+# app/api_client.py
+"""
+Client HTTP condiviso per le chiamate al server centrale (login, sincronizzazione,
+gestione utenti e firme).
+
+Tutte le richieste passano da un'unica requests.Session, così le connessioni
+TCP/TLS restano aperte e vengono riusate tra una chiamata e l'altra. La sessione:
+- ripete le richieste fallite con backoff esponenziale e jitter, ma solo quando
+  è sicuro farlo: errori di connessione (la richiesta non è partita) oppure
+  metodi idempotenti (GET, PUT, DELETE) su timeout di lettura e risposte 502/503/504;
+- comprime in gzip i corpi JSON sopra una certa dimensione, ma solo dopo che il
+  server ha dichiarato di accettarli ("Accept-Encoding: gzip" in una risposta,
+  RFC 7694): i server meno recenti ricevono JSON non compresso. Accetta risposte
+  compresse (decompresse in automatico da requests);
+- applica a ogni endpoint il proprio timeout, letto da config.ini ([api.timeouts]).
+"""
+import atexit
+import gzip
+import json
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app import auth_manager, config
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"})
+RETRY_STATUSES = (502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+# Il server ha dichiarato di accettare richieste compresse (None = non ancora visto)
+_server_accepts_gzip = None
+
+
+def _build_session() -> requests.Session:
+    settings = config.API_SETTINGS
+    retries = settings["retries"]
+    retry = Retry(total=retries, connect=retries, read=retries, status=retries, other=0,
+                  backoff_factor=settings["backoff_factor"], backoff_max=settings["backoff_max"],
+                  backoff_jitter=settings["backoff_jitter"], status_forcelist=RETRY_STATUSES,
+                  allowed_methods=IDEMPOTENT_METHODS, raise_on_status=False, respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings["pool_maxsize"], max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"User-Agent": f"SafetyTestManager/{config.VERSIONE}", "Accept-Encoding": "gzip, deflate"})
+    return session
+
+def get_session() -> requests.Session:
+    """Restituisce la sessione condivisa, creandola alla prima chiamata."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+                atexit.register(close_session)
+    return _session
+
+def close_session():
+    """Chiude le connessioni aperte; la prossima richiesta crea una nuova sessione."""
+    global _session, _server_accepts_gzip
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+        _server_accepts_gzip = None
+
+def timeout_for(endpoint: str) -> tuple:
+    """Timeout (connessione, lettura) dell'endpoint, es. 'sync' o 'users'."""
+    settings = config.API_SETTINGS
+    return settings["connect_timeout"], settings["timeouts"].get(endpoint, settings["read_timeout"])
+
+def _gzip_requests_enabled() -> bool:
+    mode = config.API_SETTINGS["gzip_requests"]
+    if mode == "always":
+        return True
+    if mode == "never":
+        return False
+    return bool(_server_accepts_gzip)
+
+def encode_json(payload) -> tuple:
+    """
+    Codifica il payload in JSON e, se supera la soglia configurata e il server
+    accetta richieste compresse, lo comprime.
+    Restituisce (corpo, header) da passare a request().
+    """
+    settings = config.API_SETTINGS
+    body = json.dumps(payload).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if settings["gzip_min_bytes"] and len(body) >= settings["gzip_min_bytes"] and _gzip_requests_enabled():
+        body = gzip.compress(body, compresslevel=settings["gzip_level"])
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
+def request(method: str, path: str, *, json_body=None, endpoint: str = None, auth: bool = True, **kwargs) -> requests.Response:
+    """
+    Esegue una richiesta verso config.SERVER_URL + path con la sessione condivisa.
+    json_body viene codificato (ed eventualmente compresso) con encode_json();
+    l'endpoint per il timeout è il primo segmento del percorso, se non indicato.
+    Le eccezioni di requests vengono propagate come prima.
+    """
+    global _server_accepts_gzip
+    headers = {**(auth_manager.get_auth_headers() if auth else {}), **(kwargs.pop("headers", None) or {})}
+    if json_body is not None:
+        kwargs["data"], json_headers = encode_json(json_body)
+        headers.update(json_headers)
+    endpoint = endpoint or path.strip("/").split("/")[0]
+    kwargs.setdefault("timeout", timeout_for(endpoint))
+
+    start = time.perf_counter()
+    response = get_session().request(method, f"{config.SERVER_URL}{path}", headers=headers, **kwargs)
+    if "gzip" in response.headers.get("Accept-Encoding", "").lower():
+        _server_accepts_gzip = True
+    logging.debug(f"{method} {path} -> {response.status_code} in {time.perf_counter() - start:.3f}s "
+                  f"({response.headers.get('Content-Encoding', 'identity')}, {len(response.content)} byte)")
+    return response
+
+def get(path: str, **kwargs) -> requests.Response:
+    return request("GET", path, **kwargs)
+
+def post(path: str, **kwargs) -> requests.Response:
+    return request("POST", path, **kwargs)
+
+def put(path: str, **kwargs) -> requests.Response:
+    return request("PUT", path, **kwargs)
+
+def delete(path: str, **kwargs) -> requests.Response:
+    return request("DELETE", path, **kwargs)
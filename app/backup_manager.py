@@ -1,60 +1,188 @@
 # app/backup_manager.py
 import os
+import re
+import gzip
 import shutil
+import sqlite3
 import logging
+import tempfile
 from datetime import datetime
 from app import config
 
 # ✅ Usa i percorsi centralizzati in AppData
 DB_FILE = config.DB_PATH
 BACKUP_DIR = config.BACKUP_DIR
-BACKUP_RETENTION_COUNT = 10  # Numero di backup da conservare
+BACKUP_RETENTION_COUNT = config.BACKUP_SETTINGS["retention_count"]  # Numero di backup recenti da conservare
+BACKUP_KEEP_DAILY_DAYS = config.BACKUP_SETTINGS["keep_daily_days"]  # Oltre a questi, uno al giorno per N giorni
 
-def create_backup():
-    """Crea un backup del file del database con un timestamp."""
+# Pagine copiate a ogni passo dell'API di backup: tra un passo e l'altro il
+# database resta disponibile per le scritture degli altri thread.
+BACKUP_PAGES_PER_STEP = 1024
+BACKUP_STEP_SLEEP = 0.005
+
+_BACKUP_NAME = re.compile(r"^(?P<base>.+)_(?P<ts>\d{8}_\d{6})\.db\.bak(?:\.gz)?$")
+
+def _backup_files():
+    """Backup presenti nella cartella, dal più recente: lista di (percorso, datetime)."""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    base = os.path.splitext(os.path.basename(DB_FILE))[0]
+    found = []
+    for name in os.listdir(BACKUP_DIR):
+        m = _BACKUP_NAME.match(name)
+        if m and m.group("base") == base:
+            found.append((os.path.join(BACKUP_DIR, name), datetime.strptime(m.group("ts"), "%Y%m%d_%H%M%S")))
+    found.sort(key=lambda item: item[1], reverse=True)
+    return found
+
+def _db_modified_after(moment: datetime) -> bool:
+    """True se il database (o il suo WAL) è stato modificato dopo 'moment'."""
+    mtimes = [os.path.getmtime(p) for p in (DB_FILE, DB_FILE + "-wal") if os.path.exists(p)]
+    return not mtimes or datetime.fromtimestamp(max(mtimes)) > moment
+
+def _copy_database(source_path: str, target_path: str, progress_callback=None):
+    """
+    Copia coerente di un database SQLite con l'API di backup, a passi di
+    BACKUP_PAGES_PER_STEP pagine: include il contenuto del WAL e non cattura
+    mai un file a metà scrittura.
+    """
+    def on_progress(status, remaining, total):
+        if progress_callback and total:
+            progress_callback(total - remaining, total)
+
+    src = sqlite3.connect(source_path)
+    dst = sqlite3.connect(target_path)
+    try:
+        src.backup(dst, pages=BACKUP_PAGES_PER_STEP, progress=on_progress, sleep=BACKUP_STEP_SLEEP)
+    finally:
+        dst.close()
+        src.close()
+
+def verify_backup(path: str) -> bool:
+    """Esegue PRAGMA integrity_check su un backup (decompresso o .gz)."""
+    tmp_path = None
+    try:
+        if path.endswith(".gz"):
+            fd, tmp_path = tempfile.mkstemp(suffix=".db", dir=BACKUP_DIR)
+            with os.fdopen(fd, "wb") as out, gzip.open(path, "rb") as src:
+                shutil.copyfileobj(src, out, 1024 * 1024)
+            path = tmp_path
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            result = conn.execute("PRAGMA integrity_check").fetchall()
+        finally:
+            conn.close()
+        ok = len(result) == 1 and result[0][0] == "ok"
+        if not ok:
+            logging.error(f"Verifica di integrità del backup fallita: {[r[0] for r in result[:10]]}")
+        return ok
+    except (sqlite3.Error, OSError) as e:
+        logging.error(f"Impossibile verificare il backup {path}: {e}")
+        return False
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def create_backup(compress: bool = None, verify: bool = None, force: bool = False, progress_callback=None):
+    """
+    Crea un backup del database con un timestamp, usando l'API di backup di SQLite
+    (sicura anche mentre l'applicazione scrive). Il backup viene verificato con
+    integrity_check e, se richiesto, compresso in gzip. Se il database non è
+    cambiato dall'ultimo backup non ne viene creato uno nuovo (salvo force=True).
+    Restituisce il percorso del backup creato, o None.
+    progress_callback(pagine copiate, pagine totali) viene chiamata a ogni passo.
+    """
+    settings = config.BACKUP_SETTINGS
+    compress = settings["compress"] if compress is None else compress
+    verify = settings["verify"] if verify is None else verify
     # ✅ Assicurati che la cartella backup esista in AppData
     os.makedirs(BACKUP_DIR, exist_ok=True)
 
     if not os.path.exists(DB_FILE):
         logging.warning(f"File database '{DB_FILE}' non trovato. Backup saltato.")
-        return
+        return None
+
+    existing = _backup_files()
+    if existing and not force and not _db_modified_after(existing[0][1]):
+        logging.info(f"Database invariato dall'ultimo backup ({os.path.basename(existing[0][0])}). Backup saltato.")
+        _rotate_old_backups()
+        return None
 
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     base = os.path.splitext(os.path.basename(DB_FILE))[0]  # 'verifiche'
-    backup_name = f"{base}_{timestamp}.db.bak"
-    backup_path = os.path.join(BACKUP_DIR, backup_name)
+    backup_path = os.path.join(BACKUP_DIR, f"{base}_{timestamp}.db.bak")
+    tmp_path = backup_path + ".tmp"
 
     try:
-        shutil.copy2(DB_FILE, backup_path)
-        logging.info(f"Backup creato: {backup_path}")
+        _copy_database(DB_FILE, tmp_path, progress_callback)
+        if verify and not verify_backup(tmp_path):
+            raise sqlite3.DatabaseError("il backup non ha superato la verifica di integrità")
+        if compress:
+            with open(tmp_path, "rb") as src, gzip.open(backup_path + ".gz.tmp", "wb", compresslevel=6) as out:
+                shutil.copyfileobj(src, out, 1024 * 1024)
+            os.remove(tmp_path)
+            tmp_path, backup_path = backup_path + ".gz.tmp", backup_path + ".gz"
+        # Il nome definitivo compare solo a backup completo
+        os.replace(tmp_path, backup_path)
+        logging.info(f"Backup creato: {backup_path} ({os.path.getsize(backup_path) / 1024:.0f} KB)")
         _rotate_old_backups()
+        return backup_path
     except Exception:
         logging.error("Errore durante la creazione del backup.", exc_info=True)
+        for leftover in (tmp_path, backup_path + ".tmp", backup_path + ".gz.tmp"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        return None
 
 def _rotate_old_backups():
-    """Mantiene solo gli ultimi BACKUP_RETENTION_COUNT backup."""
+    """
+    Conserva gli ultimi BACKUP_RETENTION_COUNT backup e, per gli ultimi
+    BACKUP_KEEP_DAILY_DAYS giorni, anche il più recente di ogni giorno.
+    """
     try:
-        if not os.path.isdir(BACKUP_DIR):
-            return
-        backups = [os.path.join(BACKUP_DIR, f) for f in os.listdir(BACKUP_DIR)
-                   if f.lower().endswith(".db")]
-        backups.sort(key=lambda p: os.path.getmtime(p), reverse=True)
-        if len(backups) > BACKUP_RETENTION_COUNT:
-            for f in backups[BACKUP_RETENTION_COUNT:]:
-                try:
-                    os.remove(f)
-                    logging.info(f"Vecchio backup rimosso: {f}")
-                except Exception:
-                    logging.warning(f"Impossibile rimuovere backup: {f}", exc_info=True)
+        backups = _backup_files()
+        keep = {path for path, _ in backups[:BACKUP_RETENTION_COUNT]}
+        today = datetime.now().date()
+        seen_days = set()
+        for path, moment in backups:
+            day = moment.date()
+            if (today - day).days < BACKUP_KEEP_DAILY_DAYS and day not in seen_days:
+                seen_days.add(day)
+                keep.add(path)
+        for path, _ in backups:
+            if path in keep:
+                continue
+            try:
+                os.remove(path)
+                logging.info(f"Vecchio backup rimosso: {path}")
+            except Exception:
+                logging.warning(f"Impossibile rimuovere backup: {path}", exc_info=True)
     except Exception:
         logging.error("Errore durante la rotazione dei vecchi backup.", exc_info=True)
 
 def restore_from_backup(backup_path):
-    """Ripristina il database da un file di backup, sovrascrivendo quello corrente."""
+    """
+    Ripristina il database da un file di backup (anche compresso), sovrascrivendo
+    quello corrente. Il backup viene verificato prima e copiato con l'API di
+    backup di SQLite, così il file in uso non resta mai a metà.
+    """
+    tmp_path = None
     try:
-        shutil.copy2(backup_path, DB_FILE)
+        source = backup_path
+        if backup_path.endswith(".gz"):
+            fd, tmp_path = tempfile.mkstemp(suffix=".db", dir=BACKUP_DIR)
+            with os.fdopen(fd, "wb") as out, gzip.open(backup_path, "rb") as src:
+                shutil.copyfileobj(src, out, 1024 * 1024)
+            source = tmp_path
+        if not verify_backup(source):
+            logging.critical(f"Ripristino annullato: il backup {backup_path} è danneggiato.")
+            return False
+        _copy_database(source, DB_FILE)
         logging.warning(f"Database ripristinato con successo dal file: {backup_path}")
         return True
     except Exception:
         logging.critical(f"Errore critico durante il ripristino dal backup: {backup_path}", exc_info=True)
         return False
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -51,15 +51,84 @@ PLACEHOLDER_SERIALS = {
     "SENZA SN", "NO SN", "MANCA SN", "N/D", "MANCANTE", "ND"
 }
 
-def load_server_url():
-    """Legge l'URL del server da config.ini."""
+def _read_config() -> configparser.ConfigParser:
+    """Legge config.ini una sola volta; se manca, ogni impostazione usa il suo valore predefinito."""
     parser = configparser.ConfigParser()
     if os.path.exists(CONFIG_INI_PATH):
         parser.read(CONFIG_INI_PATH)
-        return parser.get('server', 'url', fallback='http://localhost:8000')
-    return 'http://localhost:8000'
+    return parser
+
+_config = _read_config()
+
+def load_server_url(parser):
+    """Legge l'URL del server da config.ini."""
+    return parser.get('server', 'url', fallback='http://localhost:8000')
+
+SERVER_URL = load_server_url(_config)
+
+def load_backup_settings(parser):
+    """Legge da config.ini le impostazioni dei backup (sezione [backup], tutte facoltative)."""
+    return {
+        "retention_count": parser.getint('backup', 'retention_count', fallback=10),
+        "keep_daily_days": parser.getint('backup', 'keep_daily_days', fallback=7),
+        "compress": parser.getboolean('backup', 'compress', fallback=True),
+        "verify": parser.getboolean('backup', 'verify', fallback=True),
+    }
+
+BACKUP_SETTINGS = load_backup_settings(_config)
+
+def load_diagnostics_settings(parser):
+    """Legge da config.ini le impostazioni di diagnostica (sezione [diagnostics], facoltativa)."""
+    return {
+        "query_stats": parser.getboolean('diagnostics', 'query_stats', fallback=True),
+        # 0 disattiva il log delle query lente
+        "slow_query_ms": parser.getfloat('diagnostics', 'slow_query_ms', fallback=200.0),
+    }
+
+DIAGNOSTICS_SETTINGS = load_diagnostics_settings(_config)
+
+def load_logging_settings(parser):
+    """
+    Legge da config.ini le impostazioni del logging: sezione [logging] per livelli
+    e formato, sezione [logging.modules] per i livelli dei singoli moduli/logger
+    (es. database = WARNING).
+    """
+    return {
+        "console_level": parser.get('logging', 'console_level', fallback='DEBUG').upper(),
+        "file_level": parser.get('logging', 'file_level', fallback='INFO').upper(),
+        "json": parser.getboolean('logging', 'json', fallback=False),
+        "json_level": parser.get('logging', 'json_level', fallback='INFO').upper(),
+        # Messaggi DEBUG/INFO ammessi al secondo per singola riga di codice (0 = nessun limite)
+        "rate_limit_per_second": parser.getint('logging', 'rate_limit_per_second', fallback=20),
+        "module_levels": {k: v.upper() for k, v in parser.items('logging.modules')} if parser.has_section('logging.modules') else {},
+    }
+
+LOGGING_SETTINGS = load_logging_settings(_config)
+
+def load_api_settings(parser):
+    """
+    Legge da config.ini le impostazioni del client HTTP: sezione [api] per
+    connessioni, tentativi e compressione, sezione [api.timeouts] per il timeout
+    di lettura dei singoli endpoint (es. sync = 120). Tutto è facoltativo.
+    """
+    return {
+        "connect_timeout": parser.getfloat('api', 'connect_timeout', fallback=5.0),
+        "read_timeout": parser.getfloat('api', 'read_timeout', fallback=30.0),
+        # Tentativi ripetuti: solo errori di connessione o metodi idempotenti (GET, PUT, DELETE)
+        "retries": parser.getint('api', 'retries', fallback=3),
+        "backoff_factor": parser.getfloat('api', 'backoff_factor', fallback=0.5),
+        "backoff_max": parser.getfloat('api', 'backoff_max', fallback=10.0),
+        "backoff_jitter": parser.getfloat('api', 'backoff_jitter', fallback=0.5),
+        "pool_maxsize": parser.getint('api', 'pool_maxsize', fallback=4),
+        # I corpi JSON da questa dimensione in su vengono inviati compressi (0 = mai).
+        # gzip_requests: auto = solo se il server dichiara di accettarli, always, never
+        "gzip_requests": parser.get('api', 'gzip_requests', fallback='auto').strip().lower(),
+        "gzip_min_bytes": parser.getint('api', 'gzip_min_bytes', fallback=1024),
+        "gzip_level": parser.getint('api', 'gzip_level', fallback=6),
+        "timeouts": {k: float(v) for k, v in parser.items('api.timeouts')} if parser.has_section('api.timeouts') else {},
+    }
 
-SERVER_URL = load_server_url()
+API_SETTINGS = load_api_settings(_config)
 PROFILES = {}
 
 
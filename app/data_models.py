@@ -2,7 +2,7 @@
 from dataclasses import dataclass, field
 from typing import List, Dict, Optional
 
-@dataclass
+@dataclass(slots=True)
 class Limit:
     unit: str
     high_value: Optional[float] = None
@@ -13,14 +13,14 @@ class AppliedPart:
     part_type: str # Tipo di parte applicata (B, BF, CF)
     code: str      # Codice specifico per lo strumento (es. "V1") <-- NUOVO CAMPO
 
-@dataclass
+@dataclass(slots=True)
 class Test:
     name: str
     parameter: Optional[str] = ""
     limits: Dict[str, Limit] = field(default_factory=dict)
     is_applied_part_test: bool = False
 
-@dataclass
+@dataclass(slots=True)
 class VerificationProfile:
     name: str
     tests: List[Test]
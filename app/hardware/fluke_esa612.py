@@ -1,9 +1,10 @@
-from click import command
 import serial
 import serial.tools.list_ports
 import time
 import logging
 import re
+from datetime import datetime, timezone
+from .reading_capture import ReadingCapture
 
 # Dizionario per tradurre i codici di errore dello strumento
 FLUKE_ERROR_CODES = {
@@ -11,6 +12,14 @@ FLUKE_ERROR_CODES = {
     "!21": "Cavo di terra o presa apparecchio non collegato allo strumento."
 }
 
+# Associa il nome del test (come definito nei profili) al metodo dello strumento
+TEST_FUNCTION_MAP = {
+    "Tensione alimentazione": "esegui_test_tensione_rete",
+    "Resistenza conduttore di terra": "esegui_test_resistenza_terra",
+    "Corrente dispersione diretta dispositivo": "esegui_test_dispersione_diretta",
+    "Corrente dispersione diretta P.A.": "esegui_test_dispersione_parti_applicate",
+}
+
 class FlukeESA612:
     def __init__(self, port):
         if not port or port == "Nessuna":
@@ -21,6 +30,11 @@ class FlukeESA612:
             'baudrate': 115200, 'bytesize': serial.EIGHTBITS, 'parity': serial.PARITY_NONE,
             'stopbits': serial.STOPBITS_ONE, 'timeout': 2, 'rtscts': True
         }
+        # Modalità cattura: durante MREAD registra tutte le letture trasmesse
+        self.capture_enabled = False
+        self.capture_duration = 3.0
+        self.capture_max_samples = 2000
+        self.last_capture = None
 
     def __enter__(self):
         self.connect()
@@ -113,6 +127,7 @@ class FlukeESA612:
     def get_first_reading(self) -> str:
         self._send_and_check("MREAD")
         reading = None
+        self.last_capture = None
         
         try:
             for _ in range(15):
@@ -130,6 +145,8 @@ class FlukeESA612:
                 if re.search(r'\d', line):
                     logging.debug(f"<- MREAD: {line}")
                     reading = line
+                    if self.capture_enabled:
+                        self.last_capture = self._capture_stream(line)
                     break
                 
                 time.sleep(0.2)
@@ -142,6 +159,27 @@ class FlukeESA612:
 
         return reading
 
+    def _capture_stream(self, first_line: str) -> ReadingCapture:
+        """
+        Continua a leggere lo stream di MREAD per capture_duration secondi,
+        registrando ogni lettura numerica con il relativo istante.
+        """
+        capture = ReadingCapture(started_at=datetime.now(timezone.utc).isoformat())
+        start = time.monotonic()
+        line = first_line
+        while True:
+            try:
+                capture.append(time.monotonic() - start, float(self.extract_numeric_value(line)))
+            except ValueError:
+                pass
+            if time.monotonic() - start >= self.capture_duration or len(capture) >= self.capture_max_samples:
+                break
+            line = self.ser.readline().decode('ascii', errors='ignore').strip()
+            if line in FLUKE_ERROR_CODES:
+                break
+        logging.debug(f"Cattura MREAD completata: {len(capture)} letture.")
+        return capture
+
     def extract_numeric_value(self, raw_response: str) -> str:
         if raw_response is None:
             raise ValueError("Nessuna lettura valida ricevuta dallo strumento (timeout).")
@@ -0,0 +1,65 @@
+# app/hardware/reading_capture.py
+import struct
+import sys
+import zlib
+from array import array
+
+# Intestazione del blob: magic, versione formato, numero di campioni
+_HEADER = struct.Struct("<4sBI")
+_MAGIC = b"RCAP"
+_FORMAT_VERSION = 1
+
+class ReadingCapture:
+    """
+    Serie completa delle letture trasmesse dallo strumento durante un MREAD.
+    I campioni sono tenuti in due array float32 (secondi dall'avvio della
+    misura e valore letto) e vengono serializzati in un blob compresso zlib,
+    così da non appesantire results_json.
+    """
+    __slots__ = ("timestamps", "values", "started_at")
+
+    def __init__(self, started_at: str = None):
+        self.timestamps = array('f')
+        self.values = array('f')
+        self.started_at = started_at
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, elapsed_s: float, value: float):
+        self.timestamps.append(elapsed_s)
+        self.values.append(value)
+
+    def summary(self) -> dict:
+        """Statistiche sintetiche della serie (min/max/media)."""
+        if not self.values:
+            return {"samples": 0}
+        return {
+            "samples": len(self.values),
+            "min": min(self.values),
+            "max": max(self.values),
+            "mean": sum(self.values) / len(self.values),
+            "duration_s": self.timestamps[-1] - self.timestamps[0],
+        }
+
+    def to_blob(self) -> bytes:
+        ts, vals = array('f', self.timestamps), array('f', self.values)
+        if sys.byteorder != "little":
+            ts.byteswap(); vals.byteswap()
+        payload = _HEADER.pack(_MAGIC, _FORMAT_VERSION, len(vals)) + ts.tobytes() + vals.tobytes()
+        return zlib.compress(payload, 6)
+
+    @classmethod
+    def from_blob(cls, blob: bytes, started_at: str = None) -> "ReadingCapture":
+        payload = zlib.decompress(blob)
+        magic, version, count = _HEADER.unpack_from(payload)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            raise ValueError("Formato della cattura letture non riconosciuto.")
+        item_size = array('f').itemsize
+        offset = _HEADER.size
+        capture = cls(started_at)
+        capture.timestamps.frombytes(payload[offset:offset + count * item_size])
+        capture.values.frombytes(payload[offset + count * item_size:offset + 2 * count * item_size])
+        if sys.byteorder != "little":
+            capture.timestamps.byteswap(); capture.values.byteswap()
+        return capture
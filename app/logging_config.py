@@ -1,16 +1,124 @@
 # app/logging_config.py
+import atexit
+import copy
+import json
 import logging
 import logging.handlers
+import queue
 import sys
 import os
+import threading
+import time
 from datetime import datetime
 from app import config
 
 LOG_DIR = config.LOG_DIR
+SLOW_QUERY_LOG_FILE = os.path.join(LOG_DIR, "slow_queries.log")
+SLOW_QUERY_LOGGER = "database.slow_queries"
+
+_listener = None
+
+class JsonLinesFormatter(logging.Formatter):
+    """Un oggetto JSON per riga, per analizzare i log con strumenti esterni."""
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    """
+    Accoda il record senza formattarlo: formato e traceback vengono elaborati dal
+    QueueListener nel suo thread (e il formatter JSON riceve ancora exc_info).
+    Qui si risolve solo il messaggio, così gli argomenti non possono cambiare
+    prima della scrittura.
+    """
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        return record
+
+class ModuleLevelFilter(logging.Filter):
+    """
+    Livelli minimi per modulo: la chiave può essere il nome del logger (e i suoi
+    antenati, es. 'app.hardware') oppure il nome del modulo sorgente, così vale
+    anche per le chiamate dirette a logging.info() sul logger radice.
+    """
+    def __init__(self, levels: dict):
+        super().__init__()
+        self.levels = {name: logging.getLevelName(level) for name, level in levels.items()}
+
+    def filter(self, record):
+        if not self.levels:
+            return True
+        name = record.name
+        while name:
+            if name in self.levels:
+                return record.levelno >= self.levels[name]
+            name = name.rpartition(".")[0]
+        level = self.levels.get(record.module)
+        return level is None or record.levelno >= level
+
+class RateLimitFilter(logging.Filter):
+    """
+    Limita i messaggi DEBUG/INFO emessi dalla stessa riga di codice a 'per_second'
+    al secondo; gli avvisi e gli errori passano sempre. Alla riapertura della
+    finestra viene segnalato quanti messaggi sono stati scartati.
+    """
+    def __init__(self, per_second: int):
+        super().__init__()
+        self.per_second = per_second
+        self._lock = threading.Lock()
+        self._windows = {}
+
+    def filter(self, record):
+        if not self.per_second or record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= 1.0:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} [{suppressed} messaggi simili soppressi]"
+                return True
+            if window[1] < self.per_second:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+class _LoggerNameFilter(logging.Filter):
+    """Accetta (o esclude, con include=False) i record di un logger specifico."""
+    def __init__(self, name: str, include: bool):
+        super().__init__()
+        self.logger_name, self.include = name, include
+
+    def filter(self, record):
+        return (record.name == self.logger_name) == self.include
 
 def setup_logging():
-    """Configura il sistema di logging per salvare su file e mostrare in console."""
-    
+    """
+    Configura il sistema di logging per salvare su file e mostrare in console.
+    I logger scrivono solo su una coda (QueueHandler): formattazione e scrittura
+    su disco avvengono in un thread dedicato (QueueListener), mai sul thread
+    dell'interfaccia. Livelli e formato si impostano nella sezione [logging] di config.ini.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    settings = config.LOGGING_SETTINGS
+
     # Crea la cartella dei log se non esiste
     if not os.path.exists(LOG_DIR):
         os.makedirs(LOG_DIR)
@@ -19,10 +127,7 @@ def setup_logging():
     log_formatter = logging.Formatter(
         '%(asctime)s - %(levelname)-8s - %(name)-15s - %(message)s'
     )
-
-    # Configura il logger principale (root logger)
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.DEBUG)  # Cattura tutti i messaggi dal livello DEBUG in su
+    main_only = _LoggerNameFilter(SLOW_QUERY_LOGGER, include=False)
 
     # 1. Handler per salvare i log su un file giornaliero
     log_filename = os.path.join(LOG_DIR, f"app_{datetime.now().strftime('%Y-%m-%d')}.log")
@@ -30,15 +135,62 @@ def setup_logging():
         log_filename, maxBytes=5*1024*1024, backupCount=5, encoding='utf-8'
     )
     file_handler.setFormatter(log_formatter)
-    file_handler.setLevel(logging.INFO)  # Salva nel file solo i messaggi da INFO in su
+    file_handler.setLevel(settings["file_level"])  # Di default solo i messaggi da INFO in su
+    file_handler.addFilter(main_only)
 
     # 2. Handler per mostrare i log nella console (utile durante lo sviluppo)
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(log_formatter)
-    console_handler.setLevel(logging.DEBUG) # Mostra tutto in console
+    console_handler.setLevel(settings["console_level"])
+    console_handler.addFilter(main_only)
+    handlers = [file_handler, console_handler]
+    levels = [settings["file_level"], settings["console_level"]]
+
+    # 3. Log strutturato (JSON lines), facoltativo
+    if settings["json"]:
+        json_handler = logging.handlers.RotatingFileHandler(
+            os.path.join(LOG_DIR, f"app_{datetime.now().strftime('%Y-%m-%d')}.jsonl"),
+            maxBytes=10*1024*1024, backupCount=5, encoding='utf-8'
+        )
+        json_handler.setFormatter(JsonLinesFormatter())
+        json_handler.setLevel(settings["json_level"])
+        json_handler.addFilter(main_only)
+        handlers.append(json_handler)
+        levels.append(settings["json_level"])
+
+    # 4. Log dedicato alle query lente (vedi database.QueryStats), fuori dal log principale
+    slow_handler = logging.handlers.RotatingFileHandler(
+        SLOW_QUERY_LOG_FILE, maxBytes=2*1024*1024, backupCount=3, encoding='utf-8'
+    )
+    slow_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    slow_handler.addFilter(_LoggerNameFilter(SLOW_QUERY_LOGGER, include=True))
+    handlers.append(slow_handler)
+
+    # I filtri stanno sul QueueHandler: i record scartati non entrano nemmeno in coda
+    log_queue = queue.SimpleQueue()
+    queue_handler = RecordQueueHandler(log_queue)
+    queue_handler.addFilter(ModuleLevelFilter(settings["module_levels"]))
+    queue_handler.addFilter(RateLimitFilter(settings["rate_limit_per_second"]))
+
+    # Il logger principale scarta subito i messaggi sotto il livello più basso richiesto
+    root_logger = logging.getLogger()
+    root_logger.setLevel(min(logging.getLevelName(level) for level in levels + list(settings["module_levels"].values())))
+    root_logger.addHandler(queue_handler)
+
+    slow_logger = logging.getLogger(SLOW_QUERY_LOGGER)
+    slow_logger.setLevel(logging.WARNING)
+    slow_logger.addHandler(queue_handler)
+    slow_logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
 
-    # Aggiungi gli handler al root logger
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(console_handler)
+    logging.info("Sistema di logging configurato.")
 
-    logging.info("Sistema di logging configurato.")
\ No newline at end of file
+def stop_logging():
+    """Scrive i messaggi ancora in coda e ferma il thread di scrittura."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,14 +1,15 @@
 # app/services.py (Versione completa per la sincronizzazione)
 import logging
 import json
+import gzip
 from datetime import datetime, timezone
 import uuid
-
-import serial
+import threading
+import functools
 
 import database
 from .data_models import AppliedPart
-import report_generator
+from .hardware.reading_capture import ReadingCapture
 import tempfile
 import os
 import sys
@@ -16,19 +17,118 @@ import subprocess
 from PySide6.QtCore import QTimer, QSettings
 from app import auth_manager
 from app import config
+from app import verification_writer
 
 
 
+# ==============================================================================
+# CACHE DEI DATI DI RIFERIMENTO
+# ==============================================================================
+# Clienti, destinazioni e strumenti cambiano di rado ma vengono riletti di continuo
+# dall'interfaccia: i risultati delle letture restano in memoria finché un servizio
+# di scrittura (o la sincronizzazione) non incrementa il contatore di generazione
+# del dominio interessato. Un lettore salva il risultato solo se la generazione non
+# è cambiata mentre interrogava il database, così una lettura concorrente a una
+# scrittura non può mai rimettere in cache dati superati.
+
+CACHE_CUSTOMERS = "customers"
+CACHE_DESTINATIONS = "destinations"
+CACHE_INSTRUMENTS = "instruments"
+REFERENCE_CACHE_DOMAINS = (CACHE_CUSTOMERS, CACHE_DESTINATIONS, CACHE_INSTRUMENTS)
+
+# Tabelle sincronizzabili -> domini della cache che le rispecchiano
+_CACHE_DOMAINS_BY_TABLE = {
+    "customers": (CACHE_CUSTOMERS,),
+    "destinations": (CACHE_DESTINATIONS,),
+    "mti_instruments": (CACHE_INSTRUMENTS,),
+}
+
+class _ReferenceCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generations = {}
+        self._entries = {}
+
+    def _generation(self, domains):
+        return tuple(self._generations.get(d, 0) for d in domains)
+
+    def get(self, domains: tuple, key, loader):
+        with self._lock:
+            generation = self._generation(domains)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation:
+                return entry[1]
+        value = loader()
+        with self._lock:
+            if self._generation(domains) == generation:
+                self._entries[key] = (generation, value, domains)
+        return value
+
+    def invalidate(self, domains):
+        with self._lock:
+            for d in domains:
+                self._generations[d] = self._generations.get(d, 0) + 1
+            self._entries = {k: e for k, e in self._entries.items() if not set(e[2]) & set(domains)}
+
+_reference_cache = _ReferenceCache()
+
+def invalidate_reference_cache(*domains):
+    """Invalida i domini indicati della cache (tutti se non se ne indica nessuno)."""
+    _reference_cache.invalidate(domains or REFERENCE_CACHE_DOMAINS)
+
+def invalidate_reference_cache_for_table(table_name: str):
+    """Invalida la cache dopo una scrittura diretta su una tabella sincronizzabile."""
+    domains = _CACHE_DOMAINS_BY_TABLE.get(table_name)
+    if domains:
+        _reference_cache.invalidate(domains)
+
+def _invalidates(*domains):
+    """Decoratore per i servizi di scrittura: invalida i domini anche se la scrittura fallisce."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _reference_cache.invalidate(domains)
+        return wrapper
+    return decorator
+
+def _cached_rows(domains, key, loader):
+    """Le liste in cache vengono restituite in copia: il chiamante può modificarle liberamente."""
+    return list(_reference_cache.get(domains, key, lambda: tuple(loader())))
+
+def get_all_destinations_with_customer():
+    return _cached_rows((CACHE_CUSTOMERS, CACHE_DESTINATIONS), ("destinations_with_customer",),
+                        database.get_all_destinations_with_customer)
+
+def get_destinations_by_customer() -> dict:
+    """Destinazioni attive raggruppate per customer_id, con una sola lettura (in cache)."""
+    grouped = {}
+    for dest in get_all_destinations_with_customer():
+        grouped.setdefault(dest['customer_id'], []).append(dest)
+    return grouped
+
+def get_destinations_for_customer(customer_id: int):
+    return _cached_rows((CACHE_DESTINATIONS,), ("destinations_for_customer", customer_id),
+                        lambda: database.get_destinations_for_customer(customer_id))
+
+def get_destination_by_id(destination_id: int):
+    return _reference_cache.get((CACHE_DESTINATIONS,), ("destination", destination_id),
+                                lambda: database.get_destination_by_id(destination_id))
+
 # ==============================================================================
 # SERVIZI PER CLIENTI
 # ==============================================================================
 
+@_invalidates(CACHE_DESTINATIONS)
 def add_destination(customer_id, name, address):
     if not name: raise ValueError("Il nome della destinazione non può essere vuoto.")
     timestamp = datetime.now(timezone.utc).isoformat()
     new_uuid = str(uuid.uuid4())
     database.add_destination(new_uuid, customer_id, name, address, timestamp)
 
+@_invalidates(CACHE_DESTINATIONS)
 def delete_destination(dest_id):
     """
     Wrapper di servizio per eliminare una destinazione, solo se non contiene dispositivi.
@@ -43,6 +143,7 @@ def delete_destination(dest_id):
     timestamp = datetime.now(timezone.utc).isoformat()
     database.delete_destination(dest_id, timestamp)
 
+@_invalidates(CACHE_DESTINATIONS)
 def update_destination(dest_id, name, address):
     """
     Wrapper di servizio per aggiornare i dati di una destinazione.
@@ -53,6 +154,7 @@ def update_destination(dest_id, name, address):
     timestamp = datetime.now(timezone.utc).isoformat()
     database.update_destination(dest_id, name, address, timestamp)
 
+@_invalidates(CACHE_CUSTOMERS)
 def add_customer(name: str, address: str, phone: str, email: str):
     """Crea i dati di sync e aggiunge un cliente."""
     if not name:
@@ -61,6 +163,7 @@ def add_customer(name: str, address: str, phone: str, email: str):
     timestamp = datetime.now(timezone.utc)
     database.add_customer(new_uuid, name, address, phone, email, timestamp)
 
+@_invalidates(CACHE_CUSTOMERS)
 def update_customer(cust_id: int, name: str, address: str, phone: str, email: str):
     """Crea il timestamp e aggiorna un cliente."""
     if not name:
@@ -68,6 +171,7 @@ def update_customer(cust_id: int, name: str, address: str, phone: str, email: st
     timestamp = datetime.now(timezone.utc)
     database.update_customer(cust_id, name, address, phone, email, timestamp)
 
+@_invalidates(CACHE_CUSTOMERS)
 def delete_customer(cust_id: int) -> tuple[bool, str]:
     """Crea il timestamp ed esegue un soft delete."""
     timestamp = datetime.now(timezone.utc)
@@ -75,10 +179,19 @@ def delete_customer(cust_id: int) -> tuple[bool, str]:
 
 # --- Wrapper di lettura per coerenza architetturale ---
 def get_all_customers(search_query=None):
-    return database.get_all_customers(search_query)
+    if search_query:
+        return database.get_all_customers(search_query)
+    return _cached_rows((CACHE_CUSTOMERS,), ("customers",), database.get_all_customers)
+
+def get_customers_page(search_query=None, sort_key="name", descending=False, after=None, limit=database.MANAGER_PAGE_SIZE):
+    return database.get_customers_page(search_query, sort_key, descending, after, limit)
+
+def get_devices_page(destination_id=None, customer_id=None, search_query=None, sort_key=None, descending=False, after=None, limit=database.MANAGER_PAGE_SIZE):
+    return database.get_devices_page(destination_id, customer_id, search_query, sort_key, descending, after, limit)
 
 def get_customer_by_id(customer_id):
-    return database.get_customer_by_id(customer_id)
+    return _reference_cache.get((CACHE_CUSTOMERS,), ("customer", customer_id),
+                                lambda: database.get_customer_by_id(customer_id))
 
 def get_device_count_for_customer(customer_id):
     return database.get_device_count_for_customer(customer_id)
@@ -182,19 +295,34 @@ def get_destination_devices_for_export(destination_id: int):
         
     return export_data
 
+def iter_destination_devices_for_export(destination_id: int):
+    """Versione in streaming di get_destination_devices_for_export (una riga alla volta)."""
+    for row in database.iter_devices_with_last_verification_for_destination(destination_id):
+        row_dict = dict(row)
+        if not row_dict.get("ESITO"):
+            row_dict["ESITO"] = "VERIFICA NON ESEGUITA"
+        yield row_dict
+
 # --- Wrapper di lettura ---
 def get_devices_for_customer(customer_id, search_query=None):
     return database.get_devices_for_customer(customer_id, search_query)
 
+def get_devices_for_destination(destination_id, search_query=None):
+    return database.get_devices_for_destination(destination_id, search_query)
+
 def get_device_by_id(device_id):
     return database.get_device_by_id(device_id)
     
 def search_device_globally(search_term):
     return database.search_device_globally(search_term)
 
-def get_devices_needing_verification(days_in_future=30):
-    """Wrapper di servizio per recuperare i dispositivi in scadenza."""
-    return database.get_devices_needing_verification(days_in_future)
+def get_devices_needing_verification(days_in_future=30, customer_id=None, limit=None, offset=0):
+    """Wrapper di servizio per recuperare i dispositivi in scadenza (eventualmente a pagine)."""
+    return database.get_devices_needing_verification(days_in_future, customer_id, limit, offset)
+
+def get_due_verification_summary_by_customer(days_in_future=30):
+    """Wrapper di servizio: scadenze raggruppate per cliente."""
+    return database.get_due_verification_summary_by_customer(days_in_future)
 
 # ==============================================================================
 # SERVIZI PER VERIFICHE E REPORT
@@ -202,13 +330,20 @@ def get_devices_needing_verification(days_in_future=30):
 
 def finalizza_e_salva_verifica(device_id, profile_name, results,
                                visual_inspection_data, mti_info,
-                               technician_name, technician_username) -> tuple[str, int]:
+                               technician_name, technician_username,
+                               captures: dict = None) -> tuple[str, int]:
+    """
+    captures: opzionale, {indice_risultato: ReadingCapture} con le serie complete
+    delle letture MREAD, salvate a parte rispetto a results_json.
+    """
     overall_status = "PASSATO" if all(r.get('passed', False) for r in results) else "FALLITO"
     new_uuid = str(uuid.uuid4())
     timestamp = datetime.now(timezone.utc)
 
-    # Salva nel DB locale (save_verification genererà il codice se non passato)
-    verification_code, new_id = database.save_verification(
+    # Salva nel DB locale passando dallo scrittore serializzato: con più postazioni
+    # attive i salvataggi vengono eseguiti uno alla volta (save_verification
+    # genererà il codice se non passato)
+    verification_code, new_id = verification_writer.get_writer().save(
         uuid=new_uuid,
         device_id=device_id,
         profile_name=profile_name,
@@ -219,12 +354,36 @@ def finalizza_e_salva_verifica(device_id, profile_name, results,
         technician_name=technician_name,
         technician_username=technician_username,
         timestamp=timestamp.isoformat(),
-        verification_code=None  # None => lo genera database.save_verification
+        verification_code=None,  # None => lo genera database.save_verification
+        captures=_serialize_captures(captures, results)
     )
 
     logging.info(f"Verifica creata: id={new_id}, code={verification_code}")
     return verification_code, new_id
 
+def _serialize_captures(captures, results):
+    if not captures:
+        return None
+    return [{
+        "result_index": idx,
+        "test_name": results[idx].get('name') if idx < len(results) else None,
+        "sample_count": len(capture),
+        "started_at": capture.started_at,
+        "data": capture.to_blob(),
+    } for idx, capture in sorted(captures.items()) if capture is not None and len(capture)]
+
+def get_verification_captures(verification_id: int) -> list:
+    """Metadati delle catture di una verifica; i dati si caricano con load_reading_capture."""
+    return [dict(r) for r in database.get_verification_captures_index(verification_id)]
+
+def load_reading_capture(capture_id: int):
+    """Carica e decodifica (lazy) una singola cattura di letture."""
+    stored = database.get_verification_capture_data(capture_id)
+    if not stored:
+        return None
+    started_at, blob = stored
+    return ReadingCapture.from_blob(blob, started_at)
+
 def delete_verification(verification_id: int):
     """Crea il timestamp ed esegue un soft delete della verifica."""
     timestamp = datetime.now(timezone.utc)
@@ -247,14 +406,14 @@ def generate_pdf_report(filename, verification_id, device_id, report_settings):
     if not destination_id:
         raise ValueError(f"Il dispositivo ID {device_id} non è associato a nessuna destinazione.")
     
-    destination_info_row = database.get_destination_by_id(destination_id)
+    destination_info_row = get_destination_by_id(destination_id)
     if not destination_info_row:
         raise ValueError(f"Destinazione ID {destination_id} non trovata.")
     destination_info = dict(destination_info_row)
     
     # 3. Dalle info della destinazione, trova il cliente
     customer_id = destination_info.get('customer_id')
-    customer_info_row = database.get_customer_by_id(customer_id)
+    customer_info_row = get_customer_by_id(customer_id)
     if not customer_info_row:
         raise ValueError(f"Cliente ID {customer_id} non trovato.")
     customer_info = dict(customer_info_row)
@@ -270,10 +429,9 @@ def generate_pdf_report(filename, verification_id, device_id, report_settings):
     technician_name = verification['technician_name'] or "N/D"
     technician_username = verification.get('technician_username')
     
-    print(f"--- DEBUG (Generazione Report): Username recuperato dalla verifica: '{technician_username}'")
     signature_data = database.get_signature_by_username(technician_username)
-    print(f"--- DEBUG (Generazione Report): Dati firma trovati nel DB locale? {'Sì, ' + str(len(signature_data)) + ' bytes' if signature_data else 'No'}")
-    # --- FINE BLOCCO DI DEBUG ---
+    logging.debug("Generazione report: tecnico '%s', firma nel DB locale: %s",
+                  technician_username, f"{len(signature_data)} bytes" if signature_data else "assente")
     
     mti_info = {
         "instrument": verification.get('mti_instrument', ''),
@@ -282,11 +440,8 @@ def generate_pdf_report(filename, verification_id, device_id, report_settings):
         "cal_date": verification.get('mti_cal_date', '')
     }
     
-    # --> INSERISCI QUESTE RIGHE DI DEBUG QUI <--
-    print("--- DEBUG REPORT ---")
-    print(f"Dati letti dal DB (verification): {verification}")
-    print(f"Dati preparati per il report (mti_info): {mti_info}")
-    print("--------------------")
+    # Argomenti passati a parte: il dizionario della verifica viene formattato solo se il DEBUG è attivo
+    logging.debug("Generazione report: verifica letta dal DB %s, mti_info %s", verification, mti_info)
     
     results_data = verification.get('results') or []
     visual_data = verification.get('visual_inspection') or {}
@@ -297,6 +452,7 @@ def generate_pdf_report(filename, verification_id, device_id, report_settings):
         'visual_inspection_data': visual_data, 'verification_code': verification.get('verification_code', 'N/A')
     }
     
+    import report_generator  # reportlab viene caricato solo alla prima stampa
     report_generator.create_report(
         filename, 
         device_info, 
@@ -368,18 +524,179 @@ def process_device_import_row(row_data: dict, mapping: dict, destination_id: int
         default_profile_key=profile_key
     )
 
+def import_devices_dataframe(df, mapping: dict, destination_id: int, serial_index: dict = None):
+    """
+    Importazione massiva vettorializzata di un DataFrame (tutte colonne str).
+    Normalizza e valida le righe con pandas, risolve i duplicati contro
+    l'indice delle matricole precaricato (aggiornato in place, così può essere
+    riusato tra lotti successivi) e scrive tutto in una sola transazione.
+    Le etichette di riga usano l'indice del DataFrame + 2 (intestazione inclusa).
+    Restituisce (aggiunti, [dettagli righe scartate]).
+    """
+    import pandas as pd
+
+    if df.empty:
+        return 0, []
+    if serial_index is None:
+        serial_index = database.get_active_serials_index()
+
+    def column(key):
+        col_name = mapping.get(key)
+        if col_name and col_name in df.columns:
+            return df[col_name].fillna('').astype(str).str.strip()
+        return pd.Series('', index=df.index, dtype=object)
+
+    serials = column('matricola').str.upper()
+    serials = serials.where(~(serials.isin(config.PLACEHOLDER_SERIALS) | (serials == '')), None)
+    descriptions = column('descrizione')
+    raw_intervals = column('verification_interval')
+    no_interval = raw_intervals.isin(['', 'Nessuno'])
+    # Solo mesi interi, come int() nella vecchia importazione riga per riga: "12.5" o "abc" sono errori
+    integer_interval = raw_intervals.str.fullmatch(r'[+-]?\d+')
+    intervals = pd.to_numeric(raw_intervals.where(integer_interval), errors='coerce')
+    if mapping.get('profilo'):
+        profiles = column('profilo').replace('', "IEC 62353 Metodo Diretto - Classe 1")
+    else:
+        profiles = pd.Series(None, index=df.index, dtype=object)
+
+    errors = pd.Series('', index=df.index, dtype=object)
+    errors[descriptions == ''] = "Descrizione mancante."
+    bad_interval = (errors == '') & ~no_interval & ~integer_interval
+    errors[bad_interval] = "Intervallo di verifica non valido: '" + raw_intervals[bad_interval] + "' (indicare un numero intero di mesi)."
+
+    # Matricole già attive nel database o ripetute nel file (vale la prima occorrenza)
+    index_state = serials.map(lambda sn: serial_index.get(sn, (None, None))[1] if sn else None)
+    in_use = (errors == '') & serials.notna() & (index_state == 0)
+    duplicated_in_file = (errors == '') & serials.notna() & serials.where(errors == '').duplicated(keep='first')
+    taken = in_use | duplicated_in_file
+    errors[taken] = "Il numero di serie '" + serials[taken] + "' è già utilizzato da un altro dispositivo attivo."
+
+    valid = errors == ''
+    to_reactivate = valid & serials.notna() & (index_state == 1)
+
+    timestamp = datetime.now(timezone.utc).isoformat()
+    frame = pd.DataFrame({
+        'serial': serials, 'desc': descriptions, 'mfg': column('costruttore'), 'model': column('modello'),
+        'department': column('reparto'), 'customer_inv': column('inv_cliente'), 'ams_inv': column('inv_ams'),
+        'interval': intervals.astype(object).where(intervals.notna(), None), 'profile': profiles,
+    })
+
+    def records(mask, with_id=False):
+        out = []
+        for row_idx, r in zip(frame.index[mask], frame[mask].itertuples(index=False)):
+            serial = r.serial if isinstance(r.serial, str) else None
+            profile = r.profile if isinstance(r.profile, str) else None
+            interval = int(r.interval) if r.interval is not None and not pd.isna(r.interval) else None
+            record = (row_idx, str(uuid.uuid4()), destination_id, serial, r.desc, r.mfg, r.model, r.department,
+                      r.customer_inv, r.ams_inv, interval, profile, timestamp)
+            if with_id:
+                record += (serial_index[serial][0],)
+            out.append(record)
+        return out
+
+    new_devices = records(valid & ~to_reactivate)
+    reactivations = records(to_reactivate, with_id=True)
+    if reactivations:
+        logging.warning(f"Importazione: {len(reactivations)} dispositivi eliminati verranno riattivati.")
+
+    failures = dict(database.bulk_import_devices(new_devices, reactivations))
+    for msg_idx, msg in failures.items():
+        errors[msg_idx] = msg
+    # Le matricole appena scritte diventano "in uso" per i lotti successivi
+    for record in new_devices:
+        if record[3] and record[0] not in failures:
+            serial_index[record[3]] = (None, 0)
+    for record in reactivations:
+        if record[0] not in failures:
+            serial_index[record[3]] = (record[-1], 0)
+
+    skipped = [f"Riga {idx + 2}: {msg}" for idx, msg in errors[errors != ''].items()]
+    added = len(new_devices) + len(reactivations) - len(failures)
+    return added, skipped
+
 def get_data_for_daily_export(target_date: str) -> dict:
     """Prepara i dati per l'esportazione giornaliera in formato .stm."""
     return database.get_full_verification_data_for_date(target_date)
 
+def iter_stm_packages(fileobj):
+    """
+    Itera sui pacchetti 'verifications' di un archivio .stm (file aperto in binario).
+    Legge in streaming con ijson (dipendenza richiesta: pip install ijson); se il
+    modulo manca ripiega su json.load, con un avviso nel log.
+    """
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+    if ijson is not None:
+        # use_float=True: i valori numerici restano float/int anziché Decimal
+        yield from ijson.items(fileobj, 'verifications.item', use_float=True)
+        return
+    logging.warning("Modulo ijson non installato (pip install ijson): l'archivio .stm viene caricato "
+                    "interamente in memoria anziché in streaming.")
+    data = json.load(fileobj)
+    yield from data.get("verifications", [])
+
+def write_stm_export(output_path: str, start_date: str, end_date: str,
+                     format_version: str = database.STM_FORMAT_V2, compress: bool = False,
+                     compact: bool = True, progress_callback=None) -> int:
+    """
+    Scrive un archivio .stm per l'intervallo di date indicato, in streaming:
+    ogni pacchetto viene serializzato e scritto appena letto dal cursore, senza
+    costruire l'intero archivio in memoria. Con compress=True il file è gzip.
+    Restituisce il numero di verifiche esportate; in caso di errore il file
+    parziale viene eliminato.
+    """
+    dumps_kwargs = {"separators": (',', ':')} if compact else {"indent": 1}
+    header = {"export_format_version": format_version, "export_creation_date": datetime.now().isoformat(),
+              "verifications_from_date": start_date, "verifications_to_date": end_date}
+    if start_date == end_date:
+        header["verifications_for_date"] = start_date
+    total = database.count_verifications_for_export(start_date, end_date) if progress_callback else 0
+    opener = gzip.open if compress else open
+    count = 0
+    try:
+        with opener(output_path, 'wt', encoding='utf-8') as f:
+            # L'intestazione viene chiusa a mano per poter accodare i pacchetti uno alla volta
+            f.write(json.dumps(header, ensure_ascii=False, **dumps_kwargs)[:-1])
+            f.write(',"verifications":[')
+            for package in database.iter_verifications_for_export(start_date, end_date, format_version):
+                if count:
+                    f.write(',')
+                f.write(json.dumps(package, ensure_ascii=False, **dumps_kwargs))
+                count += 1
+                if progress_callback and count % 200 == 0:
+                    progress_callback(count, total)
+            f.write(']}')
+    except BaseException:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    if progress_callback:
+        progress_callback(count, total)
+    return count
+
+def _open_stm_archive(filepath: str):
+    """Apre un archivio .stm in binario, decomprimendolo se è in formato gzip."""
+    with open(filepath, 'rb') as probe:
+        is_gzip = probe.read(2) == b'\x1f\x8b'
+    return gzip.open(filepath, 'rb') if is_gzip else open(filepath, 'rb')
+
+@_invalidates(CACHE_CUSTOMERS, CACHE_DESTINATIONS)
+def import_stm_archive(filepath: str) -> dict:
+    """Importa un archivio .stm in un'unica transazione e restituisce i conteggi."""
+    with _open_stm_archive(filepath) as f:
+        return database.import_stm_packages(iter_stm_packages(f), config.PLACEHOLDER_SERIALS)
+
 
 # ==============================================================================
 # SERVIZI PER STRUMENTI E IMPOSTAZIONI
 # ==============================================================================
 
 def get_all_instruments():
-    return database.get_all_instruments()
+    return _cached_rows((CACHE_INSTRUMENTS,), ("instruments",), database.get_all_instruments)
 
+@_invalidates(CACHE_INSTRUMENTS)
 def add_instrument(instrument_name, serial_number, fw_version, calibration_date):
     if not instrument_name or not serial_number:
         raise ValueError("Nome e Seriale dello strumento sono obbligatori.")
@@ -387,6 +704,7 @@ def add_instrument(instrument_name, serial_number, fw_version, calibration_date)
     timestamp = datetime.now(timezone.utc)
     database.add_instrument(new_uuid, instrument_name, serial_number, fw_version, calibration_date, com_port=None, timestamp=timestamp)
 
+@_invalidates(CACHE_INSTRUMENTS)
 def update_instrument(inst_id, instrument_name, serial_number, fw_version, calibration_date, timestamp=None):
     if not instrument_name or not serial_number:
         raise ValueError("Nome e Seriale dello strumento sono obbligatori.")
@@ -394,10 +712,12 @@ def update_instrument(inst_id, instrument_name, serial_number, fw_version, calib
         timestamp = datetime.now(timezone.utc)
     database.update_instrument(inst_id, instrument_name, serial_number, fw_version, calibration_date, com_port=None, timestamp=timestamp)
 
+@_invalidates(CACHE_INSTRUMENTS)
 def delete_instrument(inst_id: int):
     timestamp = datetime.now(timezone.utc)
     database.soft_delete_instrument(inst_id, timestamp)
 
+@_invalidates(CACHE_INSTRUMENTS)
 def set_default_instrument(inst_id: int):
     timestamp = datetime.now(timezone.utc)
     database.set_default_instrument(inst_id, timestamp)
@@ -405,6 +725,34 @@ def set_default_instrument(inst_id: int):
 def get_stats():
     return database.get_stats()
 
+def get_dashboard_summary(days_in_future=30) -> dict:
+    """Totali, esiti e scadenze per cliente per il pannello di controllo, in una sola lettura."""
+    return database.get_dashboard_summary(days_in_future)
+
+def analyze_fleet_drift(customer_id: int = None, limit: int = None) -> list:
+    """Serie di misure ordinate per rischio di superare i limiti (tendenza, margine, z-score)."""
+    from app import analytics  # NumPy viene caricato solo alla prima analisi
+    return analytics.analyze_fleet(customer_id=customer_id, limit=limit)
+
+def export_fleet_drift(output_path: str, customer_id: int = None) -> int:
+    """Esporta in Excel o CSV l'analisi completa del parco; restituisce le righe scritte."""
+    from app import analytics
+    return analytics.export_drift_report(analytics.analyze_fleet(customer_id=customer_id), output_path)
+
+def get_query_stats(top_n: int = 20, sort_key: str = "total_time") -> list:
+    """Le query più costose dall'avvio, per la finestra di diagnostica."""
+    return database.query_stats.top(top_n, sort_key)
+
+def get_query_stats_start():
+    return database.query_stats.started_at
+
+def reset_query_stats():
+    database.query_stats.reset()
+
+def get_sync_history(limit: int = 50) -> list:
+    """Ultime sincronizzazioni con i tempi di ogni fase, per la finestra dello storico."""
+    return database.get_sync_history(limit)
+
 def resolve_conflict_keep_local(table_name: str, uuid: str):
     """
     Forza la versione locale ad essere più recente per vincere il prossimo sync.
@@ -420,6 +768,7 @@ def resolve_conflict_use_server(table_name: str, server_version: dict):
     uuid = server_version.get('uuid')
     logging.warning(f"Risoluzione conflitto per {table_name} UUID {uuid}: accettazione versione server.")
     database.overwrite_local_record(table_name, server_version)
+    invalidate_reference_cache_for_table(table_name)
 
 def force_full_push():
     import database
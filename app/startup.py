@@ -0,0 +1,139 @@
+# app/startup.py
+"""
+Pipeline di avvio: splash screen, backup e migrazioni in background e
+misurazione dei tempi di avvio. I tempi di ogni avvio vengono accodati in
+STARTUP_BENCHMARK_FILE (una riga JSON per avvio), così da poterli confrontare
+tra una versione e l'altra.
+
+Eseguito come script (python -m app.startup) misura invece i tempi di import
+dei moduli dell'applicazione con -X importtime e li raggruppa per pacchetto.
+"""
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from app import config
+
+STARTUP_BENCHMARK_FILE = os.path.join(config.APP_DATA_DIR, "startup_benchmark.jsonl")
+
+# Moduli importati all'avvio fino alla finestra principale
+STARTUP_MODULES = ["app.ui.dialogs.login_dialog", "app.ui.main_window"]
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+def run_startup_tasks(app):
+    """
+    Mostra lo splash screen ed esegue backup e migrazioni in un QThread,
+    attendendo la fine con un ciclo di eventi locale. Restituisce (tempi delle
+    fasi, splash screen), che il chiamante chiude quando la finestra è pronta.
+    Se le migrazioni falliscono l'applicazione mostra l'errore e termina: il resto
+    del codice (trigger, tabelle derivate) presuppone lo schema aggiornato.
+    """
+    from PySide6.QtCore import Qt, QThread, QEventLoop
+    from PySide6.QtGui import QPixmap, QColor
+    from PySide6.QtWidgets import QSplashScreen, QMessageBox
+    from app.workers.startup_worker import StartupWorker
+
+    pixmap = QPixmap(os.path.join(config.BASE_DIR, "logo.png"))
+    if pixmap.isNull():
+        pixmap = QPixmap(420, 180)
+        pixmap.fill(QColor("#37474F"))
+    else:
+        pixmap = pixmap.scaled(420, 420, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    splash = QSplashScreen(pixmap)
+    splash.show()
+
+    def show_message(text):
+        splash.showMessage(f"Safety Test Manager {config.VERSIONE}\n{text}", Qt.AlignBottom | Qt.AlignHCenter, QColor("white"))
+
+    show_message("Avvio in corso...")
+    app.processEvents()
+
+    timings, errors = {}, []
+    loop = QEventLoop()
+    thread = QThread()
+    worker = StartupWorker()
+    worker.moveToThread(thread)
+    thread.started.connect(worker.run)
+    worker.progress.connect(show_message)
+    worker.finished.connect(timings.update)
+    worker.finished.connect(thread.quit)
+    worker.error.connect(errors.append)
+    worker.error.connect(thread.quit)
+    thread.finished.connect(loop.quit)
+    thread.start()
+    loop.exec()
+    thread.wait()
+
+    if errors:
+        splash.close()
+        QMessageBox.critical(None, "Errore Critico",
+                             f"Impossibile aggiornare il database all'avvio:\n{errors[0]}\n\n"
+                             f"L'applicazione verrà chiusa. I backup del database si trovano in:\n{config.BACKUP_DIR}")
+        sys.exit(1)
+
+    show_message("Caricamento interfaccia...")
+    app.processEvents()
+    return timings, splash
+
+def record_startup_timings(timings: dict):
+    """Accoda i tempi di un avvio al file del benchmark di avvio."""
+    entry = {"date": datetime.now().isoformat(timespec="seconds"), "version": config.VERSIONE,
+             **{k: round(v, 4) for k, v in timings.items()}}
+    try:
+        with open(STARTUP_BENCHMARK_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError:
+        logging.warning("Impossibile salvare i tempi di avvio.", exc_info=True)
+    logging.info("Tempi di avvio: " + ", ".join(f"{k}={v:.3f}s" for k, v in timings.items()))
+
+def import_time_breakdown(modules=None, env=None) -> dict:
+    """
+    Importa i moduli in un interprete separato con -X importtime e restituisce
+    il tempo totale e quello di ogni pacchetto di primo livello (secondi), sommando
+    il tempo proprio di tutti i suoi moduli: pandas, reportlab, PySide6, app...
+    """
+    modules = modules or STARTUP_MODULES
+    env = dict(env or os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    code = "; ".join(f"import {m}" for m in modules)
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=config.BASE_DIR,
+                          env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"Import dei moduli fallito:\n{proc.stderr[-2000:]}")
+
+    packages = {}
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME_LINE.match(line)
+        if not m:
+            continue
+        top = m.group(3).split(".")[0]
+        packages[top] = packages.get(top, 0) + int(m.group(1)) / 1_000_000
+    return {"wall_time": wall, "import_time": sum(packages.values()),
+            "packages": dict(sorted(packages.items(), key=lambda kv: kv[1], reverse=True))}
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Misura i tempi di import dei moduli di avvio.")
+    parser.add_argument("modules", nargs="*", help=f"moduli da importare (predefiniti: {', '.join(STARTUP_MODULES)})")
+    parser.add_argument("--top", type=int, default=20, help="numero di pacchetti da mostrare")
+    parser.add_argument("--no-record", action="store_true", help="non salvare il risultato nel file del benchmark")
+    args = parser.parse_args()
+
+    result = import_time_breakdown(args.modules or None)
+    print(f"Tempo totale di import: {result['import_time']:.3f}s (processo: {result['wall_time']:.3f}s)")
+    for name, seconds in list(result["packages"].items())[:args.top]:
+        print(f"  {name:<30} {seconds * 1000:9.1f} ms")
+    if not args.no_record:
+        record_startup_timings({"import_time": result["import_time"],
+                                **{f"import.{k}": v for k, v in list(result["packages"].items())[:args.top]}})
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,61 @@
 import requests
 import json
 import logging
+import time
+from contextlib import contextmanager
 from datetime import datetime, timezone, date
 import database
 import sqlite3
 import base64
 
-from app import auth_manager, config
+from app import api_client, auth_manager, services
 
 SYNC_ORDER = ["customers", "mti_instruments", "signatures", "profiles", "profile_tests", "destinations", "devices", "verifications"]
 
+# Blocchi di verification_code riservati dal server: dimensione di ogni blocco e
+# soglia di numeri residui sotto la quale ne viene richiesto uno nuovo.
+CODE_BLOCK_SIZE = 200
+CODE_BLOCK_LOW_WATERMARK = 50
+
+class SyncProfiler:
+    """
+    Raccoglie i tempi delle fasi di una sincronizzazione (raccolta delle modifiche
+    locali, codifica JSON, rete, decodifica, applicazione...), le righe inviate e
+    ricevute per tabella e i byte trasferiti. Al termine il risultato viene salvato
+    in sync_history insieme ai tempi restituiti dal server.
+    """
+    def __init__(self, full_sync=False):
+        self.full_sync = full_sync
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self._start = time.perf_counter()
+        self.phases = {}
+        self.pushed = {}
+        self.pulled = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.server_phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def as_entry(self, status, error=None) -> dict:
+        return {"started_at": self.started_at, "duration": time.perf_counter() - self._start,
+                "status": status, "full_sync": self.full_sync, "error": error,
+                "bytes_sent": self.bytes_sent, "bytes_received": self.bytes_received,
+                "pushed": self.pushed, "pulled": self.pulled,
+                "phases": {k: round(v, 4) for k, v in self.phases.items()},
+                "server_phases": self.server_phases}
+
+    def summary(self) -> str:
+        phases = ", ".join(f"{k}={v:.3f}s" for k, v in self.phases.items())
+        return (f"{phases}; inviati {sum(self.pushed.values())} record ({self.bytes_sent / 1024:.1f} KB), "
+                f"ricevuti {sum(self.pulled.values())} record ({self.bytes_received / 1024:.1f} KB)")
+
 def _jsonify_value(v):
     # datetime/date → ISO 8601
     if isinstance(v, (datetime, date)):
@@ -190,6 +236,9 @@ def _apply_server_changes(conn, changes):
             cursor.executemany(query, params)
             applied_counts[table] += cursor.rowcount
 
+        if table == 'verifications':
+            database.refresh_verification_measurements(conn, [r['uuid'] for r in records_to_insert + records_to_update])
+
     logging.info(f"Modifiche batch dal server applicate: {json.dumps(applied_counts)}")
     return applied_counts
 
@@ -221,33 +270,74 @@ def _handle_uuid_maps(conn, uuid_map: dict):
             continue
 
 def run_sync(full_sync=False):
+    """
+    Esegue una sincronizzazione e ne registra i tempi di ogni fase in sync_history.
+    Restituisce (stato, messaggio o conflitti) come _run_sync.
+    """
+    profiler = SyncProfiler(full_sync)
+    status, result = "error", None
+    try:
+        status, result = _run_sync(profiler, full_sync)
+        return status, result
+    except Exception as e:
+        result = str(e)
+        raise
+    finally:
+        entry = profiler.as_entry(status, result if status == "error" else None)
+        logging.info(f"Sincronizzazione '{status}' in {entry['duration']:.2f}s: {profiler.summary()}")
+        if profiler.server_phases:
+            logging.info(f"Tempi lato server: {json.dumps(profiler.server_phases.get('phases', {}))}")
+        try:
+            database.record_sync_history(entry)
+        except Exception:
+            logging.warning("Impossibile registrare la sincronizzazione nello storico.", exc_info=True)
+
+def _run_sync(profiler, full_sync=False):
     if full_sync:
         try:
-            database.wipe_all_syncable_data()
-            auth_manager.update_session_timestamp(None)
+            with profiler.phase("wipe"):
+                database.wipe_all_syncable_data()
+                services.invalidate_reference_cache()
+                auth_manager.update_session_timestamp(None)
         except Exception as e:
             return "error", "Impossibile resettare il database locale. Operazione annullata."
     
     logging.info(f"Avvio processo di sincronizzazione (Full Sync: {full_sync})...")
     last_sync = auth_manager.get_current_user_info().get('last_sync_timestamp')
-    local_changes = _get_unsynced_local_changes()
-    for table, rows in list(local_changes.items()):
-        if not rows:
-            continue
-    # assicurati che ogni row sia un dict (se è sqlite3.Row convertila prima)
-        norm_rows = []
-        for r in rows:
-            rd = dict(r) if not isinstance(r, dict) else r
-            norm_rows.append(_jsonify_record(rd))
-        local_changes[table] = norm_rows
+    with profiler.phase("collect_local"):
+        local_changes = _get_unsynced_local_changes()
+    with profiler.phase("jsonify"):
+        for table, rows in list(local_changes.items()):
+            profiler.pushed[table] = len(rows)
+            if not rows:
+                continue
+        # assicurati che ogni row sia un dict (se è sqlite3.Row convertila prima)
+            norm_rows = []
+            for r in rows:
+                rd = dict(r) if not isinstance(r, dict) else r
+                norm_rows.append(_jsonify_record(rd))
+            local_changes[table] = norm_rows
     payload = {"last_sync_timestamp": last_sync, "changes": local_changes}
+    user_info = auth_manager.get_current_user_info()
+    code_prefix = database.verification_code_prefix(user_info.get('full_name'), user_info.get('username'))
+    code_block_request = database.get_code_block_request(code_prefix, CODE_BLOCK_SIZE, CODE_BLOCK_LOW_WATERMARK)
+    if code_block_request:
+        payload["code_block_request"] = code_block_request
 
     try:
-        headers = auth_manager.get_auth_headers()
-        sync_url = f"{config.SERVER_URL}/sync"
-        response = requests.post(sync_url, json=payload, timeout=60, headers=headers)
-        response.raise_for_status()
-        server_response = response.json()
+        # Il corpo viene codificato (e compresso) qui per misurarne tempo e dimensione
+        with profiler.phase("encode"):
+            body, headers = api_client.encode_json(payload)
+        profiler.bytes_sent = len(body)
+        with profiler.phase("network"):
+            response = api_client.post("/sync", data=body, headers=headers)
+            response.raise_for_status()
+            content = response.content
+        # Byte ricevuti in rete (risposta compressa), se il server ne indica la dimensione
+        profiler.bytes_received = int(response.headers.get("Content-Length") or len(content))
+        with profiler.phase("decode"):
+            server_response = json.loads(content)
+        profiler.server_phases = server_response.get("timings") or {}
         
         status = server_response.get("status")
         if status == "conflict":
@@ -255,12 +345,20 @@ def run_sync(full_sync=False):
         if status != "success":
             raise Exception(f"Il server ha risposto con un errore: {server_response.get('message')}")
         
+        changes_from_server = server_response.get("changes", {})
+        profiler.pulled = {table: len(rows) for table, rows in changes_from_server.items()}
         with database.DatabaseConnection() as conn:
             uuid_map = server_response.get("uuid_map", {})
-            if uuid_map: _handle_uuid_maps(conn, uuid_map)
-            changes_from_server = server_response.get("changes", {})
-            applied_counts = _apply_server_changes(conn, changes_from_server)
-            _mark_pushed_changes_as_synced(conn)
+            if uuid_map:
+                with profiler.phase("uuid_map"):
+                    _handle_uuid_maps(conn, uuid_map)
+            with profiler.phase("apply"):
+                applied_counts = _apply_server_changes(conn, changes_from_server)
+            with profiler.phase("mark_synced"):
+                _mark_pushed_changes_as_synced(conn)
+                database.store_code_blocks(conn, server_response.get("code_blocks"))
+        # I dati di riferimento ricevuti dal server sostituiscono quelli in cache
+        services.invalidate_reference_cache()
         
         auth_manager.update_session_timestamp(server_response.get("new_sync_timestamp"))
         summary = [f"{count} {table}" for table, count in applied_counts.items() if count > 0]
@@ -269,7 +367,7 @@ def run_sync(full_sync=False):
         return "success", "Sincronizzazione completata. Dati aggiornati:\n- " + "\n- ".join(summary)
     
     except requests.RequestException as e:
-        if e.response and e.response.status_code == 401:
+        if e.response is not None and e.response.status_code == 401:
              return "error", "Errore di autenticazione (401). La sessione potrebbe essere scaduta. Prova a riavviare."
         return "error", str(f"Impossibile connettersi al server.\nControllare la connessione e l'indirizzo nel file config.ini.")
     except Exception as e:
@@ -74,7 +74,7 @@ class DeviceDialog(QDialog):
                 self.profile_combo.setCurrentIndex(index)
 
         self.destination_combo = QComboBox()
-        destinations = services.database.get_destinations_for_customer(self.customer_id)
+        destinations = services.get_destinations_for_customer(self.customer_id)
         for dest in destinations:
             self.destination_combo.addItem(dest['name'], dest['id'])
     
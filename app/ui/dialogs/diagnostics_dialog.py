@@ -0,0 +1,84 @@
+from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QTableWidget,
+                               QTableWidgetItem, QAbstractItemView, QHeaderView,
+                               QPushButton, QSpinBox, QComboBox)
+from PySide6.QtCore import Qt
+from app import services, config
+from app.logging_config import SLOW_QUERY_LOG_FILE
+
+class DiagnosticsDialog(QDialog):
+    """
+    Mostra le query del database più costose dall'avvio (o dall'ultimo azzeramento),
+    aggregate per funzione chiamante e testo SQL.
+    """
+    COLUMNS = ["Funzione", "Esecuzioni", "Totale (ms)", "Medio (ms)", "Max (ms)", "Righe", "Lente", "Query"]
+    SORT_KEYS = [("Tempo totale", "total_time"), ("Tempo massimo", "max_time"), ("Esecuzioni", "count"), ("Righe", "rows")]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Diagnostica Database")
+        self.setMinimumSize(1000, 500)
+
+        layout = QVBoxLayout(self)
+        self.info_label = QLabel()
+        self.info_label.setWordWrap(True)
+        layout.addWidget(self.info_label)
+
+        controls = QHBoxLayout()
+        controls.addWidget(QLabel("Ordina per:"))
+        self.sort_combo = QComboBox()
+        for label, key in self.SORT_KEYS: self.sort_combo.addItem(label, key)
+        controls.addWidget(self.sort_combo)
+        controls.addWidget(QLabel("Mostra:"))
+        self.top_spin = QSpinBox(); self.top_spin.setRange(5, 500); self.top_spin.setValue(30)
+        controls.addWidget(self.top_spin)
+        controls.addStretch()
+        self.refresh_btn = QPushButton("Aggiorna")
+        self.reset_btn = QPushButton("Azzera Statistiche")
+        close_btn = QPushButton("Chiudi")
+        controls.addWidget(self.refresh_btn); controls.addWidget(self.reset_btn); controls.addWidget(close_btn)
+        layout.addLayout(controls)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.verticalHeader().setVisible(False)
+        header = self.table.horizontalHeader()
+        for col in range(len(self.COLUMNS) - 1):
+            header.setSectionResizeMode(col, QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(len(self.COLUMNS) - 1, QHeaderView.Stretch)
+        layout.addWidget(self.table)
+
+        self.sort_combo.currentIndexChanged.connect(self.load_stats)
+        self.top_spin.valueChanged.connect(self.load_stats)
+        self.refresh_btn.clicked.connect(self.load_stats)
+        self.reset_btn.clicked.connect(self.reset_stats)
+        close_btn.clicked.connect(self.accept)
+        self.load_stats()
+
+    def load_stats(self):
+        settings = config.DIAGNOSTICS_SETTINGS
+        if not settings["query_stats"]:
+            self.info_label.setText("La raccolta delle statistiche è disattivata (query_stats = false nella sezione [diagnostics] di config.ini).")
+        else:
+            since = services.get_query_stats_start().strftime("%d/%m/%Y %H:%M:%S")
+            slow = f"soglia {settings['slow_query_ms']:g} ms, log: {SLOW_QUERY_LOG_FILE}" if settings["slow_query_ms"] else "disattivato"
+            self.info_label.setText(f"Statistiche dal {since}. Log delle query lente: {slow}.")
+
+        stats = services.get_query_stats(self.top_spin.value(), self.sort_combo.currentData())
+        self.table.setRowCount(len(stats))
+        for row, entry in enumerate(stats):
+            values = [entry["caller"], entry["count"], entry["total_time"] * 1000,
+                      entry["total_time"] * 1000 / max(entry["count"], 1), entry["max_time"] * 1000,
+                      entry["rows"], entry["slow_count"], entry["sql"]]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(f"{value:.1f}" if isinstance(value, float) else str(value))
+                if not isinstance(value, str):
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                if col == len(values) - 1:
+                    item.setToolTip(entry["sql"])
+                self.table.setItem(row, col, item)
+
+    def reset_stats(self):
+        services.reset_query_stats()
+        self.load_stats()
@@ -9,7 +9,7 @@ import requests
 
 # Config di fallback se non esiste il modulo app.config
 try:
-    from app import config
+    from app import api_client, config
     from app.config import STYLESHEET
 except ModuleNotFoundError:
     class DummyConfig:
@@ -215,15 +215,9 @@ class LoginDialog(QDialog):
             self._highlight_empty()
             return
 
-        token_url = f"{config.SERVER_URL}/token"
-
         try:
             self.setEnabled(False)
-            response = requests.post(
-                token_url,
-                data={"username": username, "password": password},
-                timeout=10,
-            )
+            response = api_client.post("/token", data={"username": username, "password": password}, auth=False)
 
             if response.status_code == 200:
                 try:
@@ -1,22 +1,22 @@
 import logging
-import pandas as pd
 from PySide6.QtWidgets import (QApplication, QDialog, QVBoxLayout, QHBoxLayout, QGroupBox, 
-    QLineEdit, QTableWidget, QTableWidgetItem, QAbstractItemView, QHeaderView, QPushButton,
+    QLineEdit, QTableWidget, QTableWidgetItem, QTableView, QAbstractItemView, QHeaderView, QPushButton,
     QMessageBox, QFileDialog, QProgressDialog, QStyle)
-from PySide6.QtCore import Qt, QThread
+from PySide6.QtCore import Qt, QThread, QTimer, QItemSelectionModel
 from PySide6.QtGui import QColor, QBrush
 
 from app import services, auth_manager
 from .detail_dialogs import CustomerDialog, DeviceDialog, InstrumentDetailDialog
 from .utility_dialogs import (DateRangeSelectionDialog, VerificationStatusDialog, MonthYearSelectionDialog, 
                               MappingDialog, ImportReportDialog, VerificationViewerDialog, 
-                              DateSelectionDialog, DestinationDetailDialog, DestinationSelectionDialog, SingleCalendarRangeDialog)
-from app.workers.import_worker import ImportWorker
+                              DestinationDetailDialog, DestinationSelectionDialog, SingleCalendarRangeDialog)
+from app.workers.import_worker import ImportWorker, detect_csv_separator
 from app.workers.stm_import_worker import StmImportWorker
 from app.workers.export_worker import DailyExportWorker
 from app.workers.bulk_report_worker import BulkReportWorker
 from app import config
 from app.workers.table_export_worker import TableExportWorker
+from app.ui.table_models import PagedTableModel
 
 import re
 import os
@@ -32,7 +32,30 @@ class NumericTableWidgetItem(QTableWidgetItem):
             # Se non sono numeri, confrontali come testo
             return super().__lt__(other)
         
+def _interval_text(value, row):
+    return str(value) if value is not None else "N/A"
+
+def _status_text(value, row):
+    return 'attivo' if (value or 'active') == 'active' else 'dismesso'
+
+def _device_foreground(row):
+    # Colora la riga se il dispositivo è dismesso
+    return QBrush(QColor("blue")) if row.get('status') == 'decommissioned' else None
+
+CUSTOMER_COLUMNS = [("ID", "id", "id", None), ("Nome", "name", "name", None)]
+DEVICE_COLUMNS = [
+    ("ID", "id", "id", None), ("Descrizione", "description", "description", None),
+    ("Reparto", "department", "department", None), ("S/N", "serial_number", "serial_number", None),
+    ("Costruttore", "manufacturer", "manufacturer", None), ("Modello", "model", "model", None),
+    ("Inv. Cliente", "customer_inventory", "customer_inventory", None), ("Inv. AMS", "ams_inventory", "ams_inventory", None),
+    ("Int. Verifica (Mesi)", "verification_interval", "verification_interval", _interval_text),
+    ("Stato", "status", "status", _status_text),
+]
+
 class DbManagerDialog(QDialog):
+    # Attesa dopo l'ultima digitazione prima di rieseguire la ricerca (ms)
+    SEARCH_DEBOUNCE_MS = 300
+
     def __init__(self, role, parent=None):
         super().__init__(parent)
         self.main_window = parent
@@ -53,7 +76,8 @@ class DbManagerDialog(QDialog):
         customers_group = QGroupBox("Clienti")
         cust_layout = QVBoxLayout(customers_group)
         self.customer_search_box = QLineEdit(); self.customer_search_box.setPlaceholderText("Cerca cliente...")
-        self.customer_table = QTableWidget(0, 2); self.customer_table.setHorizontalHeaderLabels(["ID", "Nome"])
+        self.customer_model = PagedTableModel(CUSTOMER_COLUMNS, parent=self)
+        self.customer_table = QTableView(); self.customer_table.setModel(self.customer_model)
         self.setup_table_style(self.customer_table)
         cust_buttons_layout = self.create_customer_buttons()
         cust_layout.addWidget(self.customer_search_box); cust_layout.addWidget(self.customer_table); cust_layout.addLayout(cust_buttons_layout)
@@ -70,8 +94,8 @@ class DbManagerDialog(QDialog):
         self.devices_group = QGroupBox("Dispositivi")
         dev_layout = QVBoxLayout(self.devices_group)
         self.device_search_box = QLineEdit(); self.device_search_box.setPlaceholderText("Cerca dispositivo...")
-        self.device_table = QTableWidget(0, 10) # Aggiunta una colonna per lo stato
-        self.device_table.setHorizontalHeaderLabels(["ID", "Descrizione", "Reparto", "S/N", "Costruttore", "Modello", "Inv. Cliente", "Inv. AMS", "Int. Verifica (Mesi)", "Stato"])
+        self.device_model = PagedTableModel(DEVICE_COLUMNS, row_foreground=_device_foreground, parent=self)
+        self.device_table = QTableView(); self.device_table.setModel(self.device_model)
         self.setup_table_style(self.device_table)
         dev_buttons_layout = self.create_device_buttons()
         dev_layout.addWidget(self.device_search_box); dev_layout.addWidget(self.device_table); dev_layout.addLayout(dev_buttons_layout)
@@ -90,11 +114,20 @@ class DbManagerDialog(QDialog):
         main_layout.addLayout(bottom_row_layout)
         self.setLayout(main_layout)
 
-        self.customer_search_box.textChanged.connect(self.load_customers_table)
-        self.customer_table.itemSelectionChanged.connect(self.customer_selected)
+        # Ricerca con debounce: la query parte solo quando l'utente smette di digitare
+        self.customer_search_timer = QTimer(self); self.customer_search_timer.setSingleShot(True); self.customer_search_timer.setInterval(self.SEARCH_DEBOUNCE_MS)
+        self.customer_search_timer.timeout.connect(self.load_customers_table)
+        self.device_search_timer = QTimer(self); self.device_search_timer.setSingleShot(True); self.device_search_timer.setInterval(self.SEARCH_DEBOUNCE_MS)
+        self.device_search_timer.timeout.connect(self.refresh_devices_table)
+        self.customer_search_box.textChanged.connect(self.customer_search_timer.start)
+        self.customer_table.selectionModel().selectionChanged.connect(lambda *_: self.customer_selected())
         self.destination_table.itemSelectionChanged.connect(self.destination_selected)
-        self.device_table.itemSelectionChanged.connect(self.device_selected)
-        self.device_search_box.textChanged.connect(self.destination_selected)
+        self.device_table.selectionModel().selectionChanged.connect(lambda *_: self.device_selected())
+        self.keep_selection_on_reset(self.customer_table, self.customer_selected)
+        self.keep_selection_on_reset(self.device_table, self.device_selected)
+        self.device_search_box.textChanged.connect(self.device_search_timer.start)
+        self.device_scope = None  # 'destination' o 'customer' (Mostra Tutti i Dispositivi)
+        self.shown_customer_id = None  # Cliente di cui sono mostrate le destinazioni
         
         self.reset_views(level='customer')
 
@@ -103,6 +136,8 @@ class DbManagerDialog(QDialog):
         table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
         if hide_id: table.hideColumn(0)
+        # Per le viste a pagine l'ordinamento è in SQL: si parte dall'ordine predefinito della query
+        if isinstance(table, QTableView) and not isinstance(table, QTableWidget): table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
         table.setSortingEnabled(True)
         table.verticalHeader().setVisible(False)
 
@@ -117,7 +152,7 @@ class DbManagerDialog(QDialog):
         layout = QHBoxLayout()
         layout.addWidget(self.create_button("Importa Dispositivi...", self.import_from_file, QStyle.SP_ArrowUp))
         layout.addWidget(self.create_button("Importa da Archivio (.stm)...", self.import_from_stm, QStyle.SP_ArrowDown))
-        layout.addWidget(self.create_button("Esporta Verifiche per Data...", self.export_daily_verifications, QStyle.SP_DialogSaveButton))
+        layout.addWidget(self.create_button("Esporta Verifiche per Periodo...", self.export_daily_verifications, QStyle.SP_DialogSaveButton))
         layout.addStretch()
         layout.addWidget(self.create_button("GGenera Report per Periodo...", self.generate_monthly_reports, QStyle.SP_FileDialogToParent))
         layout.addWidget(self.create_button("Filtra Verifiche per Periodo...", self.open_period_filter_dialog, QStyle.SP_FileDialogDetailedView))
@@ -131,11 +166,13 @@ class DbManagerDialog(QDialog):
         self.show_all_devices_btn = QPushButton("Mostra Tutti i Dispositivi")
         self.show_all_devices_btn.clicked.connect(self.show_all_customer_devices)
         self.show_all_devices_btn.setEnabled(False)
+        self.export_cust_table_btn = self.create_button("Tabella Excel Cliente...", self.export_customer_table, enabled=False)
         layout.addStretch() 
         layout.addWidget(self.add_cust_btn)
         layout.addWidget(self.edit_cust_btn) 
         layout.addWidget(self.del_cust_btn)
         layout.addWidget(self.show_all_devices_btn)
+        layout.addWidget(self.export_cust_table_btn)
         if self.user_role == 'technician': self.edit_cust_btn.setVisible(False)
         if self.user_role == 'technician': self.add_cust_btn.setVisible(False)
         if self.user_role == 'technician': self.del_cust_btn.setVisible(False)
@@ -160,7 +197,7 @@ class DbManagerDialog(QDialog):
         if not dest_id:
             return QMessageBox.warning(self, "Selezione Mancante", "Seleziona una destinazione per cui generare la tabella.")
         
-        customer_name = self.customer_table.item(self.customer_table.currentRow(), 1).text()
+        customer_name = self.selected_customer_name()
         destination_name = self.destination_table.item(self.destination_table.currentRow(), 1).text()
         
         safe_name = re.sub(r'[\\/*?:"<>|]', '_', f"{destination_name}")
@@ -170,13 +207,30 @@ class DbManagerDialog(QDialog):
         if not output_path:
             return
 
+        self.start_table_export(TableExportWorker(dest_id, output_path))
+
+    def export_customer_table(self):
+        """Avvia l'esportazione della tabella di tutte le destinazioni del cliente selezionato (un foglio per destinazione)."""
+        cust_id = self.get_selected_id(self.customer_table)
+        if not cust_id:
+            return QMessageBox.warning(self, "Selezione Mancante", "Seleziona un cliente per cui generare la tabella.")
+
+        customer_name = self.selected_customer_name()
+        safe_name = re.sub(r'[\\/*?:"<>|]', '_', f"{customer_name}")
+        output_path, _ = QFileDialog.getSaveFileName(self, "Salva Tabella Excel", f"Tabella Verifiche_{safe_name}.xlsx", "File Excel (*.xlsx)")
+        if not output_path:
+            return
+        self.start_table_export(TableExportWorker(None, output_path, customer_id=cust_id))
+
+    def start_table_export(self, worker):
         self.thread = QThread()
-        self.worker = TableExportWorker(dest_id, output_path)
+        self.worker = worker
         self.worker.moveToThread(self.thread)
 
         self.thread.started.connect(self.worker.run)
         self.worker.finished.connect(self.on_table_export_finished)
         self.worker.error.connect(self.on_table_export_error)
+        self.worker.progress_updated.connect(lambda rows: self.setWindowTitle(f"Manager Anagrafiche (Esportazione Tabella... {rows} righe)"))
         self.worker.finished.connect(self.thread.quit)
         self.worker.finished.connect(self.worker.deleteLater)
         self.thread.finished.connect(self.thread.deleteLater)
@@ -222,15 +276,47 @@ class DbManagerDialog(QDialog):
         layout.addStretch(); layout.addWidget(self.view_verif_btn); layout.addWidget(self.gen_report_btn); layout.addWidget(self.print_report_btn); layout.addWidget(self.delete_verif_btn)
         return layout
 
-    def get_selected_id(self, table: QTableWidget):
+    def keep_selection_on_reset(self, table, on_selection_changed):
+        """
+        L'azzeramento di un modello a pagine (ordinamento, ricarica) svuota la selezione
+        senza emettere selectionChanged: la riga selezionata viene riselezionata se è
+        tra quelle ricaricate, altrimenti on_selection_changed aggiorna i riquadri collegati.
+        """
+        model = table.model()
+        previous = {}
+        model.modelAboutToBeReset.connect(lambda: previous.update(id=self.get_selected_id(table)))
+
+        def restore():
+            selected_id = previous.pop('id', None)
+            if selected_id is None:
+                return
+            row = next((r for r in range(model.rowCount()) if model.row_id(r) == selected_id), None)
+            if row is None:
+                on_selection_changed()
+                return
+            table.selectionModel().setCurrentIndex(model.index(row, 1), QItemSelectionModel.ClearAndSelect | QItemSelectionModel.Rows)
+        model.modelReset.connect(restore)
+
+    def get_selected_id(self, table):
         selected_rows = table.selectionModel().selectedRows()
         if not selected_rows: return None
+        if isinstance(table.model(), PagedTableModel):
+            return table.model().row_id(selected_rows[0].row())
         id_item = table.item(selected_rows[0].row(), 0)
         return int(id_item.text()) if id_item else None
 
+    def get_selected_row_data(self, table) -> dict:
+        """Dati completi della riga selezionata in una tabella a pagine."""
+        selected_rows = table.selectionModel().selectedRows()
+        return table.model().row_data(selected_rows[0].row()) if selected_rows else None
+
+    def selected_customer_name(self) -> str:
+        customer = self.get_selected_row_data(self.customer_table)
+        return customer.get('name', '') if customer else ''
+
     def reset_views(self, level='customer'):
-        if level == 'customer': self.destination_table.setRowCount(0); self.destinations_group.setTitle("Destinazioni / Sedi"); self.set_destination_buttons_enabled(False, False) # <-- MODIFICA QUESTA RIGA
-        if level in ['customer', 'destination']: self.device_table.setRowCount(0); self.devices_group.setTitle("Dispositivi"); self.set_device_buttons_enabled(False)
+        if level == 'customer': self.destination_table.setRowCount(0); self.destinations_group.setTitle("Destinazioni / Sedi"); self.set_destination_buttons_enabled(False, False); self.shown_customer_id = None # <-- MODIFICA QUESTA RIGA
+        if level in ['customer', 'destination']: self.device_model.clear(); self.device_scope = None; self.devices_group.setTitle("Dispositivi"); self.set_device_buttons_enabled(False)
         if level in ['customer', 'destination', 'device']: self.verifications_table.setRowCount(0); self.verifications_group.setTitle("Storico Verifiche"); self.set_verification_buttons_enabled(False)
 
     def set_customer_buttons_enabled(self, enabled): self.edit_cust_btn.setEnabled(enabled); self.del_cust_btn.setEnabled(enabled)
@@ -244,28 +330,26 @@ class DbManagerDialog(QDialog):
         
     def load_customers_table(self):
         self.reset_views(level='customer') 
-        self.customer_table.setRowCount(0)
-        self.customer_table.setSortingEnabled(False) 
-        customers = services.get_all_customers(self.customer_search_box.text())
-        for cust in customers:
-            row = self.customer_table.rowCount(); self.customer_table.insertRow(row)
-            self.customer_table.setItem(row, 0, NumericTableWidgetItem(str(cust['id'])))  
-            self.customer_table.setItem(row, 1, QTableWidgetItem(cust['name']))
-        self.customer_table.setSortingEnabled(True) 
+        search_text = self.customer_search_box.text()
+        self.customer_model.set_source(
+            lambda sort_key, descending, after, limit: services.get_customers_page(search_text, sort_key or "name", descending, after, limit))
     
     def customer_selected(self):
-        self.reset_views(level='destination')
         cust_id = self.get_selected_id(self.customer_table)
-        self.set_customer_buttons_enabled(cust_id is not None); self.show_all_devices_btn.setEnabled(cust_id is not None)
+        # Stesso cliente riselezionato dopo un ordinamento: destinazioni e dispositivi restano come sono
+        if cust_id is not None and cust_id == self.shown_customer_id: return
+        self.reset_views(level='customer')
+        self.shown_customer_id = cust_id
+        self.set_customer_buttons_enabled(cust_id is not None); self.show_all_devices_btn.setEnabled(cust_id is not None); self.export_cust_table_btn.setEnabled(cust_id is not None)
         if cust_id:
-            customer_name = self.customer_table.item(self.customer_table.currentRow(), 1).text()
+            customer_name = self.selected_customer_name()
             self.destinations_group.setTitle(f"Destinazioni per '{customer_name}'")
-            self.load_destinations_table(cust_id); self.set_destination_buttons_enabled(True)
+            self.load_destinations_table(cust_id); self.set_destination_buttons_enabled(True, False)
 
     def load_destinations_table(self, customer_id):
         self.destination_table.setRowCount(0)
         self.destination_table.setSortingEnabled(False)
-        destinations = services.database.get_destinations_for_customer(customer_id)
+        destinations = services.get_destinations_for_customer(customer_id)
         for dest in destinations:
             row = self.destination_table.rowCount(); self.destination_table.insertRow(row)
             self.destination_table.setItem(row, 0, NumericTableWidgetItem(str(dest['id'])))
@@ -289,42 +373,19 @@ class DbManagerDialog(QDialog):
             self.set_device_buttons_enabled(True)
 
     def load_devices_table(self, destination_id):
-        self.device_table.setSortingEnabled(False)
-        self.device_table.setRowCount(0)
+        self.device_scope = 'destination'
         search_text = self.device_search_box.text()
-        
-        # Chiama la nuova funzione del database che include i dismessi
-        devices = services.database.get_devices_for_destination_manager(destination_id, search_text)
-        
-        for dev_row in devices:
-            dev = dict(dev_row)
-            row = self.device_table.rowCount()
-            self.device_table.insertRow(row)
-            
-            status = dev.get('status', 'active')
-            status_text = 'attivo' if status == 'active' else 'dismesso'
-            
-            # Imposta le celle
-            self.device_table.setItem(row, 0, NumericTableWidgetItem(str(dev.get('id'))))
-            self.device_table.setItem(row, 1, QTableWidgetItem(dev.get('description')))
-            self.device_table.setItem(row, 2, QTableWidgetItem(dev.get('department')))
-            self.device_table.setItem(row, 3, QTableWidgetItem(dev.get('serial_number')))
-            self.device_table.setItem(row, 4, QTableWidgetItem(dev.get('manufacturer')))
-            self.device_table.setItem(row, 5, QTableWidgetItem(dev.get('model')))
-            self.device_table.setItem(row, 6, QTableWidgetItem(dev.get('customer_inventory')))
-            self.device_table.setItem(row, 7, QTableWidgetItem(dev.get('ams_inventory')))
-            interval = dev.get('verification_interval')
-            interval_text = str(interval) if interval is not None else "N/A"
-            self.device_table.setItem(row, 8, NumericTableWidgetItem(interval_text))
-            self.device_table.setItem(row, 9, QTableWidgetItem(status_text))
-
-            # Colora la riga se il dispositivo è dismesso
-            if status == 'decommissioned':
-                for col in range(self.device_table.columnCount()):
-                    self.device_table.item(row, col).setForeground(QBrush(QColor("blue")))
-
+        # Tutti i dispositivi (attivi e dismessi), caricati a pagine mentre si scorre
+        self.device_model.set_source(
+            lambda sort_key, descending, after, limit: services.get_devices_page(
+                destination_id=destination_id, search_query=search_text, sort_key=sort_key,
+                descending=descending, after=after, limit=limit))
         self.device_table.resizeColumnsToContents()
-        self.device_table.setSortingEnabled(True)
+
+    def refresh_devices_table(self):
+        """Riesegue la ricerca dispositivi nell'ambito attualmente visualizzato."""
+        if self.device_scope == 'customer': self.show_all_customer_devices()
+        else: self.destination_selected()
 
     def decommission_device(self):
         """Marca il dispositivo selezionato come dismesso."""
@@ -354,7 +415,7 @@ class DbManagerDialog(QDialog):
 
     def device_selected(self):
         """Gestisce la selezione di un dispositivo, mostrando/nascondendo i pulsanti appropriati."""
-        self.reset_views(level='verification')
+        self.reset_views(level='device')
         dev_id = self.get_selected_id(self.device_table)
 
         # Stato di default: nessun dispositivo selezionato
@@ -367,10 +428,8 @@ class DbManagerDialog(QDialog):
 
         if dev_id:
             # Un dispositivo è stato selezionato
-            current_row = self.device_table.currentRow()
-            status_item = self.device_table.item(current_row, 9)
-            status = status_item.text() if status_item else 'attivo'
-            is_active = (status == 'attivo')
+            device = self.get_selected_row_data(self.device_table)
+            is_active = (device.get('status') or 'active') == 'active'
 
             # Abilita i pulsanti comuni
             self.edit_dev_btn.setEnabled(True)
@@ -384,7 +443,7 @@ class DbManagerDialog(QDialog):
             self.reactivate_dev_btn.setEnabled(not is_active)
             
             # Carica le verifiche
-            dev_desc = self.device_table.item(current_row, 1).text()
+            dev_desc = device.get('description') or ''
             self.verifications_group.setTitle(f"Storico Verifiche per '{dev_desc}'")
             self.load_verifications_table(dev_id)
     
@@ -419,7 +478,7 @@ class DbManagerDialog(QDialog):
     def edit_customer(self):
         cust_id = self.get_selected_id(self.customer_table);
         if not cust_id: return
-        customer_data = dict(services.database.get_customer_by_id(cust_id))
+        customer_data = dict(services.get_customer_by_id(cust_id))
         dialog = CustomerDialog(customer_data, self)
         if dialog.exec():
             try: services.update_customer(cust_id, **dialog.get_data()); self.load_customers_table()
@@ -445,7 +504,7 @@ class DbManagerDialog(QDialog):
     def edit_destination(self):
         dest_id = self.get_selected_id(self.destination_table); cust_id = self.get_selected_id(self.customer_table)
         if not dest_id or not cust_id: return
-        dest_data = dict(services.database.get_destination_by_id(dest_id))
+        dest_data = dict(services.get_destination_by_id(dest_id))
         dialog = DestinationDetailDialog(destination_data=dest_data, parent=self)
         if dialog.exec():
             try: data = dialog.get_data(); services.update_destination(dest_id, data['name'], data['address']); self.load_destinations_table(cust_id)
@@ -507,7 +566,12 @@ class DbManagerDialog(QDialog):
         if not dest_id: return QMessageBox.warning(self, "Selezione Mancante", "Seleziona una destinazione in cui importare.")
         filename, _ = QFileDialog.getOpenFileName(self, "Seleziona File", "", "File Excel/CSV (*.xlsx *.csv)")
         if not filename: return
-        try: df_headers = pd.read_csv(filename, sep=';', dtype=str, nrows=0).columns.tolist() if filename.endswith('.csv') else pd.read_excel(filename, dtype=str, nrows=0).columns.tolist()
+        try:
+            import pandas as pd
+            if filename.endswith('.csv'):
+                with open(filename, 'r', encoding='utf-8', newline='') as f: sep = detect_csv_separator(f.read(2048))
+                df_headers = pd.read_csv(filename, sep=sep, dtype=str, nrows=0).columns.tolist()
+            else: df_headers = pd.read_excel(filename, dtype=str, nrows=0).columns.tolist()
         except Exception as e: QMessageBox.critical(self, "Errore Lettura File", f"Impossibile leggere le intestazioni:\n{e}"); return
         map_dialog = MappingDialog(df_headers, self)
         if map_dialog.exec() == QDialog.Accepted:
@@ -538,7 +602,7 @@ class DbManagerDialog(QDialog):
         QMessageBox.critical(self, "Errore di Importazione", error_message)
 
     def import_from_stm(self):
-        filepath, _ = QFileDialog.getOpenFileName(self, "Seleziona Archivio .stm", "", "File STM (*.stm)")
+        filepath, _ = QFileDialog.getOpenFileName(self, "Seleziona Archivio .stm", "", "File STM (*.stm *.stm.gz)")
         if not filepath: return
         self.thread = QThread(); self.worker = StmImportWorker(filepath)
         self.worker.moveToThread(self.thread)
@@ -548,18 +612,25 @@ class DbManagerDialog(QDialog):
 
     def on_stm_import_finished(self, verif_imported, verif_skipped, dev_new, cust_new):
         self.setWindowTitle("Manager Anagrafiche"); self.load_customers_table()
-        QMessageBox.information(self, "Importazione Completata", f"Importazione da archivio completata.\n- Verifiche importate: {verif_imported}\n- Verifiche saltate: {verif_skipped}\n- Nuovi dispositivi: {dev_new}")
+        QMessageBox.information(self, "Importazione Completata", f"Importazione da archivio completata.\n- Verifiche importate: {verif_imported}\n- Verifiche saltate: {verif_skipped}\n- Nuovi dispositivi: {dev_new}\n- Nuovi clienti: {cust_new}")
 
     def export_daily_verifications(self):
-        date_dialog = DateSelectionDialog(self)
+        date_dialog = SingleCalendarRangeDialog(self)
         if date_dialog.exec() == QDialog.Accepted:
-            target_date = date_dialog.getSelectedDate()
-            default_filename = f"Export_Verifiche_{target_date.replace('-', '')}.stm"
-            output_path, _ = QFileDialog.getSaveFileName(self, "Salva Esportazione", default_filename, "File STM (*.stm)")
+            start_date, end_date = date_dialog.get_date_range()
+            if not start_date: return
+            period = start_date.replace('-', '') if start_date == end_date else f"{start_date.replace('-', '')}_{end_date.replace('-', '')}"
+            default_filename = f"Export_Verifiche_{period}.stm"
+            filters = ["File STM (*.stm)", "File STM compresso (*.stm.gz)", "File STM formato 1.0 - versioni precedenti (*.stm)"]
+            output_path, selected_filter = QFileDialog.getSaveFileName(self, "Salva Esportazione", default_filename, ";;".join(filters))
             if not output_path: return
-            self.thread = QThread(); self.worker = DailyExportWorker(target_date, output_path)
+            compress = selected_filter == filters[1] or output_path.lower().endswith('.gz')
+            if compress and not output_path.lower().endswith('.gz'): output_path += '.gz'
+            format_version = services.database.STM_FORMAT_V1 if selected_filter == filters[2] else services.database.STM_FORMAT_V2
+            self.thread = QThread(); self.worker = DailyExportWorker(start_date, output_path, end_date=end_date, format_version=format_version, compress=compress)
             self.worker.moveToThread(self.thread)
             self.thread.started.connect(self.worker.run); self.worker.finished.connect(self.on_export_finished); self.worker.error.connect(self.on_export_error)
+            self.worker.progress_updated.connect(lambda done, total: self.setWindowTitle(f"Manager Anagrafiche (Esportazione... {done}/{total})"))
             self.worker.finished.connect(self.thread.quit); self.worker.finished.connect(self.worker.deleteLater); self.thread.finished.connect(self.thread.deleteLater)
             self.setWindowTitle("Manager Anagrafiche (Esportazione...)"); self.thread.start()
     
@@ -681,18 +752,16 @@ class DbManagerDialog(QDialog):
         cust_id = self.get_selected_id(self.customer_table)
         if not cust_id: return
         self.destination_table.clearSelection()
-        customer_name = self.customer_table.item(self.customer_table.currentRow(), 1).text()
+        customer_name = self.selected_customer_name()
         self.devices_group.setTitle(f"Tutti i Dispositivi per '{customer_name}'")
         self.set_device_buttons_enabled(False)
-        self.device_table.setSortingEnabled(False)
-        self.device_table.setRowCount(0)
+        self.device_scope = 'customer'
         search_text = self.device_search_box.text()
-        devices = services.database.get_all_devices_for_customer(cust_id, search_text)
-        for dev_row in devices:
-            dev = dict(dev_row); row = self.device_table.rowCount(); self.device_table.insertRow(row)
-            self.device_table.setItem(row, 0, QTableWidgetItem(str(dev.get('id')))); self.device_table.setItem(row, 1, QTableWidgetItem(dev.get('description'))); self.device_table.setItem(row, 2, QTableWidgetItem(dev.get('department'))); self.device_table.setItem(row, 3, QTableWidgetItem(dev.get('serial_number'))); self.device_table.setItem(row, 4, QTableWidgetItem(dev.get('manufacturer'))); self.device_table.setItem(row, 5, QTableWidgetItem(dev.get('model'))); self.device_table.setItem(row, 6, QTableWidgetItem(dev.get('customer_inventory'))); self.device_table.setItem(row, 7, QTableWidgetItem(dev.get('ams_inventory'))); interval = dev.get('verification_interval'); interval_text = str(interval) if interval is not None else "N/A"; self.device_table.setItem(row, 8, QTableWidgetItem(interval_text))
+        self.device_model.set_source(
+            lambda sort_key, descending, after, limit: services.get_devices_page(
+                customer_id=cust_id, search_query=search_text, sort_key=sort_key,
+                descending=descending, after=after, limit=limit))
         self.device_table.resizeColumnsToContents()
-        self.device_table.setSortingEnabled(True)
 
 class InstrumentManagerDialog(QDialog):
     def __init__(self, parent=None):
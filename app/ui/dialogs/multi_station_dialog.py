@@ -0,0 +1,290 @@
+# app/ui/dialogs/multi_station_dialog.py
+import logging
+from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QGridLayout, QGroupBox, QFormLayout,
+                               QComboBox, QPushButton, QLabel, QProgressBar, QTableWidget, QTableWidgetItem,
+                               QHeaderView, QMessageBox, QScrollArea, QWidget, QAbstractItemView)
+from PySide6.QtCore import Qt, QThread, QSettings
+from PySide6.QtGui import QColor
+
+from app import auth_manager, config, services
+from app.data_models import AppliedPart
+from app.hardware.fluke_esa612 import FlukeESA612
+from app.workers.station_worker import StationWorker, build_test_plan
+from .utility_dialogs import VisualInspectionDialog, AppliedPartsOrderDialog
+
+
+class StationPanel(QGroupBox):
+    """
+    Pannello di una singola postazione: uno strumento collegato a una porta COM
+    che esegue la propria verifica in un thread dedicato.
+    """
+    def __init__(self, port, instruments, owner_dialog):
+        super().__init__(f"Postazione {port}")
+        self.port = port
+        self.owner_dialog = owner_dialog
+        self.thread = None
+        self.worker = None
+        self.running_device_id = None
+
+        layout = QVBoxLayout(self)
+        form = QFormLayout()
+        self.instrument_combo = QComboBox()
+        default_idx = -1
+        for i, inst_row in enumerate(instruments):
+            instrument = dict(inst_row)
+            self.instrument_combo.addItem(f"{instrument.get('instrument_name')} (S/N: {instrument.get('serial_number')})", instrument)
+            if instrument.get('is_default'): default_idx = i
+        if default_idx != -1: self.instrument_combo.setCurrentIndex(default_idx)
+        self.device_combo = QComboBox(); self.device_combo.setEditable(True)
+        self.device_combo.completer().setFilterMode(Qt.MatchContains)
+        self.profile_combo = QComboBox()
+        for key, profile in config.PROFILES.items():
+            self.profile_combo.addItem(profile.name, key)
+        form.addRow("Strumento:", self.instrument_combo)
+        form.addRow("Dispositivo:", self.device_combo)
+        form.addRow("Profilo:", self.profile_combo)
+        layout.addLayout(form)
+
+        self.progress_bar = QProgressBar(); self.progress_bar.setFormat("Passo %v di %m"); self.progress_bar.setValue(0)
+        self.status_label = QLabel("Pronta."); self.status_label.setWordWrap(True)
+        layout.addWidget(self.progress_bar); layout.addWidget(self.status_label)
+
+        self.results_table = QTableWidget(0, 3)
+        self.results_table.setHorizontalHeaderLabels(["Test / P.A.", "Valore", "Esito"])
+        self.results_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.results_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        layout.addWidget(self.results_table)
+
+        buttons = QHBoxLayout()
+        self.start_btn = QPushButton("Avvia"); self.continue_btn = QPushButton("Continua...")
+        self.retry_btn = QPushButton("Riprova"); self.cancel_btn = QPushButton("Annulla")
+        buttons.addWidget(self.start_btn); buttons.addWidget(self.continue_btn); buttons.addWidget(self.retry_btn)
+        buttons.addStretch(); buttons.addWidget(self.cancel_btn)
+        layout.addLayout(buttons)
+        self.continue_btn.hide(); self.retry_btn.hide(); self.cancel_btn.setEnabled(False)
+
+        self.device_combo.currentIndexChanged.connect(self.on_device_selected)
+        self.start_btn.clicked.connect(self.start_station)
+        self.continue_btn.clicked.connect(self.on_continue_clicked)
+        self.retry_btn.clicked.connect(self.on_retry_clicked)
+        self.cancel_btn.clicked.connect(self.cancel_station)
+
+    def is_running(self):
+        return self.worker is not None
+
+    def set_devices(self, devices):
+        """Ricarica l'elenco dei dispositivi selezionabili (solo se la postazione è libera)."""
+        if self.is_running(): return
+        self.device_combo.blockSignals(True)
+        self.device_combo.clear()
+        for dev_row in devices:
+            dev = dict(dev_row)
+            self.device_combo.addItem(f"{dev.get('description')} (S/N: {dev.get('serial_number')}) - (Inv AMS: {dev.get('ams_inventory')})", dev.get('id'))
+        self.device_combo.blockSignals(False)
+        self.on_device_selected()
+
+    def on_device_selected(self):
+        device_id = self.device_combo.currentData()
+        if not device_id: return
+        device_data = services.get_device_by_id(device_id)
+        if device_data and device_data.get('default_profile_key'):
+            index = self.profile_combo.findData(device_data['default_profile_key'])
+            if index != -1: self.profile_combo.setCurrentIndex(index)
+
+    def _selected_mti_info(self):
+        instrument = self.instrument_combo.currentData()
+        if not instrument: return None
+        return {
+            "instrument": instrument.get('instrument_name'),
+            "serial": instrument.get('serial_number'),
+            "version": instrument.get('fw_version'),
+            "cal_date": instrument.get('calibration_date'),
+            "com_port": self.port
+        }
+
+    def start_station(self):
+        mti_info = self._selected_mti_info()
+        device_id = self.device_combo.currentData()
+        profile_key = self.profile_combo.currentData()
+        if not mti_info:
+            QMessageBox.warning(self, "Dati Mancanti", "Selezionare uno strumento valido."); return
+        if not device_id or not profile_key:
+            QMessageBox.warning(self, "Attenzione", "Selezionare un dispositivo e un profilo validi."); return
+        if self.owner_dialog.is_device_busy(device_id):
+            QMessageBox.warning(self, "Dispositivo Occupato", "Il dispositivo selezionato è già in verifica su un'altra postazione."); return
+
+        device_info_row = services.get_device_by_id(device_id)
+        if not device_info_row:
+            QMessageBox.critical(self, "Errore", "Impossibile trovare i dati del dispositivo selezionato."); return
+        device_info = dict(device_info_row)
+        applied_parts = [AppliedPart(**pa) for pa in device_info.get('applied_parts', [])]
+        if not build_test_plan(config.PROFILES[profile_key], applied_parts):
+            QMessageBox.warning(self, "Profilo Vuoto", "Il profilo selezionato non contiene test eseguibili."); return
+        if applied_parts and any(t.is_applied_part_test for t in config.PROFILES[profile_key].tests):
+            if AppliedPartsOrderDialog(applied_parts, self).exec() != QDialog.Accepted: return
+
+        inspection_dialog = VisualInspectionDialog(self)
+        if inspection_dialog.exec() != QDialog.Accepted: return
+
+        current_user = auth_manager.get_current_user_info()
+        self.results_table.setRowCount(0)
+        self.running_device_id = device_id
+        self.thread = QThread()
+        self.worker = StationWorker(self.port, device_info, profile_key, mti_info, inspection_dialog.get_data(),
+                                    current_user.get('full_name'), current_user.get('username'),
+                                    capture_enabled=QSettings("MyCompany", "SafetyTester").value("capture_readings", False, type=bool))
+        self.progress_bar.setRange(0, len(self.worker.test_plan)); self.progress_bar.setValue(0)
+        self.worker.moveToThread(self.thread)
+        self.thread.started.connect(self.worker.run)
+        self.worker.step_started.connect(self.on_step_started)
+        self.worker.step_completed.connect(self.on_step_completed)
+        self.worker.pause_requested.connect(self.on_pause_requested)
+        self.worker.instrument_warning.connect(self.on_instrument_warning)
+        self.worker.finished.connect(self.on_station_finished)
+        self.worker.error.connect(self.on_station_error)
+        for sig in (self.worker.finished, self.worker.error):
+            sig.connect(self.thread.quit)
+        self.thread.finished.connect(self.worker.deleteLater)
+        self.thread.finished.connect(self.thread.deleteLater)
+        self._set_running_ui(True)
+        self.thread.start()
+
+    def _set_running_ui(self, running):
+        self.start_btn.setEnabled(not running); self.cancel_btn.setEnabled(running)
+        self.instrument_combo.setEnabled(not running); self.device_combo.setEnabled(not running); self.profile_combo.setEnabled(not running)
+        self.continue_btn.hide(); self.retry_btn.hide()
+        self.setStyleSheet("")
+
+    def _release(self):
+        self.worker = None
+        self.thread = None
+        self.running_device_id = None
+        self._set_running_ui(False)
+
+    def on_step_started(self, step, test_name):
+        self.progress_bar.setValue(step)
+        self.status_label.setText(f"Esecuzione: {test_name}...")
+
+    def on_step_completed(self, result):
+        row = self.results_table.rowCount(); self.results_table.insertRow(row)
+        self.results_table.setItem(row, 0, QTableWidgetItem(result['name']))
+        self.results_table.setItem(row, 1, QTableWidgetItem(f"{result['value']} {result['unit']}".strip()))
+        passed_item = QTableWidgetItem("PASSATO" if result['passed'] else "FALLITO")
+        passed_item.setBackground(QColor('#A3BE8C') if result['passed'] else QColor('#BF616A'))
+        self.results_table.setItem(row, 2, passed_item)
+        self.results_table.scrollToBottom()
+
+    def on_pause_requested(self, message):
+        self.status_label.setText(f"<b>{message}</b><br>Premere 'Continua...' per proseguire.")
+        self.setStyleSheet("QGroupBox { border: 2px solid #EBCB8B; }")
+        self.continue_btn.show()
+
+    def on_continue_clicked(self):
+        self.continue_btn.hide(); self.setStyleSheet("")
+        if self.worker: self.worker.resume()
+
+    def on_instrument_warning(self, code, message):
+        self.status_label.setText(f"Lo strumento ha riportato un avviso ({code}):<br><b>{message}</b>")
+        self.setStyleSheet("QGroupBox { border: 2px solid #BF616A; }")
+        self.retry_btn.show()
+
+    def on_retry_clicked(self):
+        self.retry_btn.hide(); self.setStyleSheet("")
+        if self.worker: self.worker.resolve_warning(retry=True)
+
+    def cancel_station(self):
+        if self.worker: self.worker.cancel()
+
+    def on_station_finished(self, verification_code, new_id):
+        self.status_label.setText(f"Verifica salvata (ID {new_id}, codice {verification_code}).")
+        self._release()
+
+    def on_station_error(self, message):
+        self.status_label.setText(f"<span style='color:#BF616A;'>Verifica interrotta: {message}</span>")
+        self._release()
+
+    def wait_for_stop(self, timeout_ms=15000):
+        """Annulla la sequenza in corso e attende la chiusura del thread."""
+        if self.worker and self.thread:
+            thread = self.thread
+            self.worker.cancel()
+            thread.quit()
+            thread.wait(timeout_ms)
+
+
+class MultiStationDialog(QDialog):
+    """
+    Modalità multi-postazione: rileva gli strumenti collegati alle porte COM
+    e permette di eseguire più verifiche in parallelo, una per postazione.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Verifiche Multi-Postazione")
+        self.setMinimumSize(1000, 650)
+        self.stations = {}
+        self.instruments = services.get_all_instruments()
+
+        layout = QVBoxLayout(self)
+        top_layout = QHBoxLayout()
+        self.destination_combo = QComboBox(); self.destination_combo.setEditable(True)
+        self.destination_combo.completer().setFilterMode(Qt.MatchContains)
+        self.destination_combo.addItem("Seleziona una destinazione...", -1)
+        for dest in services.get_all_destinations_with_customer():
+            self.destination_combo.addItem(f"{dest['customer_name']} / {dest['name']}", dest['id'])
+        detect_btn = QPushButton("Rileva Strumenti")
+        top_layout.addWidget(QLabel("Destinazione:")); top_layout.addWidget(self.destination_combo, 1); top_layout.addWidget(detect_btn)
+        layout.addLayout(top_layout)
+
+        scroll = QScrollArea(); scroll.setWidgetResizable(True)
+        container = QWidget(); self.grid = QGridLayout(container)
+        scroll.setWidget(container)
+        layout.addWidget(scroll)
+
+        close_btn = QPushButton("Chiudi"); close_btn.clicked.connect(self.reject)
+        layout.addWidget(close_btn, alignment=Qt.AlignRight)
+
+        detect_btn.clicked.connect(self.detect_stations)
+        self.destination_combo.currentIndexChanged.connect(self.load_devices)
+        self.detect_stations()
+
+    def detect_stations(self):
+        """Crea un pannello per ogni porta COM rilevata che non ha già una postazione."""
+        try:
+            ports = FlukeESA612.list_available_ports()
+        except Exception as e:
+            logging.error(f"Impossibile elencare le porte COM: {e}", exc_info=True)
+            ports = []
+        if not ports:
+            QMessageBox.information(self, "Nessuno Strumento", "Nessuna porta COM rilevata. Collegare gli strumenti e riprovare.")
+            return
+        for port in ports:
+            if port in self.stations: continue
+            panel = StationPanel(port, self.instruments, self)
+            index = len(self.stations)
+            self.grid.addWidget(panel, index // 2, index % 2)
+            self.stations[port] = panel
+        logging.info(f"Postazioni attive: {', '.join(self.stations)}")
+        self.load_devices()
+
+    def load_devices(self):
+        destination_id = self.destination_combo.currentData()
+        devices = []
+        if destination_id and destination_id != -1:
+            devices = services.get_devices_for_destination(destination_id)
+        for panel in self.stations.values():
+            panel.set_devices(devices)
+
+    def is_device_busy(self, device_id):
+        return any(p.running_device_id == device_id for p in self.stations.values())
+
+    def reject(self):
+        running = [p for p in self.stations.values() if p.is_running()]
+        if running:
+            reply = QMessageBox.question(self, "Verifiche in Corso",
+                                         f"Ci sono {len(running)} verifiche in corso. Interromperle e chiudere?",
+                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply == QMessageBox.No:
+                return
+            for panel in running:
+                panel.wait_for_stop()
+        super().reject()
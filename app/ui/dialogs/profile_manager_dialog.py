@@ -176,6 +176,9 @@ class ProfileManagerDialog(QDialog):
     def load_profiles_from_db(self):
         """Carica i profili dal database e li mostra nella lista."""
         self.profiles_list_widget.clear()
+        if self.profiles_changed:
+            # Tiene allineato config.PROFILES, usato dall'editor per le modifiche successive
+            config.load_verification_profiles()
       
         with database.DatabaseConnection() as conn:
             db_profiles = conn.execute("SELECT id, profile_key, name FROM profiles WHERE is_deleted = 0 ORDER BY name").fetchall()
@@ -7,7 +7,7 @@ from PySide6.QtWidgets import (QDialog, QVBoxLayout, QPushButton, QLabel,
 from PySide6.QtGui import QPixmap
 from PySide6.QtCore import Qt
 import os
-from app import auth_manager, config
+from app import api_client, auth_manager
 import mimetypes
 
 class SignatureManagerDialog(QDialog):
@@ -57,8 +57,7 @@ class SignatureManagerDialog(QDialog):
         """
         self.preview_label.setText("Caricamento...")
         try:
-            url = f"{config.SERVER_URL}/signatures/{self.username}"
-            response = requests.get(url, headers=auth_manager.get_auth_headers(), timeout=10)
+            response = api_client.get(f"/signatures/{self.username}")
             
             if response.status_code == 200:
                 pixmap = QPixmap()
@@ -91,11 +90,10 @@ class SignatureManagerDialog(QDialog):
             return
 
         try:
-            url = f"{config.SERVER_URL}/signatures/{self.username}"
             with open(file_path, 'rb') as f:
                 mime, _ = mimetypes.guess_type(file_path)
                 files = {'file': (os.path.basename(file_path), f, mime or 'application/octet-stream')}
-                response = requests.post(url, files=files, headers=auth_manager.get_auth_headers())
+                response = api_client.post(f"/signatures/{self.username}", files=files)
             
             response.raise_for_status() # Lancia un errore se la richiesta fallisce
             
@@ -125,8 +123,7 @@ class SignatureManagerDialog(QDialog):
             return
 
         try:
-            url = f"{config.SERVER_URL}/signatures/{self.username}"
-            response = requests.delete(url, headers=auth_manager.get_auth_headers())
+            response = api_client.delete(f"/signatures/{self.username}")
             response.raise_for_status()
             
             QMessageBox.information(self, "Operazione Completata", "Firma rimossa dal server.")
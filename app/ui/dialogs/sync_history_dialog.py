@@ -0,0 +1,103 @@
+from datetime import datetime
+from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTableWidget,
+                               QTableWidgetItem, QAbstractItemView, QHeaderView,
+                               QPushButton, QSplitter)
+from PySide6.QtCore import Qt
+from app import services
+
+class SyncHistoryDialog(QDialog):
+    """
+    Mostra le ultime sincronizzazioni con durata, record e byte trasferiti e,
+    per quella selezionata, il tempo di ogni fase lato client e lato server.
+    """
+    COLUMNS = ["Data", "Esito", "Tipo", "Durata (s)", "Inviati", "Ricevuti", "KB inviati", "KB ricevuti", "Errore"]
+    PHASE_COLUMNS = ["Lato", "Fase", "Tempo (ms)", "% del totale"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Storico Sincronizzazioni")
+        self.setMinimumSize(1000, 600)
+        self.history = []
+
+        layout = QVBoxLayout(self)
+        splitter = QSplitter(Qt.Vertical)
+
+        self.table = self._make_table(self.COLUMNS)
+        splitter.addWidget(self.table)
+
+        details = QSplitter(Qt.Horizontal)
+        self.phases_table = self._make_table(self.PHASE_COLUMNS)
+        details.addWidget(self.phases_table)
+        self.rows_table = self._make_table(["Tabella", "Inviati", "Ricevuti"])
+        details.addWidget(self.rows_table)
+        splitter.addWidget(details)
+        layout.addWidget(splitter)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        refresh_btn = QPushButton("Aggiorna"); close_btn = QPushButton("Chiudi")
+        buttons.addWidget(refresh_btn); buttons.addWidget(close_btn)
+        layout.addLayout(buttons)
+
+        self.table.itemSelectionChanged.connect(self.show_details)
+        refresh_btn.clicked.connect(self.load_history)
+        close_btn.clicked.connect(self.accept)
+        self.load_history()
+
+    def _make_table(self, columns):
+        table = QTableWidget(0, len(columns))
+        table.setHorizontalHeaderLabels(columns)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        table.setSelectionMode(QAbstractItemView.SingleSelection)
+        table.verticalHeader().setVisible(False)
+        header = table.horizontalHeader()
+        for col in range(len(columns) - 1):
+            header.setSectionResizeMode(col, QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(len(columns) - 1, QHeaderView.Stretch)
+        return table
+
+    @staticmethod
+    def _fill_row(table, row, values):
+        for col, value in enumerate(values):
+            item = QTableWidgetItem(f"{value:.1f}" if isinstance(value, float) else str(value))
+            if not isinstance(value, str):
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+            table.setItem(row, col, item)
+
+    def load_history(self):
+        self.history = services.get_sync_history()
+        self.table.setRowCount(len(self.history))
+        for row, entry in enumerate(self.history):
+            try:
+                started = datetime.fromisoformat(entry["started_at"]).astimezone().strftime("%d/%m/%Y %H:%M:%S")
+            except (TypeError, ValueError):
+                started = entry["started_at"]
+            self._fill_row(self.table, row, [
+                started, entry["status"], "Completa" if entry["full_sync"] else "Incrementale",
+                entry["duration"] or 0.0, sum(entry["pushed"].values()), sum(entry["pulled"].values()),
+                (entry["bytes_sent"] or 0) / 1024, (entry["bytes_received"] or 0) / 1024, entry["error"] or ""])
+        if self.history:
+            self.table.selectRow(0)
+        else:
+            self.show_details()
+
+    def show_details(self):
+        selected = self.table.selectionModel().selectedRows()
+        entry = self.history[selected[0].row()] if selected else None
+        if not entry:
+            self.phases_table.setRowCount(0); self.rows_table.setRowCount(0)
+            return
+
+        total = entry["duration"] or 0.0
+        server = entry["server_phases"]
+        phases = [("Client", name, seconds) for name, seconds in entry["phases"].items()]
+        phases += [("Server", name, seconds) for name, seconds in server.get("phases", {}).items()]
+        self.phases_table.setRowCount(len(phases))
+        for row, (side, name, seconds) in enumerate(phases):
+            self._fill_row(self.phases_table, row, [side, name, seconds * 1000, seconds * 100 / total if total else 0.0])
+
+        tables = sorted(set(entry["pushed"]) | set(entry["pulled"]))
+        self.rows_table.setRowCount(len(tables))
+        for row, table in enumerate(tables):
+            self._fill_row(self.rows_table, row, [table, entry["pushed"].get(table, 0), entry["pulled"].get(table, 0)])
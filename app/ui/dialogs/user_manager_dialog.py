@@ -2,7 +2,7 @@
 from PySide6.QtWidgets import (QDialog, QVBoxLayout, QTableWidget, QTableWidgetItem, 
                                QHBoxLayout, QPushButton, QMessageBox, QAbstractItemView, QHeaderView)
 import requests
-from app import auth_manager, config
+from app import api_client
 from .user_detail_dialog import UserDetailDialog
 
 class UserManagerDialog(QDialog):
@@ -41,8 +41,7 @@ class UserManagerDialog(QDialog):
 
     def load_users(self):
         try:
-            users_url = f"{config.SERVER_URL}/users"
-            response = requests.get(users_url, headers=auth_manager.get_auth_headers())
+            response = api_client.get("/users")
             response.raise_for_status()
             self.users_data = response.json()
             
@@ -67,8 +66,7 @@ class UserManagerDialog(QDialog):
                 QMessageBox.warning(self, "Dati Mancanti", "La password è obbligatoria per un nuovo utente.")
                 return
             try:
-                users_url = f"{config.SERVER_URL}/users"
-                response = requests.post(users_url, json=user_data, headers=auth_manager.get_auth_headers())
+                response = api_client.post("/users", json_body=user_data)
                 response.raise_for_status()
                 QMessageBox.information(self, "Successo", f"Utente '{user_data['username']}' creato.")
                 self.load_users()
@@ -121,8 +119,7 @@ class UserManagerDialog(QDialog):
 
             try:
                 # L'API per la modifica deve essere estesa per accettare first_name e last_name
-                user_url = f"{config.SERVER_URL}/users/{username_to_edit}"
-                response = requests.put(user_url, json=payload, headers=auth_manager.get_auth_headers())
+                response = api_client.put(f"/users/{username_to_edit}", json_body=payload)
                 response.raise_for_status()
                 QMessageBox.information(self, "Successo", f"Utente '{username_to_edit}' aggiornato.")
                 self.load_users()
@@ -145,8 +142,7 @@ class UserManagerDialog(QDialog):
         reply = QMessageBox.question(self, "Conferma", f"Sei sicuro di voler eliminare l'utente '{username}'?")
         if reply == QMessageBox.Yes:
             try:
-                user_url = f"{config.SERVER_URL}/users/{username}"
-                response = requests.delete(user_url, headers=auth_manager.get_auth_headers())
+                response = api_client.delete(f"/users/{username}")
                 response.raise_for_status()
                 QMessageBox.information(self, "Successo", f"Utente '{username}' eliminato.")
                 self.load_users()
@@ -606,6 +606,8 @@ class DestinationSelectionDialog(QDialog):
         self.combo.completer().setCaseSensitivity(Qt.CaseInsensitive)
         
         all_customers = services.get_all_customers()
+        # Tutte le destinazioni in una sola lettura, raggruppate per cliente
+        destinations_by_customer = services.get_destinations_by_customer()
         for cust in all_customers:
             # --- INIZIO LOGICA CORRETTA ---
             # 1. Aggiungi SEMPRE il nome del cliente come separatore
@@ -614,7 +616,7 @@ class DestinationSelectionDialog(QDialog):
             self.combo.model().item(last_index).setSelectable(False)
 
             # 2. SOLO DOPO, controlla se ci sono destinazioni da aggiungere sotto di esso
-            destinations = services.database.get_destinations_for_customer(cust['id'])
+            destinations = destinations_by_customer.get(cust['id'])
             if destinations:
                 for dest in destinations:
                     self.combo.addItem(f"  {dest['name']} ({cust['name']})", dest['id'])
@@ -3,14 +3,12 @@ from datetime import date, timedelta
 import logging
 import json
 import sys
-import os   
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
     QPushButton, QLabel, QComboBox, QGroupBox, QFormLayout, QMessageBox, QFileDialog, 
     QStyle, QStatusBar, QListWidget, QListWidgetItem, QLineEdit, QDialog, QMenu, QInputDialog, QCheckBox, QTableWidgetItem)
 from PySide6.QtGui import QAction, QKeySequence, QIcon
 from PySide6.QtCore import Qt, QSettings, QDate, QCoreApplication, QThread, QProcess
 from app.data_models import AppliedPart
-from app.ui.dialogs.user_manager_dialog import UserManagerDialog
 
 # La main_window importa solo i moduli necessari per la UI e i servizi
 from app import auth_manager, config, services
@@ -19,12 +17,12 @@ from app.ui.widgets import TestRunnerWidget, ControlPanelWidget
 from app.backup_manager import restore_from_backup
 from app.ui.dialogs import (DbManagerDialog, VisualInspectionDialog, DeviceDialog, 
                             InstrumentManagerDialog, InstrumentSelectionDialog)
-from app.workers.sync_worker import SyncWorker
 from app.ui.dialogs.conflict_dialog import ConflictResolutionDialog
 from app import auth_manager
-from app.ui.dialogs.signature_manager_dialog import SignatureManagerDialog
 from app.hardware.fluke_esa612 import FlukeESA612
 from app.ui.dialogs.profile_manager_dialog import ProfileManagerDialog
+from app.ui.dialogs.multi_station_dialog import MultiStationDialog
+from app import verification_writer
 
 
 
@@ -66,6 +64,11 @@ class MainWindow(QMainWindow):
         self.ripristina_db_action = QAction(qta.icon('fa5s.server'), "ripristina database", self)
         self.ripristina_db_action.triggered.connect(self.restore_database)
 
+        self.multi_station_action = QAction(qta.icon('fa5s.th-large'), "Verifiche Multi-Postazione...", self)
+        self.multi_station_action.triggered.connect(self.open_multi_station)
+
+        file_menu.addAction(self.multi_station_action)
+        file_menu.addSeparator()
         file_menu.addAction(self.ripristina_db_action)
         file_menu.addAction(self.logout_action)
 
@@ -85,6 +88,12 @@ class MainWindow(QMainWindow):
         self.set_com_port_action.triggered.connect(self.configure_com_port)
         settings_menu.addAction(self.set_com_port_action)
 
+        self.capture_readings_action = QAction(qta.icon('fa5s.wave-square'), "Cattura Letture Complete (MREAD)", self)
+        self.capture_readings_action.setCheckable(True)
+        self.capture_readings_action.setChecked(self.settings.value("capture_readings", False, type=bool))
+        self.capture_readings_action.toggled.connect(lambda checked: self.settings.setValue("capture_readings", checked))
+        settings_menu.addAction(self.capture_readings_action)
+
         self.manage_instruments_action = QAction(qta.icon('fa5s.tools'), "Gestisci Strumenti di Misura...", self)
         self.manage_instruments_action.triggered.connect(self.open_instrument_manager)
         settings_menu.addAction(self.manage_instruments_action)
@@ -107,6 +116,14 @@ class MainWindow(QMainWindow):
         self.manage_signature_action.triggered.connect(self.open_signature_manager)
         settings_menu.addAction(self.manage_signature_action)
 
+        self.diagnostics_action = QAction(qta.icon('fa5s.tachometer-alt'), "Diagnostica Database...", self)
+        self.diagnostics_action.triggered.connect(self.open_diagnostics)
+        settings_menu.addAction(self.diagnostics_action)
+
+        self.sync_history_action = QAction(qta.icon('fa5s.history'), "Storico Sincronizzazioni...", self)
+        self.sync_history_action.triggered.connect(self.open_sync_history)
+        settings_menu.addAction(self.sync_history_action)
+
     def create_left_panel(self):
         left_panel_widget = QWidget()
         left_layout = QVBoxLayout(left_panel_widget)
@@ -224,10 +241,10 @@ class MainWindow(QMainWindow):
         # Recupero destinazione + cliente
         dest_name = "—"
         try:
-            dest_row = services.database.get_destination_by_id(dev.get("destination_id"))
+            dest_row = services.get_destination_by_id(dev.get("destination_id"))
             if dest_row:
                 dest = dict(dest_row)
-                cust_row = services.database.get_customer_by_id(dest.get("customer_id"))
+                cust_row = services.get_customer_by_id(dest.get("customer_id"))
                 cust_name = (dict(cust_row).get("name") if cust_row else None)
                 dest_name = f"{dest.get('name')} — {cust_name}" if cust_name else (dest.get('name') or "—")
         except Exception:
@@ -289,7 +306,7 @@ class MainWindow(QMainWindow):
             dest_id = dev.get("destination_id")
 
             # ricava il customer_id dalla destinazione
-            dest_row = services.database.get_destination_by_id(dest_id) if dest_id else None
+            dest_row = services.get_destination_by_id(dest_id) if dest_id else None
             customer_id = dict(dest_row).get("customer_id") if dest_row else None
 
             # ✅ usa i parametri giusti attesi dal costruttore
@@ -395,7 +412,7 @@ class MainWindow(QMainWindow):
         self.destination_selector.blockSignals(True)
         self.destination_selector.clear()
         self.destination_selector.addItem("Seleziona una destinazione...", -1)
-        destinations = services.database.get_all_destinations_with_customer()
+        destinations = services.get_all_destinations_with_customer()
         for dest in destinations:
             self.destination_selector.addItem(f"{dest['customer_name']} / {dest['name']}", dest['id'])
         self.destination_selector.blockSignals(False)
@@ -526,7 +543,7 @@ class MainWindow(QMainWindow):
             clicked_btn = msg_box.clickedButton()
             if clicked_btn == btn_edit:
                 # L'utente vuole modificare il dispositivo, dobbiamo passargli il customer_id
-                destination_info = dict(services.database.get_destination_by_id(device_info['destination_id']))
+                destination_info = dict(services.get_destination_by_id(device_info['destination_id']))
                 customer_id = destination_info['customer_id']
                 edit_dialog = DeviceDialog(customer_id, destination_id=device_info['destination_id'], device_data=device_info, parent=self)
                 if edit_dialog.exec():
@@ -545,8 +562,8 @@ class MainWindow(QMainWindow):
                 self.test_runner_widget.deleteLater()
 
             # Recupera le informazioni finali necessarie
-            destination_info = dict(services.database.get_destination_by_id(device_info['destination_id']))
-            customer_info = dict(services.database.get_customer_by_id(destination_info['customer_id']))
+            destination_info = dict(services.get_destination_by_id(device_info['destination_id']))
+            customer_info = dict(services.get_customer_by_id(destination_info['customer_id']))
             report_settings = {"logo_path": self.logo_path}
             current_user = auth_manager.get_current_user_info()
             
@@ -589,7 +606,7 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Attenzione", "Selezionare una destinazione prima di aggiungere un dispositivo."); return
         
         # Per creare la DeviceDialog abbiamo bisogno del customer_id, lo recuperiamo dalla destinazione
-        destination_data = services.database.get_destination_by_id(destination_id)
+        destination_data = services.get_destination_by_id(destination_id)
         if not destination_data: return # Sicurezza
         customer_id = destination_data['customer_id']
 
@@ -627,7 +644,7 @@ class MainWindow(QMainWindow):
                                      "<b>ATTENZIONE:</b> L'operazione è irreversibile.\n\nL'applicazione verrà chiusa al termine. Vuoi continuare?",
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if reply == QMessageBox.No: return
-        backup_path, _ = QFileDialog.getOpenFileName(self, "Seleziona un file di backup", "backups", "File di Backup (*.bak)")
+        backup_path, _ = QFileDialog.getOpenFileName(self, "Seleziona un file di backup", config.BACKUP_DIR, "File di Backup (*.bak *.bak.gz)")
         if not backup_path: return
         success = restore_from_backup(backup_path)
         if success:
@@ -647,9 +664,17 @@ class MainWindow(QMainWindow):
         dialog = InstrumentManagerDialog(self)
         dialog.exec()
 
+    def open_multi_station(self):
+        """Apre la modalità multi-postazione (più strumenti in parallelo)."""
+        dialog = MultiStationDialog(self)
+        dialog.exec()
+        self.load_control_panel_data()
+
     def closeEvent(self, event):
         """UI/UX: Salva la geometria della finestra prima di chiudere."""
         self.settings.setValue("geometry", self.saveGeometry())
+        # Completa eventuali salvataggi di verifiche ancora in coda
+        verification_writer.shutdown_writer()
         super().closeEvent(event)
 
     def apply_permissions(self):
@@ -717,16 +742,25 @@ class MainWindow(QMainWindow):
         # Se i profili sono cambiati, ricarica il ComboBox nella UI principale
         if dialog.profiles_changed:
             logging.info("I profili sono stati modificati. Ricaricamento in corso...")
-            # Ricarica i profili dal file JSON
-            profiles_path = os.path.join(config.BASE_DIR, "profiles.json")
-            config.load_verification_profiles(profiles_path)
-            # Aggiorna il ComboBox
-            self.profile_selector.clear()
-            self.profile_selector.addItems(config.PROFILES.keys())
+            # Ricarica i profili (dalla cache compilata, ricostruita se la versione è cambiata)
+            config.load_verification_profiles()
+            # Aggiorna il ComboBox (nome visualizzato, chiave come dato)
+            self.load_profiles()
             QMessageBox.information(self, "Profili Aggiornati", "La lista dei profili è stata aggiornata.")
 
+    def open_diagnostics(self):
+        """Apre la finestra con le statistiche delle query del database."""
+        from app.ui.dialogs.diagnostics_dialog import DiagnosticsDialog
+        DiagnosticsDialog(self).exec()
+
+    def open_sync_history(self):
+        """Apre lo storico delle sincronizzazioni con i tempi di ogni fase."""
+        from app.ui.dialogs.sync_history_dialog import SyncHistoryDialog
+        SyncHistoryDialog(self).exec()
+
     def open_signature_manager(self):
         """Apre la finestra di dialogo per la gestione della firma."""
+        from app.ui.dialogs.signature_manager_dialog import SignatureManagerDialog
         dialog = SignatureManagerDialog(self)
         dialog.exec()
 
@@ -746,6 +780,7 @@ class MainWindow(QMainWindow):
 
     def open_user_manager(self):
         """Apre la finestra di dialogo per la gestione degli utenti."""
+        from app.ui.dialogs.user_manager_dialog import UserManagerDialog
         dialog = UserManagerDialog(self)
         dialog.exec()
 
@@ -790,6 +825,7 @@ class MainWindow(QMainWindow):
         self.sync_button.setEnabled(False)
 
         self.thread = QThread()
+        from app.workers.sync_worker import SyncWorker  # carica requests solo alla prima sincronizzazione
         self.worker = SyncWorker(full_sync=full_sync) # Pass the flag to the worker
         self.worker.moveToThread(self.thread)
         
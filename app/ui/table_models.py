@@ -0,0 +1,114 @@
+# app/ui/table_models.py
+import logging
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+import database
+
+class PagedTableModel(QAbstractTableModel):
+    """
+    Modello di tabella a sola lettura che carica le righe a pagine, su richiesta
+    della vista (canFetchMore/fetchMore), con paginazione keyset lato database.
+    L'ordinamento viene delegato alla query SQL: cliccando un'intestazione il
+    modello si azzera e ricarica la prima pagina nel nuovo ordine.
+
+    columns: lista di (intestazione, campo della riga, chiave di ordinamento SQL o None,
+             funzione di formattazione o None).
+    fetch_page: callable(sort_key, descending, after, limit) -> righe, impostata con set_source().
+    """
+    def __init__(self, columns, page_size=database.MANAGER_PAGE_SIZE, row_foreground=None, parent=None):
+        super().__init__(parent)
+        self.columns = columns
+        self.page_size = page_size
+        self.row_foreground = row_foreground
+        self._fetch_page = None
+        self._rows = []
+        self._after = None
+        self._exhausted = True
+        self._sort_key = None
+        self._descending = False
+
+    # --- Sorgente dati ---
+    def set_source(self, fetch_page):
+        """Imposta la funzione di caricamento e ricarica dalla prima pagina."""
+        self._fetch_page = fetch_page
+        self.reload()
+
+    def clear(self):
+        self.beginResetModel()
+        self._fetch_page = None
+        self._rows, self._after, self._exhausted = [], None, True
+        self.endResetModel()
+
+    def reload(self):
+        self.beginResetModel()
+        self._rows, self._after, self._exhausted = [], None, self._fetch_page is None
+        if not self._exhausted:
+            self._rows = self._load_next_page()
+        self.endResetModel()
+
+    def _load_next_page(self):
+        try:
+            rows = self._fetch_page(self._sort_key, self._descending, self._after, self.page_size)
+        except Exception as e:
+            logging.error(f"Caricamento pagina della tabella fallito: {e}", exc_info=True)
+            rows = []
+        if len(rows) < self.page_size:
+            self._exhausted = True
+        if rows:
+            self._after = database.page_key(rows[-1])
+        return [dict(r) for r in rows]
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        new_rows = self._load_next_page()
+        if not new_rows:
+            return
+        first = len(self._rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(new_rows) - 1)
+        self._rows.extend(new_rows)
+        self.endInsertRows()
+
+    # --- Accesso alle righe ---
+    def row_data(self, row: int) -> dict:
+        return self._rows[row] if 0 <= row < len(self._rows) else None
+
+    def row_id(self, row: int):
+        data = self.row_data(row)
+        return data.get('id') if data else None
+
+    # --- Interfaccia QAbstractTableModel ---
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            _, field, _, formatter = self.columns[index.column()]
+            value = row.get(field)
+            if formatter:
+                return formatter(value, row)
+            return "" if value is None else str(value)
+        if role == Qt.ForegroundRole and self.row_foreground:
+            return self.row_foreground(row)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.columns[section][0]
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        sort_key = self.columns[column][2] if 0 <= column < len(self.columns) else None
+        self._sort_key = sort_key
+        self._descending = (order == Qt.DescendingOrder) and sort_key is not None
+        if self._fetch_page is not None:
+            self.reload()
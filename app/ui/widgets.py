@@ -2,28 +2,38 @@ import logging
 import os
 import re
 import time
-from PySide6.QtCore import Qt, QTimer, QDate
+from PySide6.QtCore import Qt, QTimer, QDate, QSettings, QThread
 from PySide6.QtGui import QFont, QColor
 from PySide6.QtWidgets import (QApplication, QDialog, QGroupBox, QHBoxLayout, QLabel,
                                QLineEdit, QMessageBox, QProgressBar, QPushButton,
                                QStackedWidget, QTableWidget, QTableWidgetItem,
                                QVBoxLayout, QWidget, QHeaderView, QListWidget,
-                               QListWidgetItem, QFileDialog, QStyle, QFormLayout,)
+                               QListWidgetItem, QFileDialog, QStyle, QFormLayout,
+                               QAbstractItemView,)
 
 from app import auth_manager, config, services
 from app.data_models import AppliedPart
-from app.hardware.fluke_esa612 import FLUKE_ERROR_CODES, FlukeESA612
+from app.hardware.fluke_esa612 import FLUKE_ERROR_CODES, TEST_FUNCTION_MAP, FlukeESA612
+from app.workers.station_worker import build_result, build_test_plan
 
 class ControlPanelWidget(QWidget):
     """
     Il widget che funge da pannello di controllo / dashboard principale.
     """
+    # Scadenze caricate per volta nell'elenco (le successive su richiesta)
+    DUE_PAGE_SIZE = 100
+    # Serie mostrate nel riquadro dell'analisi del parco (l'esportazione le contiene tutte)
+    DRIFT_ROWS = 50
+
     def __init__(self, parent=None):
         super().__init__(parent)
         
-        layout = QHBoxLayout(self)
-        layout.setContentsMargins(15, 15, 15, 15)
+        outer_layout = QVBoxLayout(self)
+        outer_layout.setContentsMargins(15, 15, 15, 15)
+        outer_layout.setSpacing(15)
+        layout = QHBoxLayout()
         layout.setSpacing(15)
+        outer_layout.addLayout(layout, 2)
 
         # Colonna Sinistra: Statistiche
         stats_group = QGroupBox("Dashboard")
@@ -31,58 +41,251 @@ class ControlPanelWidget(QWidget):
         stats_layout.setRowWrapPolicy(QFormLayout.WrapAllRows)
         self.customers_stat_label = QLabel("...")
         self.devices_stat_label = QLabel("...")
+        self.last_verif_stat_label = QLabel("...")
+        self.outcome_stat_label = QLabel("...")
         stats_layout.addRow("Numero Clienti:", self.customers_stat_label)
         stats_layout.addRow("Numero Dispositivi:", self.devices_stat_label)
+        stats_layout.addRow("Ultima Verifica:", self.last_verif_stat_label)
+        stats_layout.addRow("Esito Ultime Verifiche (dispositivi attivi):", self.outcome_stat_label)
+        # Scadenze raggruppate per cliente: selezionandone uno si filtra l'elenco a destra
+        self.due_customers_list = QListWidget()
+        self.due_customers_list.currentItemChanged.connect(self.on_due_customer_changed)
+        stats_layout.addRow("Scadenze per Cliente:", self.due_customers_list)
         
         # Colonna Destra: Scadenze
         scadenze_group = QGroupBox("Verifiche Scadute o in Scadenza (30 gg)")
         scadenze_layout = QVBoxLayout(scadenze_group)
         self.scadenze_list = QListWidget()
+        self.scadenze_list.itemClicked.connect(self.on_due_item_clicked)
         scadenze_layout.addWidget(self.scadenze_list)
         
         layout.addWidget(stats_group, 1)
         layout.addWidget(scadenze_group, 2)
+
+        # Riga inferiore: serie di misure che si avvicinano ai limiti (calcolate in background)
+        drift_group = QGroupBox("Misure in Avvicinamento ai Limiti")
+        drift_layout = QVBoxLayout(drift_group)
+        self.drift_status_label = QLabel("...")
+        self.drift_table = QTableWidget(0, 6)
+        self.drift_table.setHorizontalHeaderLabels(["Dispositivo", "Cliente", "Test", "Ultimo / Limite", "Tendenza/anno", "Giorni al limite"])
+        self.drift_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.drift_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.drift_table.verticalHeader().setVisible(False)
+        self.drift_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.drift_export_button = QPushButton("Esporta Analisi...")
+        self.drift_export_button.setObjectName("secondary_button")
+        self.drift_export_button.clicked.connect(self.export_drift)
+        drift_layout.addWidget(self.drift_status_label)
+        drift_layout.addWidget(self.drift_table)
+        drift_layout.addWidget(self.drift_export_button, 0, Qt.AlignRight)
+        outer_layout.addWidget(drift_group, 1)
         
+        self.due_customer_id = None
+        self.due_offset = 0
+        self.load_more_item = None
+        self.drift_thread = None
+        self.drift_pending = False
+        self.summary_thread = None
+        self.summary_pending = False
         self.load_data()
 
     def load_data(self):
-        """Carica e aggiorna i dati visualizzati nel pannello di controllo."""
+        """Avvia in background l'aggiornamento dei dati visualizzati nel pannello di controllo."""
         logging.info("Caricamento dati per il pannello di controllo...")
+        self.refresh_summary()
+        self.refresh_drift()
+
+    def refresh_summary(self):
+        """Legge in background il riepilogo (totali, esiti, scadenze per cliente)."""
+        if self.summary_thread is not None:
+            self.summary_pending = True  # Ripetuta al termine di quella in corso
+            return
+        from app.workers.dashboard_worker import DashboardWorker
+        self.summary_thread = QThread()
+        self.summary_worker = DashboardWorker()
+        self.summary_worker.moveToThread(self.summary_thread)
+        self.summary_thread.started.connect(self.summary_worker.run)
+        self.summary_worker.finished.connect(self.on_summary_finished)
+        self.summary_worker.error.connect(self.on_summary_error)
+        for signal in (self.summary_worker.finished, self.summary_worker.error):
+            signal.connect(self.summary_thread.quit)
+            signal.connect(self.summary_worker.deleteLater)
+        self.summary_thread.finished.connect(self.summary_thread.deleteLater)
+        self.summary_thread.finished.connect(self.on_summary_thread_finished)
+        self.summary_thread.start()
+
+    def on_summary_thread_finished(self):
+        self.summary_thread = None
+        if self.summary_pending:
+            self.summary_pending = False
+            self.refresh_summary()
+
+    def on_summary_finished(self, summary):
         try:
-            stats = services.get_stats()
-            self.customers_stat_label.setText(f"<b>{stats.get('customers', 0)}</b>")
-            self.devices_stat_label.setText(f"<b>{stats.get('devices', 0)}</b>")
+            self.customers_stat_label.setText(f"<b>{summary['customers']}</b>")
+            self.devices_stat_label.setText(f"<b>{summary['devices']}</b>")
+            last_verif = QDate.fromString(summary['last_verif'], "yyyy-MM-dd")
+            self.last_verif_stat_label.setText(f"<b>{last_verif.toString('dd/MM/yyyy') if last_verif.isValid() else summary['last_verif']}</b>")
+            self.outcome_stat_label.setText(
+                f"<b style='color:#A3BE8C;'>{summary['passed']}</b> conformi, "
+                f"<b style='color:#BF616A;'>{summary['failed']}</b> non conformi, "
+                f"<b>{summary['not_verified']}</b> mai verificati")
+            self.load_due_summary(summary['due_by_customer'])
+        except Exception as e:
+            logging.error(f"Impossibile caricare i dati della dashboard: {e}", exc_info=True)
+            self.on_summary_error(str(e))
+
+    def on_summary_error(self, message):
+        for label in (self.customers_stat_label, self.devices_stat_label, self.last_verif_stat_label, self.outcome_stat_label):
+            label.setText("<b style='color:red;'>Errore</b>")
+
+    def load_due_summary(self, summary):
+        """Mostra il riepilogo per cliente e ricarica la prima pagina delle scadenze."""
+        total_overdue = sum(row['overdue'] for row in summary)
+        total_upcoming = sum(row['upcoming'] for row in summary)
+        self.due_customers_list.blockSignals(True)
+        self.due_customers_list.clear()
+        all_item = QListWidgetItem(f"Tutti i clienti ({total_overdue} scadute, {total_upcoming} in scadenza)")
+        all_item.setData(Qt.UserRole, None)
+        self.due_customers_list.addItem(all_item)
+        selected_item = all_item
+        for row in summary:
+            failed = f", {row['failed']} non conformi" if row['failed'] else ""
+            item = QListWidgetItem(f"{row['customer_name']} ({row['overdue']} scadute, {row['upcoming']} in scadenza{failed})")
+            item.setData(Qt.UserRole, row['customer_id'])
+            if row['overdue']:
+                item.setIcon(QApplication.style().standardIcon(QStyle.SP_MessageBoxCritical))
+            self.due_customers_list.addItem(item)
+            if row['customer_id'] == self.due_customer_id:
+                selected_item = item
+        self.due_customers_list.setCurrentItem(selected_item)
+        self.due_customers_list.blockSignals(False)
+        self.due_customer_id = selected_item.data(Qt.UserRole)
+        self.reload_due_list()
+
+    def on_due_customer_changed(self, current, previous=None):
+        if current is None: return
+        self.due_customer_id = current.data(Qt.UserRole)
+        self.reload_due_list()
+        self.refresh_drift()
+
+    def on_due_item_clicked(self, item):
+        if item is self.load_more_item:
+            self.load_next_due_page()
+
+    def reload_due_list(self):
+        self.scadenze_list.clear()
+        self.load_more_item = None
+        self.due_offset = 0
+        self.load_next_due_page()
+        if self.scadenze_list.count() == 0:
+            self.scadenze_list.addItem("Nessuna verifica in scadenza.")
+
+    def load_next_due_page(self):
+        """Aggiunge all'elenco la pagina successiva di scadenze (DUE_PAGE_SIZE righe)."""
+        if self.load_more_item is not None:
+            self.scadenze_list.takeItem(self.scadenze_list.row(self.load_more_item))
+            self.load_more_item = None
+        # Una riga in più per sapere se esiste un'ulteriore pagina
+        devices_to_check = services.get_devices_needing_verification(
+            customer_id=self.due_customer_id, limit=self.DUE_PAGE_SIZE + 1, offset=self.due_offset)
+        has_more = len(devices_to_check) > self.DUE_PAGE_SIZE
+        self.due_offset += self.DUE_PAGE_SIZE
+        today = QDate.currentDate()
+        for device_row in devices_to_check[:self.DUE_PAGE_SIZE]:
+            device = dict(device_row)
+            next_date_str = device.get('next_verification_date')
+            if not next_date_str: continue
             
-            self.scadenze_list.clear()
-            devices_to_check = services.get_devices_needing_verification()
-            if not devices_to_check:
-                self.scadenze_list.addItem("Nessuna verifica in scadenza.")
+            next_date = QDate.fromString(next_date_str, "yyyy-MM-dd")
+            item_text = f"<b>{device.get('description')}</b> (S/N: {device.get('serial_number')})<br><small><i>{device.get('customer_name')}</i> - Scadenza: {next_date.toString('dd/MM/yyyy')}</small>"
+            
+            list_item = QListWidgetItem()
+            label = QLabel(item_text)
+            
+            if next_date < today:
+                label.setStyleSheet("color: #BF616A; font-weight: bold;") # Rosso
+                list_item.setIcon(QApplication.style().standardIcon(QStyle.SP_MessageBoxCritical))
             else:
-                today = QDate.currentDate()
-                for device_row in devices_to_check:
-                    device = dict(device_row)
-                    next_date_str = device.get('next_verification_date')
-                    if not next_date_str: continue
-                    
-                    next_date = QDate.fromString(next_date_str, "yyyy-MM-dd")
-                    item_text = f"<b>{device.get('description')}</b> (S/N: {device.get('serial_number')})<br><small><i>{device.get('customer_name')}</i> - Scadenza: {next_date.toString('dd/MM/yyyy')}</small>"
-                    
-                    list_item = QListWidgetItem()
-                    label = QLabel(item_text)
-                    
-                    if next_date < today:
-                        label.setStyleSheet("color: #BF616A; font-weight: bold;") # Rosso
-                        list_item.setIcon(QApplication.style().standardIcon(QStyle.SP_MessageBoxCritical))
-                    else:
-                        label.setStyleSheet("color: #EBCB8B;") # Giallo/Ambra
-                        list_item.setIcon(QApplication.style().standardIcon(QStyle.SP_MessageBoxWarning))
+                label.setStyleSheet("color: #EBCB8B;") # Giallo/Ambra
+                list_item.setIcon(QApplication.style().standardIcon(QStyle.SP_MessageBoxWarning))
 
-                    self.scadenze_list.addItem(list_item)
-                    self.scadenze_list.setItemWidget(list_item, label)
-        except Exception as e:
-            logging.error(f"Impossibile caricare i dati della dashboard: {e}", exc_info=True)
-            self.customers_stat_label.setText("<b style='color:red;'>Errore</b>")
-            self.devices_stat_label.setText("<b style='color:red;'>Errore</b>")
+            list_item.setSizeHint(label.sizeHint())
+            self.scadenze_list.addItem(list_item)
+            self.scadenze_list.setItemWidget(list_item, label)
+        if has_more:
+            self.load_more_item = QListWidgetItem("Mostra altre scadenze...")
+            self.load_more_item.setIcon(QApplication.style().standardIcon(QStyle.SP_ArrowDown))
+            self.scadenze_list.addItem(self.load_more_item)
+
+    def refresh_drift(self):
+        """Avvia in background l'analisi del parco per il cliente selezionato (o per tutti)."""
+        if self.drift_thread is not None:
+            self.drift_pending = True  # Ripetuta al termine di quella in corso
+            return
+        from app.workers.analytics_worker import FleetAnalyticsWorker
+        self.drift_status_label.setText("Analisi delle misure in corso...")
+        self.drift_thread = QThread()
+        self.drift_worker = FleetAnalyticsWorker(self.due_customer_id, self.DRIFT_ROWS)
+        self.drift_worker.moveToThread(self.drift_thread)
+        self.drift_thread.started.connect(self.drift_worker.run)
+        self.drift_worker.finished.connect(self.on_drift_finished)
+        self.drift_worker.error.connect(self.on_drift_error)
+        for signal in (self.drift_worker.finished, self.drift_worker.error):
+            signal.connect(self.drift_thread.quit)
+            signal.connect(self.drift_worker.deleteLater)
+        self.drift_thread.finished.connect(self.drift_thread.deleteLater)
+        self.drift_thread.finished.connect(self.on_drift_thread_finished)
+        self.drift_thread.start()
+
+    def on_drift_thread_finished(self):
+        self.drift_thread = None
+        if self.drift_pending:
+            self.drift_pending = False
+            self.refresh_drift()
+
+    def on_drift_finished(self, rows):
+        self.drift_table.setRowCount(0)
+        at_risk = [r for r in rows if r['days_to_limit'] is not None or r['margin_pct'] < 20]
+        self.drift_status_label.setText(f"{len(at_risk)} serie con tendenza verso il limite o margine inferiore al 20%."
+                                        if at_risk else "Nessuna misura in avvicinamento ai limiti.")
+        for r in at_risk:
+            row = self.drift_table.rowCount()
+            self.drift_table.insertRow(row)
+            test = r['test_name'] + (f" - {r['applied_part']}" if r['applied_part'] else "")
+            unit = r['unit'] or ""
+            slope = "" if r['slope_per_year'] is None else f"{r['slope_per_year']:+.3g} {unit}"
+            days = "" if r['days_to_limit'] is None else ("superato" if r['margin_pct'] < 0 else str(r['days_to_limit']))
+            values = [f"{r.get('description') or ''} (S/N: {r.get('serial_number') or '-'})", r.get('customer_name') or "", test,
+                      f"{r['last_value']:.3g} / {r['limit_value']:.3g} {unit}", slope, days]
+            for col, text in enumerate(values):
+                item = QTableWidgetItem(text)
+                if r['margin_pct'] < 0:
+                    item.setForeground(QColor('#BF616A'))
+                self.drift_table.setItem(row, col, item)
+
+    def on_drift_error(self, message):
+        self.drift_status_label.setText(f"<b style='color:red;'>Analisi non riuscita:</b> {message}")
+
+    def export_drift(self):
+        output_path, _ = QFileDialog.getSaveFileName(self, "Esporta Analisi del Parco", "analisi_parco_misure.xlsx",
+                                                     "File Excel (*.xlsx);;File CSV (*.csv)")
+        if not output_path:
+            return
+        from app.workers.analytics_worker import FleetAnalyticsExportWorker
+        self.drift_export_button.setEnabled(False)
+        self.export_thread = QThread()
+        self.export_worker = FleetAnalyticsExportWorker(output_path, self.due_customer_id)
+        self.export_worker.moveToThread(self.export_thread)
+        self.export_thread.started.connect(self.export_worker.run)
+        self.export_worker.finished.connect(lambda message: QMessageBox.information(self, "Esportazione Completata", message))
+        self.export_worker.error.connect(lambda message: QMessageBox.critical(self, "Errore di Esportazione", message))
+        for signal in (self.export_worker.finished, self.export_worker.error):
+            signal.connect(self.export_thread.quit)
+            signal.connect(self.export_worker.deleteLater)
+        self.export_thread.finished.connect(lambda: self.drift_export_button.setEnabled(True))
+        self.export_thread.finished.connect(self.export_thread.deleteLater)
+        self.export_thread.start()
 
 class TestRunnerWidget(QWidget):
     """
@@ -108,27 +311,17 @@ class TestRunnerWidget(QWidget):
         self.is_running_auto = False
         self.saved_verification_id = None
         self.fluke_connection = None
+        # Cattura completa delle letture MREAD (impostazione globale)
+        self.capture_enabled = QSettings("MyCompany", "SafetyTester").value("capture_readings", False, type=bool)
+        self.captures = {}
+        self.pending_capture = None
 
-        self.test_plan = self._build_test_plan()
+        self.test_plan = build_test_plan(self.current_profile, self.applied_parts)
         self.current_step_index = -1
         
         self.setup_ui()
         self.next_step() # Avvia sempre il primo passo
 
-    def _build_test_plan(self):
-        plan = []
-        standard_tests = [t for t in self.current_profile.tests if not t.is_applied_part_test]
-        for test in standard_tests:
-            plan.append({'test': test, 'applied_part': None})
-
-        pa_test_definitions = [t for t in self.current_profile.tests if t.is_applied_part_test]
-        for pa_on_device in self.applied_parts:
-            key_to_find = f"::{pa_on_device.part_type}"
-            for test_def in pa_test_definitions:
-                if key_to_find in test_def.limits:
-                    plan.append({'test': test_def, 'applied_part': pa_on_device})
-        return plan
-
     def setup_ui(self):
         layout = QVBoxLayout(self)
         test_group = QGroupBox(f"Verifica su: {self.device_info.get('description')} (S/N: {self.device_info.get('serial_number')})")
@@ -223,16 +416,11 @@ class TestRunnerWidget(QWidget):
             self.read_instrument_btn.setEnabled(False)
             self.parent_window.statusBar().showMessage("Comunicazione con lo strumento in corso...")
             try:
-                test_function_map = {
-                    "Tensione alimentazione": "esegui_test_tensione_rete",
-                    "Resistenza conduttore di terra": "esegui_test_resistenza_terra",
-                    "Corrente dispersione diretta dispositivo": "esegui_test_dispersione_diretta",
-                    "Corrente dispersione diretta P.A.": "esegui_test_dispersione_parti_applicate",
-                }
-                method_name = test_function_map.get(current_test.name)
+                method_name = TEST_FUNCTION_MAP.get(current_test.name)
                 if not method_name:
                     raise NotImplementedError(f"Funzione di test non implementata per '{current_test.name}'.")
                 with FlukeESA612(self.mti_info.get('com_port')) as fluke:
+                    fluke.capture_enabled = self.capture_enabled
                     target_function = getattr(fluke, method_name)
                     kwargs = {}
                     if current_test.parameter:
@@ -240,6 +428,7 @@ class TestRunnerWidget(QWidget):
                     if current_pa:
                         kwargs['pa_code'] = current_pa.code
                     result = target_function(**kwargs)
+                    self.pending_capture = fluke.last_capture
             
                 # --- LOGICA CORRETTA ---
                 if result and result.startswith('!'):
@@ -273,15 +462,16 @@ class TestRunnerWidget(QWidget):
         try:
             if not self.fluke_connection:
                 self.fluke_connection = FlukeESA612(self.mti_info.get('com_port'))
+                self.fluke_connection.capture_enabled = self.capture_enabled
                 self.fluke_connection.connect()
             
-            test_function_map = {"Tensione alimentazione": "esegui_test_tensione_rete", "Resistenza conduttore di terra": "esegui_test_resistenza_terra", "Corrente dispersione diretta dispositivo": "esegui_test_dispersione_diretta", "Corrente dispersione diretta P.A.": "esegui_test_dispersione_parti_applicate"}
-            method_name = test_function_map.get(test.name)
+            method_name = TEST_FUNCTION_MAP.get(test.name)
             if not method_name: raise NotImplementedError(f"Test non implementato: '{test.name}'.")
             target_function = getattr(self.fluke_connection, method_name)
             kwargs = {'parametro_test': test.parameter} if test.parameter else {}
             if applied_part: kwargs['pa_code'] = applied_part.code
             result = target_function(**kwargs)
+            self.pending_capture = self.fluke_connection.last_capture
             
             if result and result.startswith('!'):
                 QApplication.restoreOverrideCursor()
@@ -346,33 +536,24 @@ class TestRunnerWidget(QWidget):
                 self.value_input.setStyleSheet("border: 1px solid red;")
                 return False
         try:
-            cleaned_value_str = re.sub(r'[^\d.-]', '', value_str)
-            value_float = float(cleaned_value_str)
+            float(re.sub(r'[^\d.-]', '', value_str))
         except (ValueError, TypeError):
             if self.manual_mode:
                 QMessageBox.warning(self, "Valore Non Valido", "Inserire un valore numerico.")
                 self.value_input.setStyleSheet("border: 1px solid red;")
                 return False
         self.value_input.setStyleSheet("")
-        result_name = f"{test.name} ({test.parameter})" if test.parameter else test.name
-        limit_key = "::ST"
-        if applied_part:
-            result_name = f"{test.name} - {applied_part.name} - {applied_part.part_type}"
-            limit_key = f"::{applied_part.part_type}"
-        limit_obj = test.limits.get(limit_key)
-        is_passed = True
-        limit_value = None
-        unit = limit_obj.unit if limit_obj else ""
-        if limit_obj and limit_obj.high_value is not None:
-            is_passed = (value_float <= limit_obj.high_value)
-            limit_value = limit_obj.high_value
-        result_data = {"name": result_name, "value": value_str, "limit_value": limit_value, "unit": unit, "passed": is_passed}
+        result_data = build_result(test, applied_part, value_str)
         self.results.append(result_data)
+        if self.pending_capture is not None:
+            self.captures[len(self.results) - 1] = self.pending_capture
+            self.pending_capture = None
         self.update_results_table(result_data)
         return True
 
     def display_test(self, test, applied_part=None):
         is_pause = "PAUSA MANUALE" in test.name
+        self.pending_capture = None
         
         self.stacked_widget.setCurrentIndex(0)
         self.test_name_label.setText("Pausa Manuale" if is_pause else f"{test.name} {test.parameter or ''}".strip())
@@ -471,7 +652,8 @@ class TestRunnerWidget(QWidget):
                 device_id=self.device_info['id'], profile_name=self.profile_name,
                 results=self.results, visual_inspection_data=self.visual_inspection_data,
                 mti_info=self.mti_info, technician_name=self.technician_name,
-                technician_username=self.technician_username
+                technician_username=self.technician_username,
+                captures=self.captures
             )
             self.saved_verification_id = new_id
             self.save_db_button.setEnabled(False)
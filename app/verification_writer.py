@@ -0,0 +1,78 @@
+# app/verification_writer.py
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+import database
+
+# Sentinella usata per chiedere al thread di scrittura di terminare
+_STOP = object()
+
+class VerificationWriter:
+    """
+    Scrittore serializzato delle verifiche.
+    Tutte le chiamate a database.save_verification passano da un'unica coda
+    consumata da un solo thread: le postazioni che lavorano in parallelo non si
+    contendono il lock di SQLite e il progressivo del verification_code viene
+    calcolato sempre su uno stato del database già consolidato.
+    """
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="VerificationWriter", daemon=True)
+        self._thread.start()
+
+    def submit(self, **save_kwargs) -> Future:
+        """Accoda un salvataggio e restituisce un Future con (verification_code, new_id)."""
+        future = Future()
+        self._queue.put((future, save_kwargs))
+        return future
+
+    def save(self, timeout=None, **save_kwargs):
+        """Versione bloccante di submit(): attende l'esito del salvataggio."""
+        return self.submit(**save_kwargs).result(timeout=timeout)
+
+    def shutdown(self, timeout=10):
+        """Completa i salvataggi in coda e arresta il thread di scrittura."""
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                future, save_kwargs = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(database.save_verification(**save_kwargs))
+                except Exception as e:
+                    logging.error(f"Salvataggio verifica fallito (device_id={save_kwargs.get('device_id')}): {e}", exc_info=True)
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_writer() -> VerificationWriter:
+    """Restituisce lo scrittore condiviso, creandolo (o ricreandolo) se necessario."""
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = VerificationWriter()
+        return _writer
+
+def shutdown_writer():
+    """Svuota la coda e ferma lo scrittore condiviso, se attivo."""
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.shutdown()
+            _writer = None
@@ -0,0 +1,43 @@
+# app/workers/analytics_worker.py
+from PySide6.QtCore import QObject, Signal
+from app import services
+import logging
+
+class FleetAnalyticsWorker(QObject):
+    """
+    Esegue in background l'analisi delle misure del parco dispositivi (tendenze,
+    margini dai limiti, z-score) e restituisce le righe ordinate per rischio.
+    """
+    finished = Signal(object)
+    error = Signal(str)
+
+    def __init__(self, customer_id=None, limit=None):
+        super().__init__()
+        self.customer_id = customer_id
+        self.limit = limit
+
+    def run(self):
+        try:
+            self.finished.emit(services.analyze_fleet_drift(self.customer_id, self.limit))
+        except Exception as e:
+            logging.error("Errore durante l'analisi del parco dispositivi.", exc_info=True)
+            self.error.emit(str(e))
+
+class FleetAnalyticsExportWorker(QObject):
+    """Esporta l'analisi completa del parco (tutte le serie) in Excel o CSV."""
+    finished = Signal(str)
+    error = Signal(str)
+
+    def __init__(self, output_path, customer_id=None):
+        super().__init__()
+        self.output_path = output_path
+        self.customer_id = customer_id
+
+    def run(self):
+        try:
+            num_rows = services.export_fleet_drift(self.output_path, self.customer_id)
+            logging.info(f"Analisi del parco esportata ({num_rows} righe): {self.output_path}")
+            self.finished.emit(f"Analisi esportata con successo ({num_rows} righe) in:\n{self.output_path}")
+        except Exception as e:
+            logging.error("Errore durante l'esportazione dell'analisi del parco.", exc_info=True)
+            self.error.emit(f"Si è verificato un errore durante l'esportazione:\n{e}")
@@ -0,0 +1,24 @@
+# app/workers/dashboard_worker.py
+from PySide6.QtCore import QObject, Signal
+from app import services
+import logging
+
+class DashboardWorker(QObject):
+    """
+    Legge in background il riepilogo del pannello di controllo (totali, esiti
+    delle ultime verifiche e scadenze per cliente), così la finestra principale
+    viene disegnata subito.
+    """
+    finished = Signal(object)
+    error = Signal(str)
+
+    def __init__(self, days_in_future=30):
+        super().__init__()
+        self.days_in_future = days_in_future
+
+    def run(self):
+        try:
+            self.finished.emit(services.get_dashboard_summary(self.days_in_future))
+        except Exception as e:
+            logging.error("Errore durante il caricamento del riepilogo della dashboard.", exc_info=True)
+            self.error.emit(str(e))
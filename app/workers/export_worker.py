@@ -1,35 +1,42 @@
-import json
+import os
 from PySide6.QtCore import QObject, Signal
 # MODIFICA: Importa 'services', non 'database'
 from app import services
 import logging
 
 class DailyExportWorker(QObject):
-    """Esegue l'esportazione delle verifiche di una data specifica in formato JSON (.stm)."""
+    """
+    Esegue l'esportazione delle verifiche di una data (o di un intervallo di date)
+    in formato JSON (.stm). L'archivio viene scritto in streaming dal database al file.
+    """
     finished = Signal(str, str)
     error = Signal(str)
+    progress_updated = Signal(int, int)
 
-    def __init__(self, target_date, output_path):
+    def __init__(self, target_date, output_path, end_date=None, format_version=None, compress=False):
         super().__init__()
         self.target_date = target_date
+        self.end_date = end_date or target_date
         self.output_path = output_path
+        self.format_version = format_version or services.database.STM_FORMAT_V2
+        self.compress = compress
 
     def run(self):
         try:
-            logging.info(f"Avvio esportazione in formato STM per la data: {self.target_date}")
-            
-            # MODIFICA: Chiama la funzione di servizio, che a sua volta chiama il database
-            export_data = services.get_data_for_daily_export(self.target_date)
-            
-            if not export_data["verifications"]:
-                logging.warning(f"Nessuna verifica trovata per la data {self.target_date}.")
-                self.finished.emit("Warning", "Nessuna verifica trovata per la data selezionata.")
+            logging.info(f"Avvio esportazione in formato STM {self.format_version} dal {self.target_date} al {self.end_date}")
+
+            num_verifiche = services.write_stm_export(
+                self.output_path, self.target_date, self.end_date,
+                format_version=self.format_version, compress=self.compress,
+                progress_callback=self.progress_updated.emit
+            )
+
+            if num_verifiche == 0:
+                os.remove(self.output_path)
+                logging.warning(f"Nessuna verifica trovata dal {self.target_date} al {self.end_date}.")
+                self.finished.emit("Warning", "Nessuna verifica trovata per il periodo selezionato.")
                 return
 
-            with open(self.output_path, 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, indent=4)
-            
-            num_verifiche = len(export_data['verifications'])
             logging.info(f"Esportazione completata con successo. Salvate {num_verifiche} verifiche.")
             self.finished.emit("Success", f"Esportazione completata.\n\nSalvate {num_verifiche} verifiche nel file:\n{self.output_path}")
 
@@ -1,12 +1,78 @@
 # app/workers/import_worker.py
-import pandas as pd
+import csv
+import os
 from PySide6.QtCore import QObject, Signal
 from app import services  # Importa i servizi, NON il database
 import logging
 
+# Righe elaborate per ogni transazione di inserimento
+IMPORT_BATCH_SIZE = 1000
+
+def detect_csv_separator(sample: str) -> str:
+    """Rileva il separatore di un CSV (tipicamente ';' per gli export Excel italiani)."""
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=";,\t|").delimiter
+    except csv.Error:
+        return ';'
+
+def _cell_to_str(value) -> str:
+    return '' if value is None else str(value).strip()
+
+def iter_import_batches(filename: str, batch_size: int = IMPORT_BATCH_SIZE):
+    """
+    Legge il file di importazione in streaming, a lotti di batch_size righe.
+    Restituisce tuple (DataFrame di stringhe, frazione del file già letta).
+    L'indice di ogni DataFrame vale (riga del foglio - 2), come per pd.read_*,
+    così i riferimenti "Riga N" nel report corrispondono al file.
+    - CSV: pd.read_csv con chunksize, avanzamento calcolato sui byte letti.
+    - XLSX: openpyxl in modalità read_only, iterando le righe senza caricare il foglio.
+    """
+    # Import differiti: pandas e openpyxl servono solo durante un'importazione
+    import openpyxl
+    import pandas as pd
+    if filename.lower().endswith('.csv'):
+        total_bytes = max(os.path.getsize(filename), 1)
+        with open(filename, 'rb') as raw:
+            sep = detect_csv_separator(raw.read(2048).decode('utf-8', errors='ignore'))
+            raw.seek(0)
+            for chunk in pd.read_csv(raw, sep=sep, dtype=str, chunksize=batch_size, encoding='utf-8'):
+                yield chunk.fillna(''), min(raw.tell() / total_bytes, 1.0)
+        return
+
+    if not filename.lower().endswith(('.xlsx', '.xlsm')):
+        # Formati non supportati da openpyxl (es. .xls): lettura completa come in passato
+        df = pd.read_excel(filename, dtype=str).fillna('')
+        for start in range(0, len(df), batch_size):
+            yield df.iloc[start:start + batch_size], min((start + batch_size) / max(len(df), 1), 1.0)
+        return
+
+    workbook = openpyxl.load_workbook(filename, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        total_rows = max((sheet.max_row or 0) - 1, 1)
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [_cell_to_str(h) for h in header]
+        batch, batch_index = [], []
+        for sheet_row, values in enumerate(rows, start=2):
+            if values is None or all(v is None for v in values):
+                continue
+            values = list(values[:len(columns)]) + [None] * (len(columns) - len(values))
+            batch.append([_cell_to_str(v) for v in values])
+            batch_index.append(sheet_row - 2)
+            if len(batch) >= batch_size:
+                yield pd.DataFrame(batch, columns=columns, index=batch_index), min((sheet_row - 1) / total_rows, 1.0)
+                batch, batch_index = [], []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns, index=batch_index), 1.0
+    finally:
+        workbook.close()
+
 class ImportWorker(QObject):
     progress_updated = Signal(int)
-    finished = Signal(int, list, str) 
+    finished = Signal(int, list, str)
     error = Signal(str)
 
     def __init__(self, filename, mapping, destination_id): # Modificato
@@ -23,34 +89,35 @@ class ImportWorker(QObject):
         if not self.destination_id:
             self.error.emit("Seleziona una destinazione valida prima di importare.")
             return
-        try:
-            if self.filename.endswith('.csv'):
-               with open(self.filename, 'r', encoding='utf-8', newline='') as f:
-                   sample = f.read(2048)
-                   f.seek(0)
-               df = pd.read_csv(self.filename, dtype=str).fillna('')
-            else:
-                df = pd.read_excel(self.filename, dtype=str).fillna('')
-        except Exception as e:
-            self.error.emit(f"Impossibile leggere il file:\n{e}")
-            return
-            
-        added_count, skipped_rows_details, total_rows = 0, [], len(df)
+        added_count, skipped_rows_details = 0, []
+        # Indice delle matricole caricato una sola volta per tutta l'importazione
+        serial_index = services.database.get_active_serials_index()
+        batches = iter_import_batches(self.filename)
 
-        for index, row in df.iterrows():
-            if self._is_cancelled:
+        while not self._is_cancelled:
+            try:
+                batch, progress = next(batches)
+            except StopIteration:
+                break
+            except Exception as e:
+                logging.error(f"Errore durante la lettura del file di importazione {self.filename}", exc_info=True)
+                if added_count == 0 and not skipped_rows_details:
+                    self.error.emit(f"Impossibile leggere il file:\n{e}")
+                    return
+                skipped_rows_details.append(f"Lettura interrotta dopo {added_count} dispositivi importati: {e}")
                 break
+
+            first_row, last_row = batch.index[0] + 2, batch.index[-1] + 2
             try:
-                # Passa il destination_id al servizio
-                services.process_device_import_row(row.to_dict(), self.mapping, self.destination_id) # Modificato
-                added_count += 1
-            except ValueError as e:
-                skipped_rows_details.append(f"Riga {index + 2}: {e}")
+                added, skipped = services.import_devices_dataframe(batch, self.mapping, self.destination_id, serial_index)
+                added_count += added
+                skipped_rows_details.extend(skipped)
             except Exception as e:
-                logging.error(f"Errore imprevisto importando la riga {index + 2}", exc_info=True)
-                skipped_rows_details.append(f"Riga {index + 2}: Errore imprevisto ({e})")
-            
-            self.progress_updated.emit(int(((index + 1) / total_rows) * 100))
-        
+                logging.error(f"Errore imprevisto importando le righe {first_row}-{last_row}", exc_info=True)
+                skipped_rows_details.append(f"Righe {first_row}-{last_row}: Errore imprevisto ({e})")
+
+            self.progress_updated.emit(int(progress * 100))
+
+        batches.close()
         status = "Annullato" if self._is_cancelled else "Completato"
         self.finished.emit(added_count, skipped_rows_details, status)
\ No newline at end of file
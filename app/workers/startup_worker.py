@@ -0,0 +1,38 @@
+# app/workers/startup_worker.py
+import logging
+import time
+from PySide6.QtCore import QObject, Signal
+
+class StartupWorker(QObject):
+    """
+    Esegue in background le operazioni di avvio che toccano il database
+    (backup e migrazioni), mentre lo splash screen resta reattivo.
+    Emette la durata di ogni fase per il benchmark di avvio.
+    """
+    progress = Signal(str)
+    finished = Signal(dict)
+    error = Signal(str)
+
+    def run(self):
+        timings = {}
+        try:
+            # Il backup precede le migrazioni: conserva lo stato del database prima delle modifiche
+            self.progress.emit("Backup del database in corso...")
+            start = time.perf_counter()
+            from app.backup_manager import create_backup
+            create_backup(progress_callback=self._on_backup_progress)
+            timings["backup"] = time.perf_counter() - start
+
+            self.progress.emit("Aggiornamento del database...")
+            start = time.perf_counter()
+            import database
+            database.migrate_database()
+            timings["migration"] = time.perf_counter() - start
+        except Exception as e:
+            logging.critical("Operazioni di avvio fallite.", exc_info=True)
+            self.error.emit(str(e))
+            return
+        self.finished.emit(timings)
+
+    def _on_backup_progress(self, copied, total):
+        self.progress.emit(f"Backup del database in corso... {copied * 100 // total}%")
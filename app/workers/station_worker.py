@@ -0,0 +1,150 @@
+# app/workers/station_worker.py
+import logging
+import re
+import threading
+from PySide6.QtCore import QObject, Signal
+
+from app import config, services
+from app.data_models import AppliedPart
+from app.hardware.fluke_esa612 import FLUKE_ERROR_CODES, TEST_FUNCTION_MAP, FlukeESA612
+
+def build_test_plan(profile, applied_parts):
+    """Costruisce la sequenza dei passi (test standard + test sulle parti applicate)."""
+    plan = [{'test': t, 'applied_part': None} for t in profile.tests if not t.is_applied_part_test]
+    pa_test_definitions = [t for t in profile.tests if t.is_applied_part_test]
+    for pa_on_device in applied_parts:
+        key_to_find = f"::{pa_on_device.part_type}"
+        for test_def in pa_test_definitions:
+            if key_to_find in test_def.limits:
+                plan.append({'test': test_def, 'applied_part': pa_on_device})
+    return plan
+
+def build_result(test, applied_part, value_str):
+    """
+    Crea il dizionario del risultato (nome, limite, esito): unico punto usato sia
+    da TestRunnerWidget sia dalle postazioni multiple.
+    """
+    value_str = (value_str or "").strip().replace(',', '.')
+    result_name = f"{test.name} ({test.parameter})" if test.parameter else test.name
+    limit_key = "::ST"
+    if applied_part:
+        result_name = f"{test.name} - {applied_part.name} - {applied_part.part_type}"
+        limit_key = f"::{applied_part.part_type}"
+    limit_obj = test.limits.get(limit_key)
+    is_passed = True
+    limit_value = None
+    unit = limit_obj.unit if limit_obj else ""
+    if limit_obj and limit_obj.high_value is not None:
+        value_float = float(re.sub(r'[^\d.-]', '', value_str))
+        is_passed = (value_float <= limit_obj.high_value)
+        limit_value = limit_obj.high_value
+    return {"name": result_name, "value": value_str, "limit_value": limit_value, "unit": unit, "passed": is_passed,
+            # Campi separati per l'estrazione delle misure (verification_measurements)
+            "test_name": test.name, "parameter": test.parameter or None,
+            "applied_part": applied_part.name if applied_part else None,
+            "applied_part_type": applied_part.part_type if applied_part else None}
+
+
+class StationWorker(QObject):
+    """
+    Esegue in un thread dedicato la sequenza automatica di una postazione
+    (uno strumento su una porta COM) e salva la verifica al termine.
+    Le pause manuali e gli avvisi dello strumento vengono segnalati alla UI,
+    che risponde con resume() / resolve_warning().
+    """
+    step_started = Signal(int, str)
+    step_completed = Signal(dict)
+    pause_requested = Signal(str)
+    instrument_warning = Signal(str, str)
+    finished = Signal(str, int)
+    error = Signal(str)
+
+    def __init__(self, port, device_info, profile_key, mti_info, visual_inspection_data,
+                 technician_name, technician_username, capture_enabled=False):
+        super().__init__()
+        self.port = port
+        self.device_info = device_info
+        self.profile_key = profile_key
+        self.profile = config.PROFILES[profile_key]
+        self.mti_info = dict(mti_info or {}, com_port=port)
+        self.visual_inspection_data = visual_inspection_data
+        self.technician_name = technician_name
+        self.technician_username = technician_username
+        applied_parts = [AppliedPart(**pa) for pa in device_info.get('applied_parts', [])]
+        self.test_plan = build_test_plan(self.profile, applied_parts)
+        self.results = []
+        self.capture_enabled = capture_enabled
+        self.captures = {}
+        self._is_cancelled = False
+        self._resume_event = threading.Event()
+
+    def cancel(self):
+        """Richiede l'interruzione della sequenza."""
+        logging.warning(f"Richiesta di annullamento della verifica sulla postazione {self.port}.")
+        self._is_cancelled = True
+        self._resume_event.set()
+
+    def resume(self):
+        """Prosegue dopo una pausa manuale."""
+        self._resume_event.set()
+
+    def resolve_warning(self, retry: bool):
+        """Risposta della UI a un avviso dello strumento: riprova o annulla."""
+        if not retry:
+            self._is_cancelled = True
+        self._resume_event.set()
+
+    def _wait_for_ui(self):
+        self._resume_event.wait()
+        self._resume_event.clear()
+        if self._is_cancelled:
+            raise InterruptedError("Verifica annullata dall'utente.")
+
+    def _measure(self, fluke, test, applied_part):
+        method_name = TEST_FUNCTION_MAP.get(test.name)
+        if not method_name:
+            raise NotImplementedError(f"Test non implementato: '{test.name}'.")
+        kwargs = {'parametro_test': test.parameter} if test.parameter else {}
+        if applied_part: kwargs['pa_code'] = applied_part.code
+        while True:
+            result = getattr(fluke, method_name)(**kwargs)
+            if not (result and result.startswith('!')):
+                return result
+            self.instrument_warning.emit(result, FLUKE_ERROR_CODES.get(result, "Errore sconosciuto dello strumento."))
+            self._wait_for_ui()
+
+    def run(self):
+        logging.info(f"Postazione {self.port}: avvio verifica su dispositivo ID {self.device_info.get('id')}.")
+        try:
+            with FlukeESA612(self.port) as fluke:
+                fluke.capture_enabled = self.capture_enabled
+                for i, step in enumerate(self.test_plan):
+                    if self._is_cancelled:
+                        raise InterruptedError("Verifica annullata dall'utente.")
+                    test, applied_part = step['test'], step['applied_part']
+                    self.step_started.emit(i + 1, test.name)
+                    if "PAUSA MANUALE" in test.name:
+                        message = test.parameter.strip() if test.parameter.strip() else "Preparare l'apparecchio per il prossimo test."
+                        self.pause_requested.emit(message)
+                        self._wait_for_ui()
+                        continue
+                    result_data = build_result(test, applied_part, self._measure(fluke, test, applied_part))
+                    if fluke.last_capture is not None:
+                        self.captures[len(self.results)] = fluke.last_capture
+                    self.results.append(result_data)
+                    self.step_completed.emit(result_data)
+
+            verification_code, new_id = services.finalizza_e_salva_verifica(
+                device_id=self.device_info['id'], profile_name=self.profile_key,
+                results=self.results, visual_inspection_data=self.visual_inspection_data,
+                mti_info=self.mti_info, technician_name=self.technician_name,
+                technician_username=self.technician_username,
+                captures=self.captures
+            )
+            logging.info(f"Postazione {self.port}: verifica salvata (ID {new_id}, codice {verification_code}).")
+            self.finished.emit(verification_code or "", new_id)
+        except InterruptedError as e:
+            self.error.emit(str(e))
+        except Exception as e:
+            logging.error(f"Errore sulla postazione {self.port}.", exc_info=True)
+            self.error.emit(str(e))
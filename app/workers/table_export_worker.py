@@ -1,134 +1,100 @@
-import pandas as pd
+import os
+import re
 from PySide6.QtCore import QObject, Signal
 from app import services
 import logging
 
+EXPORT_COLUMNS = [
+    "INVENTARIO AMS", "INVENTARIO CLIENTE", "DENOMINAZIONE", "MARCA", "MODELLO", "MATRICOLA",
+    "REPARTO", "DATA", "DESTINAZIONE", "TECNICO", "ESITO"
+]
+COLUMN_WIDTHS = [18, 18, 45, 22, 22, 22, 25, 12, 30, 20, 25]
+
+def _sheet_name(name: str, used: set) -> str:
+    """Nome del foglio valido per Excel (max 31 caratteri, senza []:*?/\\) e univoco."""
+    base = re.sub(r'[\[\]:*?/\\]', '_', name or "Destinazione").strip("'")[:31] or "Destinazione"
+    candidate, n = base, 2
+    while candidate.lower() in used:
+        suffix = f" ({n})"
+        candidate, n = base[:31 - len(suffix)] + suffix, n + 1
+    used.add(candidate.lower())
+    return candidate
+
+def write_devices_workbook(output_path: str, sheets, progress_callback=None) -> int:
+    """
+    Scrive la tabella dei dispositivi direttamente con xlsxwriter in modalità
+    constant_memory: le righe arrivano da un iteratore e vengono scaricate su disco
+    man mano, con formati calcolati una sola volta. 'sheets' è una sequenza di
+    (nome foglio, iteratore di dizionari riga). Restituisce le righe scritte.
+    """
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(output_path, {'constant_memory': True})
+    header_format = workbook.add_format({'bold': True, 'text_wrap': True, 'valign': 'vcenter', 'fg_color': '#D7E4BC', 'border': 1})
+    cell_format = workbook.add_format({'text_wrap': True, 'valign': 'top'})
+    # Formato della riga in base all'esito (prima con la formattazione condizionale)
+    row_formats = {
+        "CONFORME": workbook.add_format({'bg_color': "#47BD43", 'font_color': "#000000", 'text_wrap': True, 'valign': 'top'}),
+        "NON CONFORME": workbook.add_format({'bg_color': '#FFC7CE', 'font_color': "#000000", 'text_wrap': True, 'valign': 'top'}),
+    }
+    used_names, total_rows = set(), 0
+    try:
+        for sheet_title, rows in sheets:
+            worksheet = workbook.add_worksheet(_sheet_name(sheet_title, used_names))
+            for col, width in enumerate(COLUMN_WIDTHS):
+                worksheet.set_column(col, col, width, cell_format)
+            # In constant_memory le righe vanno scritte in ordine: prima l'intestazione
+            worksheet.write_row(0, 0, EXPORT_COLUMNS, header_format)
+            row_num = 0
+            for row in rows:
+                row_num += 1
+                fmt = row_formats.get(row.get("ESITO"), cell_format)
+                worksheet.write_row(row_num, 0, ["" if row.get(col) is None else row.get(col) for col in EXPORT_COLUMNS], fmt)
+                total_rows += 1
+                if progress_callback and total_rows % 500 == 0:
+                    progress_callback(total_rows)
+            # add_table() non è disponibile in constant_memory: filtri automatici e intestazione bloccata
+            worksheet.autofilter(0, 0, max(row_num, 1), len(EXPORT_COLUMNS) - 1)
+            worksheet.freeze_panes(1, 0)
+    finally:
+        workbook.close()
+    return total_rows
+
 class TableExportWorker(QObject):
     """
     Esegue l'esportazione della tabella dei dispositivi di una destinazione
-    in un file Excel formattato, con filtri, colori condizionali e testo a capo.
+    (o di tutte le destinazioni di un cliente, un foglio per destinazione)
+    in un file Excel formattato, con filtri, colori per esito e testo a capo.
     """
     finished = Signal(str)
     error = Signal(str)
+    progress_updated = Signal(int)
 
-    def __init__(self, destination_id, output_path):
+    def __init__(self, destination_id, output_path, customer_id=None):
         super().__init__()
         self.destination_id = destination_id
+        self.customer_id = customer_id
         self.output_path = output_path
 
+    def _sheets(self):
+        if self.customer_id is not None:
+            for dest in services.get_destinations_for_customer(self.customer_id):
+                yield dest['name'], services.iter_destination_devices_for_export(dest['id'])
+        else:
+            yield 'Verifiche', services.iter_destination_devices_for_export(self.destination_id)
+
     def run(self):
         try:
-            logging.info(f"Avvio esportazione tabella formattata per destinazione ID: {self.destination_id}")
-            export_data = services.get_destination_devices_for_export(self.destination_id)
-            
-            if not export_data:
-                self.finished.emit("Nessun dispositivo trovato per la destinazione selezionata.")
-                return
-
-            df = pd.DataFrame(export_data)
-            
-            final_columns_order = [
-                "INVENTARIO AMS", "INVENTARIO CLIENTE", "DENOMINAZIONE", "MARCA", "MODELLO", "MATRICOLA",
-                "REPARTO", "DATA", "DESTINAZIONE", "TECNICO", "ESITO"
-            ]
-            
-            for col in final_columns_order:
-                if col not in df.columns:
-                    df[col] = None
-            df = df[final_columns_order]
-
-            # Inizializza il writer di Excel con il motore xlsxwriter
-            writer = pd.ExcelWriter(self.output_path, engine='xlsxwriter')
-            # Scrivi i dati partendo dalla seconda riga (startrow=1) per lasciare spazio all'intestazione
-            df.to_excel(writer, sheet_name='Verifiche', index=False, header=False, startrow=1)
-            
-            workbook = writer.book
-            worksheet = writer.sheets['Verifiche']
-
-            # Definisci un formato per l'intestazione (grassetto, sfondo, testo a capo)
-            header_format = workbook.add_format({
-                'bold': True,
-                'text_wrap': True,
-                'valign': 'vcenter',
-                'fg_color': '#D7E4BC',
-                'border': 1
-            })
-
-            # Definisci i formati per la formattazione condizionale CON text_wrap incluso
-            green_format = workbook.add_format({
-                'bg_color': "#47BD43", 
-                'font_color': "#000000", 
-                'text_wrap': True, 
-                'valign': 'top'
-            })
-            red_format = workbook.add_format({
-                'bg_color': '#FFC7CE', 
-                'font_color': "#000000", 
-                'text_wrap': True, 
-                'valign': 'top'
-            })
+            target = f"cliente ID: {self.customer_id}" if self.customer_id is not None else f"destinazione ID: {self.destination_id}"
+            logging.info(f"Avvio esportazione tabella formattata per {target}")
 
-            blue_format = workbook.add_format({
-                'bg_color': '#BDD7EE',
-                'font_color': "#000000",
-                'text_wrap': True,
-                'valign': 'top'
-            })
+            num_rows = write_devices_workbook(self.output_path, self._sheets(), self.progress_updated.emit)
 
-            # Definisci un formato base per le celle di dati con testo a capo
-            cell_format = workbook.add_format({
-                'text_wrap': True, 
-                'valign': 'top'
-            })
-
-            num_rows, num_cols = df.shape
-
-            # Applica il formato di base a tutte le colonne PRIMA della formattazione condizionale
-            for col in range(num_cols):
-                worksheet.set_column(col, col, None, cell_format)
-
-            # Applica la formattazione condizionale (questo sovrascriverà il formato base dove applicabile)
-            worksheet.conditional_format(f'A2:K{num_rows + 1}', {
-                'type': 'formula',
-                'criteria': '=SEARCH("CONFORME",$K2)',
-                'format': green_format
-            })
-
-            worksheet.conditional_format(f'A2:K{num_rows + 1}', {
-                'type': 'formula',
-                'criteria': '=SEARCH("NON CONFORME",$K2)',
-                'format': red_format
-            })
-
-            # Crea la tabella
-            columns_for_table = [{'header': col} for col in df.columns]
-            worksheet.add_table(0, 0, num_rows, num_cols - 1, {
-                'columns': columns_for_table,
-                'header_row': True,
-                'style': 'Table Style Light 15'
-            })
-            
-            # Scrivi l'intestazione manualmente per applicare il formato corretto
-            for col_num, value in enumerate(df.columns.values):
-                worksheet.write(0, col_num, value, header_format)
-
-            # Imposta la larghezza delle colonne
-            worksheet.set_column('A:B', 18)
-            worksheet.set_column('C:C', 45)
-            worksheet.set_column('D:F', 22)
-            worksheet.set_column('G:G', 25)
-            worksheet.set_column('H:H', 12)
-            worksheet.set_column('I:I', 30)
-            worksheet.set_column('J:J', 20)
-            worksheet.set_column('K:K', 25)
-
-            # IMPORTANTE: Imposta l'altezza delle righe per permettere il testo a capo
-            for row in range(1, num_rows + 2):  # +2 perché includiamo l'header
-                worksheet.set_row(row, None, None, {'level': 0})
+            if not num_rows:
+                os.remove(self.output_path)
+                self.finished.emit("Nessun dispositivo trovato per la selezione effettuata.")
+                return
 
-            writer.close()
-            
-            logging.info(f"Esportazione formattata completata con successo: {self.output_path}")
+            logging.info(f"Esportazione formattata completata con successo ({num_rows} righe): {self.output_path}")
             self.finished.emit(f"Tabella esportata con successo in:\n{self.output_path}")
 
         except Exception as e:
@@ -0,0 +1,6 @@
+# benchmarks/__init__.py
+"""
+Benchmark delle prestazioni su dati sintetici: generatore del dataset
+(datagen), misurazione e risultati JSON confrontabili (runner) e suite del
+DAO locale (dao). Uso: python -m benchmarks --help
+"""
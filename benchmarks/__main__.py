@@ -0,0 +1,5 @@
+import sys
+
+from benchmarks.dao import main
+
+sys.exit(main())
@@ -0,0 +1,161 @@
+# benchmarks/dao.py
+"""
+Benchmark end-to-end delle funzioni più usate del DAO locale (database.py) e
+della sincronizzazione, su un database sintetico generato da datagen.
+
+    python -m benchmarks --scale medium --json risultati.json
+    python -m benchmarks --db dataset.db --compare risultati.json
+
+Il database viene generato (o riusato con --db) fuori dalla cartella dati
+dell'applicazione; le scritture di _apply_server_changes vengono annullate a
+ogni giro, quelle di save_verification restano come in uso reale.
+"""
+import argparse
+import copy
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timezone
+
+import database
+from app import config
+from benchmarks import datagen
+from benchmarks.runner import run_benchmark, build_report, save_report, print_table, compare_results
+
+
+def _context(db_path: str) -> dict:
+    """Parametri realistici per i benchmark, ricavati dal dataset."""
+    conn = sqlite3.connect(db_path)
+    try:
+        by_size = conn.execute("""
+            SELECT destination_id, COUNT(*) AS n FROM devices WHERE is_deleted = 0
+            GROUP BY destination_id ORDER BY n DESC, destination_id
+        """).fetchall()
+        largest_customer = conn.execute("""
+            SELECT dest.customer_id FROM devices d JOIN destinations dest ON dest.id = d.destination_id
+            GROUP BY dest.customer_id ORDER BY COUNT(*) DESC LIMIT 1
+        """).fetchone()[0]
+        serial = conn.execute("SELECT serial_number FROM devices WHERE serial_number IS NOT NULL ORDER BY id LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM devices)").fetchone()[0]
+        device_id = conn.execute("SELECT id FROM devices WHERE is_deleted = 0 ORDER BY id DESC LIMIT 1").fetchone()[0]
+    finally:
+        conn.close()
+    return {"largest_destination": by_size[0][0], "typical_destination": by_size[len(by_size) // 2][0],
+            "largest_customer": largest_customer, "serial": serial, "device_id": device_id}
+
+def collect_benchmarks(db_path: str, rounds: int, only: str = None) -> list:
+    from app import sync_manager
+    ctx = _context(db_path)
+    sample_results = _read_results_sample(db_path)
+    collected = []
+
+    def add(group, name, func, params=None, **kwargs):
+        if only and only not in f"{group}::{name}":
+            return
+        print(f"Benchmark {group}::{name}...", file=sys.stderr)
+        collected.append(run_benchmark(name, func, rounds=rounds, group=group, params=params, **kwargs))
+
+    # --- Ricerca globale ---
+    add("search_device_globally", "serial_exact", lambda: database.search_device_globally(ctx["serial"]), {"term": ctx["serial"]})
+    add("search_device_globally", "common_term", lambda: database.search_device_globally("Defibrillatore"), {"term": "Defibrillatore"})
+    add("search_device_globally", "no_match", lambda: database.search_device_globally("XYZNONESISTE"), {"term": "XYZNONESISTE"})
+
+    # --- Dispositivi con ultima verifica ---
+    for label in ("largest_destination", "typical_destination"):
+        add("get_devices_with_last_verification_for_destination", label,
+            lambda d=ctx[label]: database.get_devices_with_last_verification_for_destination(d), {"destination_id": ctx[label]})
+
+    # --- Scadenzario ---
+    add("get_devices_needing_verification", "all_30_days", lambda: database.get_devices_needing_verification(30), {"days": 30})
+    add("get_devices_needing_verification", "first_page", lambda: database.get_devices_needing_verification(30, limit=100), {"days": 30, "limit": 100})
+    add("get_devices_needing_verification", "largest_customer",
+        lambda: database.get_devices_needing_verification(30, customer_id=ctx["largest_customer"]), {"customer_id": ctx["largest_customer"]})
+
+    # --- Riepilogo della dashboard ---
+    add("dashboard", "get_stats", database.get_stats)
+    add("dashboard", "get_dashboard_summary", lambda: database.get_dashboard_summary(30), {"days": 30})
+
+    # --- Analisi del parco sulle misure ---
+    from app import analytics
+    # La cache dei risultati viene svuotata prima di ogni giro: si misura il calcolo
+    add("analyze_fleet", "top_50", lambda _: analytics.analyze_fleet(limit=50), {"limit": 50},
+        setup=analytics._fleet_cache.clear)
+    add("analyze_fleet", "largest_customer",
+        lambda _: analytics.analyze_fleet(customer_id=ctx["largest_customer"]), {"customer_id": ctx["largest_customer"]},
+        setup=analytics._fleet_cache.clear)
+    add("analyze_fleet", "top_50_cached", lambda: analytics.analyze_fleet(limit=50), {"limit": 50})
+
+    # --- Salvataggio di una verifica (scrittura reale, con commit) ---
+    def save_args():
+        return dict(uuid=str(uuid.uuid4()), device_id=ctx["device_id"], profile_name="CEI_62353_CLASSE_I", results=sample_results,
+                    overall_status="PASSATO", visual_inspection_data={"notes": "", "checklist": []},
+                    mti_info={"instrument": "Fluke ESA612", "serial": "1234567", "version": "1.08", "cal_date": "2025-06-01"},
+                    technician_name="Mario Rossi", technician_username="mrossi", timestamp=datetime.now(timezone.utc).isoformat())
+    add("save_verification", "single", lambda kw: database.save_verification(**kw), setup=save_args)
+
+    # --- Sincronizzazione ---
+    add("sync", "get_unsynced_local_changes", sync_manager._get_unsynced_local_changes)
+    changes = datagen.server_changes(db_path)
+
+    def apply_setup():
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        return conn, copy.deepcopy(changes)
+
+    def apply_teardown(args):
+        args[0].rollback()
+        args[0].close()
+    add("sync", "apply_server_changes", lambda args: sync_manager._apply_server_changes(*args),
+        {"devices": len(changes["devices"]), "verifications": len(changes["verifications"])},
+        setup=apply_setup, teardown=apply_teardown)
+    return collected
+
+def _read_results_sample(db_path: str) -> list:
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute("SELECT results_json FROM verifications WHERE profile_name = 'CEI_62353_CLASSE_I' LIMIT 1").fetchone()
+    finally:
+        conn.close()
+    return json.loads(row[0]) if row else []
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark del DAO locale su dati sintetici.")
+    parser.add_argument("--db", help="database da usare; se non esiste viene generato")
+    parser.add_argument("--scale", choices=list(datagen.SCALES), default="small", help="dimensione del dataset da generare")
+    parser.add_argument("--seed", type=int, default=62353)
+    parser.add_argument("--regenerate", action="store_true", help="rigenera il dataset anche se esiste")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--only", help="esegue solo i benchmark il cui nome contiene questo testo")
+    parser.add_argument("--json", help="file in cui salvare i risultati")
+    parser.add_argument("--compare", help="file JSON di un'esecuzione precedente da confrontare")
+    parser.add_argument("--query-stats", action="store_true", help="lascia attive le statistiche delle query (più lento)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    # Le statistiche delle query aggiungono un costo a ogni esecuzione: di norma vanno escluse dalla misura
+    config.DIAGNOSTICS_SETTINGS["query_stats"] = args.query_stats
+
+    db_path = args.db or os.path.join(tempfile.gettempdir(), f"stm_benchmark_{args.scale}_{args.seed}.db")
+    dataset = None
+    if args.regenerate or not os.path.exists(db_path):
+        print(f"Generazione del dataset '{args.scale}' in {db_path}...")
+        dataset = datagen.generate_dataset(db_path, args.scale, args.seed)
+    database.DB_PATH = db_path
+    dataset = dataset or datagen.table_counts(db_path)
+
+    dataset = {"path": db_path, "scale": args.scale, "seed": args.seed, **dataset}
+
+    benchmarks = collect_benchmarks(db_path, args.rounds, args.only)
+    print_table(benchmarks)
+    if args.compare:
+        compare_results(args.compare, benchmarks, dataset=dataset)
+    if args.json:
+        save_report(build_report(benchmarks, {"dataset": dataset}), args.json)
+        print(f"\nRisultati salvati in {args.json}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,319 @@
+# benchmarks/datagen.py
+"""
+Generatore di un database locale sintetico ma realistico per i benchmark:
+clienti, destinazioni, dispositivi con parti applicate e verifiche con
+results_json e visual_inspection_json nella forma prodotta dall'applicazione.
+I dati sono deterministici a parità di scala e seme, così due esecuzioni del
+benchmark sono confrontabili.
+"""
+import json
+import logging
+import os
+import random
+import sqlite3
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+import database
+
+# Dimensioni dei dataset: clienti e quantità per livello gerarchico (valori medi)
+SCALES = {
+    "small": {"customers": 200, "destinations_per_customer": 3, "devices_per_destination": 5, "verifications_per_device": 3},
+    "medium": {"customers": 1000, "destinations_per_customer": 5, "devices_per_destination": 5, "verifications_per_device": 4},
+    "large": {"customers": 3000, "destinations_per_customer": 8, "devices_per_destination": 4, "verifications_per_device": 5},
+}
+UNSYNCED_RATIO = 0.02  # Quota di record ancora da sincronizzare
+DELETED_RATIO = 0.01   # Quota di record eliminati (soft delete)
+HISTORY_YEARS = 4      # Le verifiche coprono gli ultimi N anni
+
+# La cartella migrations non è distribuita con il codice: lo schema di base
+# (corrispondente a online_database.sql) viene creato qui.
+BASE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS customers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, uuid TEXT UNIQUE, name TEXT NOT NULL, address TEXT,
+        phone TEXT, email TEXT, last_modified TEXT, is_synced INTEGER NOT NULL DEFAULT 0, is_deleted INTEGER NOT NULL DEFAULT 0);
+    CREATE TABLE IF NOT EXISTS destinations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, uuid TEXT UNIQUE, customer_id INTEGER REFERENCES customers(id),
+        name TEXT NOT NULL, address TEXT, last_modified TEXT, is_synced INTEGER NOT NULL DEFAULT 0, is_deleted INTEGER NOT NULL DEFAULT 0);
+    CREATE TABLE IF NOT EXISTS devices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, uuid TEXT UNIQUE, destination_id INTEGER REFERENCES destinations(id),
+        serial_number TEXT, description TEXT, manufacturer TEXT, model TEXT, department TEXT, applied_parts_json TEXT,
+        customer_inventory TEXT, ams_inventory TEXT, verification_interval INTEGER, default_profile_key TEXT,
+        next_verification_date TEXT, status TEXT NOT NULL DEFAULT 'active',
+        last_modified TEXT, is_synced INTEGER NOT NULL DEFAULT 0, is_deleted INTEGER NOT NULL DEFAULT 0);
+    CREATE TABLE IF NOT EXISTS verifications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, uuid TEXT UNIQUE, device_id INTEGER REFERENCES devices(id),
+        verification_date TEXT NOT NULL, profile_name TEXT NOT NULL, results_json TEXT NOT NULL, overall_status TEXT NOT NULL,
+        visual_inspection_json TEXT, mti_instrument TEXT, mti_serial TEXT, mti_version TEXT, mti_cal_date TEXT,
+        technician_name TEXT, technician_username TEXT, verification_code TEXT,
+        last_modified TEXT, is_synced INTEGER NOT NULL DEFAULT 0, is_deleted INTEGER NOT NULL DEFAULT 0);
+    CREATE TABLE IF NOT EXISTS mti_instruments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, uuid TEXT UNIQUE, instrument_name TEXT, serial_number TEXT, fw_version TEXT,
+        calibration_date TEXT, com_port TEXT, is_default INTEGER DEFAULT 0,
+        last_modified TEXT, is_synced INTEGER NOT NULL DEFAULT 0, is_deleted INTEGER NOT NULL DEFAULT 0);
+    CREATE TABLE IF NOT EXISTS profiles (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, uuid TEXT UNIQUE, profile_key TEXT UNIQUE, name TEXT,
+        last_modified TEXT, is_synced INTEGER NOT NULL DEFAULT 0, is_deleted INTEGER NOT NULL DEFAULT 0);
+    CREATE TABLE IF NOT EXISTS profile_tests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, uuid TEXT UNIQUE, profile_id INTEGER REFERENCES profiles(id), name TEXT,
+        parameter TEXT, limits_json TEXT, is_applied_part_test INTEGER DEFAULT 0,
+        last_modified TEXT, is_synced INTEGER NOT NULL DEFAULT 0, is_deleted INTEGER NOT NULL DEFAULT 0);
+    CREATE TABLE IF NOT EXISTS signatures (
+        username TEXT PRIMARY KEY, signature_data BLOB, last_modified TEXT, is_synced INTEGER NOT NULL DEFAULT 0);
+    CREATE INDEX IF NOT EXISTS idx_destinations_customer_id ON destinations(customer_id);
+    CREATE INDEX IF NOT EXISTS idx_devices_destination_id ON devices(destination_id);
+    CREATE INDEX IF NOT EXISTS idx_verifications_device_id ON verifications(device_id);
+    CREATE INDEX IF NOT EXISTS idx_profile_tests_profile_id ON profile_tests(profile_id);
+"""
+
+CITIES = ["Milano", "Roma", "Torino", "Napoli", "Bologna", "Firenze", "Bari", "Palermo", "Genova", "Verona", "Padova", "Brescia"]
+CUSTOMER_KINDS = ["Ospedale", "Casa di Cura", "Poliambulatorio", "Clinica", "RSA", "Centro Diagnostico", "Studio Medico"]
+DEPARTMENTS = ["Cardiologia", "Radiologia", "Pronto Soccorso", "Sala Operatoria", "Terapia Intensiva", "Pediatria",
+               "Ortopedia", "Medicina Generale", "Laboratorio", "Ambulatorio"]
+DEVICE_MODELS = [
+    ("Elettrocardiografo", "Philips", "PageWriter TC30", ["BF"]),
+    ("Defibrillatore", "Zoll", "R Series", ["CF"]),
+    ("Monitor multiparametrico", "GE Healthcare", "Carescape B450", ["CF", "BF"]),
+    ("Pompa infusionale", "B. Braun", "Infusomat Space", ["CF"]),
+    ("Elettrobisturi", "Erbe", "VIO 300 D", ["BF"]),
+    ("Ventilatore polmonare", "Draeger", "Evita V300", ["B"]),
+    ("Aspiratore chirurgico", "Medela", "Dominant Flex", []),
+    ("Lampada scialitica", "Maquet", "PowerLED II", []),
+    ("Ecografo", "Esaote", "MyLab Six", ["BF"]),
+    ("Letto elettrico", "Hill-Rom", "Progressa", ["B"]),
+]
+PROFILES = [
+    ("CEI_62353_CLASSE_I", "CEI 62353 Classe I", [
+        ("Resistenza conduttore di protezione", "", "Ω", 0.3, False),
+        ("Resistenza di isolamento", "", "MΩ", None, False),
+        ("Corrente di dispersione apparecchio", "Metodo diretto", "µA", 500, False),
+        ("Corrente di dispersione parte applicata", "Metodo diretto", "µA", 50, True)]),
+    ("CEI_62353_CLASSE_II", "CEI 62353 Classe II", [
+        ("Resistenza di isolamento", "", "MΩ", None, False),
+        ("Corrente di dispersione apparecchio", "Metodo diretto", "µA", 100, False),
+        ("Corrente di dispersione parte applicata", "Metodo diretto", "µA", 50, True)]),
+    ("VISIVA", "Sola ispezione visiva", []),
+]
+CHECKLIST = ["Integrità involucro", "Cavo di alimentazione", "Connettori e spine", "Etichettatura e marcature",
+             "Accessori e parti applicate", "Documentazione presente"]
+TECHNICIANS = [("Mario Rossi", "mrossi"), ("Luca Bianchi", "lbianchi"), ("Giulia Verdi", "gverdi"), ("Anna Neri", "aneri")]
+
+
+def _iso(moment: datetime) -> str:
+    return moment.isoformat()
+
+def _results_for(rng: random.Random, tests: list, parts: list) -> tuple:
+    """results_json di una verifica (come costruito in widgets.py) e stato complessivo."""
+    results = []
+    for name, parameter, unit, high, per_part in tests:
+        targets = [f"{name} - Parte applicata {i + 1} - {part}" for i, part in enumerate(parts)] if per_part else [None]
+        for target_name in targets:
+            if high is None:
+                value, passed = rng.uniform(50, 500), True
+            else:
+                value = rng.uniform(0, high * 1.1) if rng.random() < 0.04 else rng.uniform(0, high * 0.6)
+                passed = value <= high
+            result_name = target_name or (f"{name} ({parameter})" if parameter else name)
+            results.append({"name": result_name, "value": f"{value:.3f}", "limit_value": high, "unit": unit, "passed": passed})
+    overall = "PASSATO" if all(r["passed"] for r in results) else "FALLITO"
+    return results, overall
+
+def _visual_for(rng: random.Random) -> dict:
+    checklist = [{"item": item, "result": "OK" if rng.random() > 0.02 else "KO"} for item in CHECKLIST]
+    return {"notes": "" if rng.random() > 0.1 else "Sostituito cavo di alimentazione.", "checklist": checklist}
+
+
+def create_base_schema(conn):
+    conn.executescript(BASE_SCHEMA)
+
+def generate_dataset(db_path: str, scale: str = "small", seed: int = 62353, progress=print) -> dict:
+    """
+    Crea in db_path un database con i dati della scala richiesta (SCALES) e vi
+    applica le estensioni di schema dell'applicazione. Restituisce il conteggio
+    delle righe per tabella e il tempo di generazione.
+    """
+    if scale not in SCALES:
+        raise ValueError(f"Scala sconosciuta '{scale}'. Disponibili: {', '.join(SCALES)}")
+    params = SCALES[scale]
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    today = now.date()
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    create_base_schema(conn)
+
+    def synced():
+        return 0 if rng.random() < UNSYNCED_RATIO else 1
+
+    def deleted():
+        return 1 if rng.random() < DELETED_RATIO else 0
+
+    def stamp():
+        return _iso(now - timedelta(seconds=rng.randint(0, 365 * 86400)))
+
+    with conn:
+        # Profili e strumenti
+        profile_tests = {}
+        for key, name, tests in PROFILES:
+            cur = conn.execute("INSERT INTO profiles (uuid, profile_key, name, last_modified, is_synced) VALUES (?, ?, ?, ?, 1)",
+                               (str(uuid.UUID(int=rng.getrandbits(128))), key, name, stamp()))
+            for test_name, parameter, unit, high, per_part in tests:
+                limits = {f"::{t}": {"unit": unit, "high_value": high} for t in (["B", "BF", "CF"] if per_part else ["ST"])}
+                conn.execute("""INSERT INTO profile_tests (uuid, profile_id, name, parameter, limits_json, is_applied_part_test, last_modified, is_synced)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, 1)""",
+                             (str(uuid.UUID(int=rng.getrandbits(128))), cur.lastrowid, test_name, parameter, json.dumps(limits), int(per_part), stamp()))
+            profile_tests[key] = tests
+        conn.execute("""INSERT INTO mti_instruments (uuid, instrument_name, serial_number, fw_version, calibration_date, com_port, is_default, last_modified, is_synced)
+                        VALUES (?, 'Fluke ESA612', '1234567', '1.08', '2025-06-01', 'COM3', 1, ?, 1)""",
+                     (str(uuid.UUID(int=rng.getrandbits(128))), stamp()))
+
+        # Clienti e destinazioni
+        customers = []
+        for i in range(params["customers"]):
+            city = rng.choice(CITIES)
+            customers.append((str(uuid.UUID(int=rng.getrandbits(128))), f"{rng.choice(CUSTOMER_KINDS)} {city} {i + 1:05d}",
+                              f"Via Roma {rng.randint(1, 300)}, {city}", f"0{rng.randint(10, 99)} {rng.randint(100000, 9999999)}",
+                              f"info{i + 1}@cliente.it", stamp(), synced(), deleted()))
+        conn.executemany("INSERT INTO customers (uuid, name, address, phone, email, last_modified, is_synced, is_deleted) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", customers)
+        customer_ids = [r[0] for r in conn.execute("SELECT id FROM customers ORDER BY id")]
+        progress(f"  clienti: {len(customer_ids)}")
+
+        destinations = []
+        for customer_id in customer_ids:
+            for j in range(max(1, int(rng.expovariate(1 / params["destinations_per_customer"])) + 1)):
+                destinations.append((str(uuid.UUID(int=rng.getrandbits(128))), customer_id, f"Sede {j + 1} - {rng.choice(CITIES)}",
+                                     f"Viale Italia {rng.randint(1, 200)}", stamp(), synced(), deleted()))
+        conn.executemany("INSERT INTO destinations (uuid, customer_id, name, address, last_modified, is_synced, is_deleted) VALUES (?, ?, ?, ?, ?, ?, ?)", destinations)
+        destination_ids = [r[0] for r in conn.execute("SELECT id FROM destinations ORDER BY id")]
+        progress(f"  destinazioni: {len(destination_ids)}")
+
+        # Dispositivi
+        devices, device_plan = [], []
+        serial_counter = 100000
+        for destination_id in destination_ids:
+            for _ in range(max(1, int(rng.expovariate(1 / params["devices_per_destination"])) + 1)):
+                description, manufacturer, model, part_types = rng.choice(DEVICE_MODELS)
+                parts = [{"name": f"Parte applicata {k + 1}", "part_type": t, "code": f"RA{k + 1}"} for k, t in enumerate(part_types)]
+                profile_key = "CEI_62353_CLASSE_I" if rng.random() < 0.7 else "CEI_62353_CLASSE_II"
+                serial_counter += rng.randint(1, 9)
+                serial = None if rng.random() < 0.03 else f"SN{serial_counter}"
+                interval = rng.choice([12, 12, 12, 24, 6])
+                devices.append((str(uuid.UUID(int=rng.getrandbits(128))), destination_id, serial, description, manufacturer, model,
+                                rng.choice(DEPARTMENTS), json.dumps(parts), f"INV{rng.randint(1000, 99999)}", f"AMS{serial_counter}",
+                                interval, profile_key, "active" if rng.random() > 0.05 else "inactive", stamp(), synced(), deleted()))
+                device_plan.append((profile_key, part_types, interval))
+        conn.executemany("""INSERT INTO devices (uuid, destination_id, serial_number, description, manufacturer, model, department, applied_parts_json,
+                                                 customer_inventory, ams_inventory, verification_interval, default_profile_key, status,
+                                                 last_modified, is_synced, is_deleted)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", devices)
+        device_ids = [r[0] for r in conn.execute("SELECT id FROM devices ORDER BY id")]
+        progress(f"  dispositivi: {len(device_ids)}")
+
+        # Verifiche: una ogni intervallo, a ritroso dall'ultima
+        batch, total, code = [], 0, {}
+        for device_id, (profile_key, part_types, interval) in zip(device_ids, device_plan):
+            count = min(rng.randint(1, params["verifications_per_device"] * 2 - 1), HISTORY_YEARS * 12 // interval)
+            last = today - timedelta(days=rng.randint(0, interval * 31))
+            for k in range(count):
+                when = last - timedelta(days=k * interval * 30 + rng.randint(-10, 10))
+                results, overall = _results_for(rng, profile_tests[profile_key], part_types)
+                technician, username = rng.choice(TECHNICIANS)
+                prefix = "".join(w[0] for w in technician.split()).upper()
+                code[prefix] = code.get(prefix, 0) + 1
+                batch.append((str(uuid.UUID(int=rng.getrandbits(128))), device_id, when.isoformat(), profile_key, json.dumps(results), overall,
+                              json.dumps(_visual_for(rng)), "Fluke ESA612", "1234567", "1.08", "2025-06-01", technician, username,
+                              f"{prefix}{code[prefix]:06d}", _iso(datetime.combine(when, datetime.min.time(), timezone.utc)), synced(), deleted()))
+            if len(batch) >= 20000:
+                _insert_verifications(conn, batch); total += len(batch); batch = []
+        _insert_verifications(conn, batch); total += len(batch)
+        progress(f"  verifiche: {total}")
+
+    conn.execute("ANALYZE")
+    conn.close()
+
+    # Estensioni di schema dell'applicazione (indici, tabelle derivate, trigger e backfill)
+    previous = database.DB_PATH
+    database.DB_PATH = db_path
+    try:
+        database.apply_schema_extensions()
+    finally:
+        database.DB_PATH = previous
+
+    counts = table_counts(db_path)
+    counts["generation_time"] = round(time.perf_counter() - start, 2)
+    return counts
+
+def _insert_verifications(conn, rows):
+    conn.executemany("""INSERT INTO verifications (uuid, device_id, verification_date, profile_name, results_json, overall_status,
+                                                   visual_inspection_json, mti_instrument, mti_serial, mti_version, mti_cal_date,
+                                                   technician_name, technician_username, verification_code, last_modified, is_synced, is_deleted)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+
+def table_counts(db_path: str) -> dict:
+    conn = sqlite3.connect(db_path)
+    try:
+        return {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                for t in ("customers", "destinations", "devices", "verifications")}
+    finally:
+        conn.close()
+
+def server_changes(db_path: str, new_devices: int = 200, updated_devices: int = 200, seed: int = 1) -> dict:
+    """
+    Pacchetto di modifiche come quello restituito da /sync, per _apply_server_changes:
+    nuovi dispositivi (con una verifica ciascuno) su destinazioni esistenti e
+    aggiornamenti di dispositivi già presenti.
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        destination_uuids = [r[0] for r in conn.execute("SELECT uuid FROM destinations WHERE is_deleted = 0 ORDER BY id")]
+        existing = [dict(r) for r in conn.execute(
+            "SELECT d.*, dest.uuid AS destination_uuid FROM devices d JOIN destinations dest ON dest.id = d.destination_id ORDER BY d.id LIMIT ?",
+            (updated_devices,))]
+    finally:
+        conn.close()
+
+    stamp = datetime.now(timezone.utc).isoformat()
+    devices, verifications = [], []
+    for i in range(new_devices):
+        description, manufacturer, model, part_types = rng.choice(DEVICE_MODELS)
+        device_uuid = str(uuid.UUID(int=rng.getrandbits(128)))
+        devices.append({"uuid": device_uuid, "destination_uuid": rng.choice(destination_uuids), "serial_number": f"SRV{seed}{i:06d}",
+                        "description": description, "manufacturer": manufacturer, "model": model, "department": rng.choice(DEPARTMENTS),
+                        "applied_parts_json": json.dumps([{"name": f"Parte applicata {k + 1}", "part_type": t, "code": f"RA{k + 1}"} for k, t in enumerate(part_types)]),
+                        "customer_inventory": None, "ams_inventory": f"AMS-SRV{i}", "verification_interval": 12,
+                        "default_profile_key": "CEI_62353_CLASSE_I", "status": "active", "last_modified": stamp, "is_deleted": False})
+        results, overall = _results_for(rng, PROFILES[0][2], part_types)
+        technician, username = rng.choice(TECHNICIANS)
+        verifications.append({"uuid": str(uuid.UUID(int=rng.getrandbits(128))), "device_uuid": device_uuid,
+                              "verification_date": date.today().isoformat(), "profile_name": "CEI_62353_CLASSE_I",
+                              "results_json": json.dumps(results), "overall_status": overall, "visual_inspection_json": json.dumps(_visual_for(rng)),
+                              "mti_instrument": "Fluke ESA612", "mti_serial": "1234567", "mti_version": "1.08", "mti_cal_date": "2025-06-01",
+                              "technician_name": technician, "technician_username": username, "verification_code": None,
+                              "last_modified": stamp, "is_deleted": False})
+    for row in existing:
+        row.pop("id"); row.pop("destination_id"); row.pop("is_synced", None)
+        row["department"] = rng.choice(DEPARTMENTS)
+        row["last_modified"] = stamp
+        devices.append(row)
+    return {"devices": devices, "verifications": verifications}
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Genera un database sintetico per i benchmark.")
+    parser.add_argument("db", help="percorso del database da creare (viene sovrascritto)")
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=62353)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    print(f"Generazione del dataset '{args.scale}' in {args.db}...")
+    print(json.dumps(generate_dataset(args.db, args.scale, args.seed), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# benchmarks/runner.py
+"""
+Misurazione ripetuta di una funzione e risultati in JSON nel formato di
+pytest-benchmark (machine_info, commit_info, benchmarks[].stats), così i file
+di due esecuzioni si possono confrontare con compare_results() o con gli
+strumenti che leggono quel formato.
+"""
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+
+def _stats(samples: list) -> dict:
+    ordered = sorted(samples)
+    quartiles = statistics.quantiles(ordered, n=4) if len(ordered) > 1 else [ordered[0]] * 3
+    mean = statistics.fmean(ordered)
+    return {
+        "min": ordered[0], "max": ordered[-1], "mean": mean,
+        "stddev": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        "median": statistics.median(ordered), "q1": quartiles[0], "q3": quartiles[2],
+        "iqr": quartiles[2] - quartiles[0], "rounds": len(ordered), "total": sum(ordered),
+        "ops": 1 / mean if mean else 0.0, "data": samples,
+    }
+
+def run_benchmark(name: str, func, setup=None, teardown=None, rounds: int = 10, warmup: int = 1,
+                  group: str = None, params: dict = None) -> dict:
+    """
+    Esegue func warmup + rounds volte e ne misura la durata. Se indicata,
+    setup() viene chiamata prima di ogni esecuzione, fuori dalla misura, e il
+    suo risultato viene passato a func e poi a teardown().
+    """
+    samples = []
+    for i in range(warmup + rounds):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        if setup:
+            func(arg)
+        else:
+            func()
+        elapsed = time.perf_counter() - start
+        if teardown:
+            teardown(arg)
+        if i >= warmup:
+            samples.append(elapsed)
+    return {"name": name, "fullname": f"{group}::{name}" if group else name, "group": group,
+            "params": params or {}, "stats": _stats(samples)}
+
+def machine_info() -> dict:
+    return {"node": platform.node(), "processor": platform.processor(), "machine": platform.machine(),
+            "python_implementation": platform.python_implementation(), "python_version": platform.python_version(),
+            "system": platform.system(), "release": platform.release(), "cpu_count": os.cpu_count(),
+            "sqlite_version": sqlite3.sqlite_version}
+
+def commit_info() -> dict:
+    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=base, capture_output=True, text=True, timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+    return {"id": git("rev-parse", "HEAD"), "branch": git("rev-parse", "--abbrev-ref", "HEAD"),
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+def build_report(benchmarks: list, extra: dict = None) -> dict:
+    return {"machine_info": machine_info(), "commit_info": commit_info(),
+            "datetime": datetime.now(timezone.utc).isoformat(), "version": "stm-benchmarks-1",
+            **(extra or {}), "benchmarks": benchmarks}
+
+def save_report(report: dict, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+def print_table(benchmarks: list, out=sys.stdout):
+    out.write(f"{'Benchmark':<72} {'min (ms)':>10} {'median (ms)':>12} {'mean (ms)':>10} {'stddev':>9} {'rounds':>7}\n")
+    for b in benchmarks:
+        s = b["stats"]
+        out.write(f"{b['fullname']:<72} {s['min'] * 1000:>10.2f} {s['median'] * 1000:>12.2f} "
+                  f"{s['mean'] * 1000:>10.2f} {s['stddev'] * 1000:>9.2f} {s['rounds']:>7}\n")
+
+def compare_results(previous_path: str, benchmarks: list, out=sys.stdout, threshold: float = 0.10, dataset: dict = None):
+    """Confronta le mediane con un file JSON precedente e segnala le variazioni oltre la soglia."""
+    with open(previous_path, encoding="utf-8") as f:
+        report = json.load(f)
+    previous = {b["fullname"]: b["stats"] for b in report.get("benchmarks", [])}
+    out.write(f"\nConfronto con {previous_path} (mediane):\n")
+    old_dataset = report.get("dataset") or {}
+    if dataset and any(old_dataset.get(k) != dataset.get(k) for k in ("scale", "seed")):
+        out.write(f"  ATTENZIONE: dataset diverso ({old_dataset.get('scale')}/{old_dataset.get('seed')} "
+                  f"contro {dataset.get('scale')}/{dataset.get('seed')}), i tempi non sono confrontabili.\n")
+    for b in benchmarks:
+        old = previous.get(b["fullname"])
+        if not old:
+            out.write(f"  {b['fullname']:<72} (nuovo)\n")
+            continue
+        new_median, old_median = b["stats"]["median"], old["median"]
+        change = (new_median - old_median) / old_median if old_median else 0.0
+        flag = "  PEGGIORATO" if change > threshold else ("  MIGLIORATO" if change < -threshold else "")
+        out.write(f"  {b['fullname']:<72} {old_median * 1000:>9.2f} -> {new_median * 1000:>9.2f} ms ({change:+.1%}){flag}\n")
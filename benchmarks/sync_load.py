@@ -0,0 +1,433 @@
+# benchmarks/sync_load.py
+"""
+Test di carico di /sync: avvia real_server.py (uvicorn, in un thread) contro
+un database PostgreSQL locale di prova e simula una flotta di tecnici che
+sincronizzano tutti insieme dopo giorni offline ("le 8 del lunedì").
+
+    python -m benchmarks.sync_load --db-name stm_loadtest --clients 50 --offline-days 7 --json carico.json
+
+Per ogni client vengono preparate le modifiche accumulate offline (nuove
+verifiche e dispositivi modificati), con una quota di prima sincronizzazione
+e una quota di modifiche sugli stessi dispositivi da parte di più tecnici.
+Il report indica throughput, latenze p50/p95/p99, attese sui lock (campionate
+da pg_stat_activity/pg_locks), deadlock e tasso di errore.
+
+ATTENZIONE: il database indicato con --db-name viene svuotato e ripopolato.
+Le credenziali (DB_HOST, DB_PORT, DB_USER, DB_PASSWORD) sono lette dall'ambiente
+o dal file .env, come per il server.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from benchmarks import datagen
+from benchmarks.runner import build_report, save_report
+
+SYNC_TABLES = ["customers", "mti_instruments", "signatures", "profiles", "profile_tests", "destinations", "devices", "verifications"]
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "online_database.sql")
+LOADTEST_PASSWORD = "loadtest"
+LOCK_SAMPLE_INTERVAL = 0.1  # secondi tra due campionamenti dei lock
+
+
+def percentile(values: list, p: float) -> float:
+    """Percentile con il metodo nearest-rank (0 se la lista è vuota)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def latency_summary(values: list) -> dict:
+    return {"count": len(values), "mean": statistics.fmean(values) if values else 0.0,
+            "p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99),
+            "max": max(values) if values else 0.0}
+
+
+# ==============================================================================
+# PREPARAZIONE DEL DATABASE
+# ==============================================================================
+
+def db_params(db_name: str) -> dict:
+    from dotenv import load_dotenv
+    load_dotenv()
+    return {"dbname": db_name, "user": os.getenv("DB_USER"), "password": os.getenv("DB_PASSWORD"),
+            "host": os.getenv("DB_HOST", "localhost"), "port": os.getenv("DB_PORT", "5432")}
+
+def prepare_database(params: dict, clients: int, customers: int, seed: int, offline_days: int) -> dict:
+    """
+    Crea lo schema (online_database.sql), svuota le tabelle, crea un utente per
+    ogni client e inserisce i dati di partenza, datati prima del periodo offline
+    (così le sincronizzazioni incrementali non li ricevono). Restituisce i dati
+    di partenza che servono a costruire le modifiche dei client.
+    """
+    import psycopg2
+    from psycopg2.extras import execute_values
+    from argon2 import PasswordHasher
+
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc) - timedelta(days=offline_days + 30)
+    conn = psycopg2.connect(**params)
+    try:
+        with conn, conn.cursor() as cur:
+            with open(SCHEMA_FILE, encoding="utf-8") as f:
+                cur.execute(f.read())
+            cur.execute(f"TRUNCATE {', '.join(SYNC_TABLES)}, verification_code_counters, verification_code_blocks RESTART IDENTITY CASCADE")
+            cur.execute("DELETE FROM users WHERE username LIKE %s", ("loadtest%",))
+            hashed = PasswordHasher().hash(LOADTEST_PASSWORD)  # un solo hash: Argon2 è volutamente lento
+            execute_values(cur, "INSERT INTO users (username, hashed_password, first_name, last_name, role) VALUES %s",
+                           [(f"loadtest{i:03d}", hashed, "Tecnico", f"Carico {i:03d}", "technician") for i in range(clients)])
+
+            customer_rows = [(str(uuid.UUID(int=rng.getrandbits(128))), f"{rng.choice(datagen.CUSTOMER_KINDS)} {rng.choice(datagen.CITIES)} {i:05d}",
+                              "Via Roma 1", now) for i in range(customers)]
+            ids = execute_values(cur, "INSERT INTO customers (uuid, name, address, last_modified) VALUES %s RETURNING id, uuid",
+                                 customer_rows, fetch=True)
+            destination_rows = [(str(uuid.UUID(int=rng.getrandbits(128))), cid, f"Sede {j + 1}", "Viale Italia 1", now)
+                                for cid, _ in ids for j in range(rng.randint(1, 5))]
+            destinations = execute_values(cur, "INSERT INTO destinations (uuid, customer_id, name, address, last_modified) VALUES %s RETURNING id, uuid",
+                                          destination_rows, fetch=True)
+            devices = []
+            for dest_id, dest_uuid in destinations:
+                for _ in range(rng.randint(2, 15)):
+                    description, manufacturer, model, part_types = rng.choice(datagen.DEVICE_MODELS)
+                    devices.append({"uuid": str(uuid.UUID(int=rng.getrandbits(128))), "destination_id": dest_id, "destination_uuid": dest_uuid,
+                                    "serial_number": f"LT{len(devices):07d}", "description": description, "manufacturer": manufacturer,
+                                    "model": model, "department": rng.choice(datagen.DEPARTMENTS), "part_types": part_types,
+                                    "applied_parts_json": json.dumps([{"name": f"Parte applicata {k + 1}", "part_type": t, "code": f"RA{k + 1}"}
+                                                                      for k, t in enumerate(part_types)]),
+                                    "verification_interval": 12, "default_profile_key": "CEI_62353_CLASSE_I"})
+            execute_values(cur, """INSERT INTO devices (uuid, destination_id, serial_number, description, manufacturer, model, department,
+                                                        applied_parts_json, verification_interval, default_profile_key, last_modified) VALUES %s""",
+                           [(d["uuid"], d["destination_id"], d["serial_number"], d["description"], d["manufacturer"], d["model"], d["department"],
+                             d["applied_parts_json"], d["verification_interval"], d["default_profile_key"], now) for d in devices], page_size=1000)
+            # Una verifica di partenza per dispositivo: volume realistico per le prime sincronizzazioni
+            verification_rows = []
+            for d in devices:
+                results, overall = datagen._results_for(rng, datagen.PROFILES[0][2], d["part_types"])
+                when = (now - timedelta(days=rng.randint(30, 365))).date()
+                verification_rows.append((str(uuid.UUID(int=rng.getrandbits(128))), d["uuid"], when, "CEI_62353_CLASSE_I", json.dumps(results),
+                                          overall, json.dumps(datagen._visual_for(rng)), now))
+            execute_values(cur, """INSERT INTO verifications (uuid, device_id, verification_date, profile_name, results_json, overall_status,
+                                                              visual_inspection_json, last_modified)
+                                   SELECT v.uuid, d.id, v.vdate::date, v.profile, v.results, v.status, v.visual, v.modified::timestamptz
+                                   FROM (VALUES %s) AS v(uuid, device_uuid, vdate, profile, results, status, visual, modified)
+                                   JOIN devices d ON d.uuid = v.device_uuid""", verification_rows, page_size=1000)
+            cur.execute("ANALYZE")
+    finally:
+        conn.close()
+    return {"customers": customers, "destinations": [u for _, u in destinations], "devices": devices}
+
+
+# ==============================================================================
+# CLIENT SIMULATI
+# ==============================================================================
+
+def _empty_changes() -> dict:
+    return {table: [] for table in SYNC_TABLES}
+
+def build_client_payloads(seed_data: dict, clients: int, offline_days: int, verifications_per_day: int,
+                          device_edits_per_day: int, first_sync_ratio: float, overlap: float, seed: int) -> list:
+    """
+    Modifiche accumulate offline da ogni client. Ogni tecnico lavora sui propri
+    dispositivi (ripartiti per destinazione); una quota 'overlap' delle modifiche
+    ai dispositivi cade su un gruppo comune, modificato da più tecnici insieme.
+    """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    devices = seed_data["devices"]
+    by_destination = {}
+    for d in devices:
+        by_destination.setdefault(d["destination_uuid"], []).append(d)
+    destinations = list(by_destination)
+    hot_devices = rng.sample(devices, min(len(devices), max(10, clients)))
+
+    payloads = []
+    for i in range(clients):
+        own = [d for dest in destinations[i::clients] for d in by_destination[dest]] or devices
+        prefix = chr(65 + (i // 26) % 26) + chr(65 + i % 26)
+        changes = _empty_changes()
+        for day in range(offline_days):
+            moment = now - timedelta(days=offline_days - day)
+            for k in range(verifications_per_day):
+                d = rng.choice(own)
+                results, overall = datagen._results_for(rng, datagen.PROFILES[0][2], d["part_types"])
+                technician = f"Tecnico Carico {i:03d}"
+                changes["verifications"].append({
+                    "uuid": str(uuid.uuid4()), "device_uuid": d["uuid"], "verification_date": moment.date().isoformat(),
+                    "profile_name": "CEI_62353_CLASSE_I", "results_json": json.dumps(results), "overall_status": overall,
+                    "visual_inspection_json": json.dumps(datagen._visual_for(rng)), "mti_instrument": "Fluke ESA612",
+                    "mti_serial": "1234567", "mti_version": "1.08", "mti_cal_date": "2025-06-01",
+                    "technician_name": technician, "technician_username": f"loadtest{i:03d}",
+                    "verification_code": f"{prefix}{day * verifications_per_day + k + 1:06d}",
+                    "last_modified": (moment + timedelta(minutes=k)).isoformat(), "is_deleted": False, "is_synced": False})
+            for k in range(device_edits_per_day):
+                d = rng.choice(hot_devices if rng.random() < overlap else own)
+                record = {key: value for key, value in d.items() if key not in ("destination_id", "part_types")}
+                record.update({"department": rng.choice(datagen.DEPARTMENTS), "status": "active",
+                               "last_modified": (moment + timedelta(hours=1, minutes=k)).isoformat(), "is_deleted": False, "is_synced": False})
+                changes["devices"].append(record)
+        first_sync = rng.random() < first_sync_ratio
+        payloads.append({
+            "username": f"loadtest{i:03d}", "first_sync": first_sync,
+            "payload": {"last_sync_timestamp": None if first_sync else (now - timedelta(days=offline_days)).isoformat(),
+                        "changes": changes, "code_block_request": {"prefix": prefix, "size": 200}}})
+    return payloads
+
+class SimulatedClient(threading.Thread):
+    """Un tecnico: login, attesa della partenza comune, poi le sincronizzazioni previste."""
+    def __init__(self, base_url: str, plan: dict, start_event: threading.Event, ramp_seconds: float, syncs: int, timeout: float):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.plan = plan
+        self.start_event = start_event
+        self.delay = random.uniform(0, ramp_seconds)
+        self.syncs = syncs
+        self.timeout = timeout
+        self.login_time = None
+        self.results = []
+        import requests
+        self.session = requests.Session()
+
+    def login(self):
+        start = time.perf_counter()
+        response = self.session.post(f"{self.base_url}/token", timeout=self.timeout,
+                                     data={"username": self.plan["username"], "password": LOADTEST_PASSWORD})
+        self.login_time = time.perf_counter() - start
+        response.raise_for_status()
+        self.session.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+    def run(self):
+        body = json.dumps(self.plan["payload"]).encode("utf-8")
+        pushed = sum(len(rows) for rows in self.plan["payload"]["changes"].values())
+        self.start_event.wait()
+        time.sleep(self.delay)
+        for n in range(self.syncs):
+            entry = {"first_sync": self.plan["first_sync"] and n == 0, "bytes_sent": len(body), "pushed": pushed}
+            start = time.perf_counter()
+            try:
+                response = self.session.post(f"{self.base_url}/sync", data=body, timeout=self.timeout,
+                                             headers={"Content-Type": "application/json"})
+                entry["latency"] = time.perf_counter() - start
+                entry["http_status"] = response.status_code
+                entry["bytes_received"] = len(response.content)
+                if response.ok:
+                    data = response.json()
+                    entry["status"] = data.get("status", "unknown")
+                    entry["timings"] = data.get("timings") or {}
+                    entry["pulled"] = sum(len(rows) for rows in (data.get("changes") or {}).values())
+                    # Le sincronizzazioni successive sono incrementali e senza modifiche locali
+                    payload = {"last_sync_timestamp": data.get("new_sync_timestamp"), "changes": _empty_changes()}
+                    body = json.dumps(payload).encode("utf-8")
+                    pushed = 0
+                else:
+                    entry["status"] = "error"
+                    entry["error"] = f"HTTP {response.status_code}"
+            except Exception as e:
+                entry["latency"] = time.perf_counter() - start
+                entry["status"] = "error"
+                entry["error"] = type(e).__name__
+            self.results.append(entry)
+
+class LockMonitor(threading.Thread):
+    """Campiona le sessioni in attesa di un lock e i lock non concessi durante il test."""
+    def __init__(self, params: dict):
+        super().__init__(daemon=True)
+        self.params = params
+        self.stop_event = threading.Event()
+        self.samples = []
+        self.deadlocks = 0
+        self.error = None
+
+    def _deadlocks(self, cur):
+        cur.execute("SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()")
+        return cur.fetchone()[0]
+
+    def run(self):
+        import psycopg2
+        try:
+            conn = psycopg2.connect(**self.params)
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                initial_deadlocks = self._deadlocks(cur)
+                while not self.stop_event.wait(LOCK_SAMPLE_INTERVAL):
+                    cur.execute("""
+                        SELECT
+                            (SELECT count(*) FROM pg_stat_activity
+                              WHERE datname = current_database() AND wait_event_type = 'Lock'),
+                            (SELECT count(*) FROM pg_locks WHERE NOT granted),
+                            (SELECT count(*) FROM pg_stat_activity
+                              WHERE datname = current_database() AND state = 'active' AND pid <> pg_backend_pid()),
+                            (SELECT count(*) FROM pg_stat_activity WHERE datname = current_database())
+                    """)
+                    self.samples.append(cur.fetchone())
+                self.deadlocks = self._deadlocks(cur) - initial_deadlocks
+            conn.close()
+        except Exception as e:
+            self.error = str(e)
+
+    def summary(self) -> dict:
+        waiting = [s[0] for s in self.samples]
+        return {"samples": len(self.samples), "interval": LOCK_SAMPLE_INTERVAL,
+                "samples_with_lock_waits": sum(1 for w in waiting if w),
+                "max_sessions_waiting": max(waiting, default=0),
+                "max_ungranted_locks": max((s[1] for s in self.samples), default=0),
+                # Stima del tempo totale passato in attesa di lock (sessioni x intervallo)
+                "estimated_lock_wait_seconds": round(sum(waiting) * LOCK_SAMPLE_INTERVAL, 2),
+                "max_active_queries": max((s[2] for s in self.samples), default=0),
+                "max_connections": max((s[3] for s in self.samples), default=0),
+                "deadlocks": self.deadlocks, "error": self.error}
+
+
+# ==============================================================================
+# ESECUZIONE
+# ==============================================================================
+
+def start_server(params: dict, port: int):
+    """Avvia real_server.py con uvicorn in un thread, puntato sul database di prova."""
+    os.environ.update({"DB_NAME": params["dbname"], "DB_USER": params["user"] or "", "DB_PASSWORD": params["password"] or "",
+                       "DB_HOST": params["host"], "DB_PORT": str(params["port"])})
+    os.environ.setdefault("SECRET_KEY", "loadtest-secret")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    import uvicorn
+    import real_server
+    server = uvicorn.Server(uvicorn.Config(real_server.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline or not thread.is_alive():
+            raise RuntimeError("Il server non si è avviato.")
+        time.sleep(0.05)
+    return server, thread
+
+def run_load_test(base_url: str, params: dict, plans: list, ramp_seconds: float, syncs: int, timeout: float) -> dict:
+    start_event = threading.Event()
+    clients = [SimulatedClient(base_url, plan, start_event, ramp_seconds, syncs, timeout) for plan in plans]
+    login_errors = 0
+    for client in clients:
+        try:
+            client.login()
+        except Exception as e:
+            login_errors += 1
+            logging.error(f"Login di {client.plan['username']} fallito: {e}")
+    clients = [c for c in clients if "Authorization" in c.session.headers]
+    for client in clients:
+        client.start()
+
+    monitor = LockMonitor(params)
+    monitor.start()
+    started = time.perf_counter()
+    start_event.set()
+    for client in clients:
+        client.join()
+    wall = time.perf_counter() - started
+    monitor.stop_event.set()
+    monitor.join()
+    return summarize([r for c in clients for r in c.results], [c.login_time for c in clients], login_errors, wall, monitor.summary())
+
+def summarize(results: list, login_times: list, login_errors: int, wall: float, locks: dict) -> dict:
+    ok = [r for r in results if r["status"] == "success"]
+    errors = {}
+    for r in results:
+        if r["status"] == "error":
+            errors[r.get("error", "unknown")] = errors.get(r.get("error", "unknown"), 0) + 1
+    phases = {}
+    for r in ok:
+        for name, seconds in r.get("timings", {}).get("phases", {}).items():
+            phases.setdefault(name, []).append(seconds)
+    return {
+        "syncs": len(results), "success": len(ok), "conflicts": sum(1 for r in results if r["status"] == "conflict"),
+        "errors": sum(errors.values()), "error_rate": sum(errors.values()) / len(results) if results else 0.0,
+        "errors_by_kind": errors, "wall_time": wall,
+        "throughput_syncs_per_second": len(ok) / wall if wall else 0.0,
+        "throughput_rows_per_second": sum(r["pushed"] + r.get("pulled", 0) for r in ok) / wall if wall else 0.0,
+        "latency": latency_summary([r["latency"] for r in results]),
+        "latency_first_sync": latency_summary([r["latency"] for r in results if r["first_sync"]]),
+        "latency_incremental": latency_summary([r["latency"] for r in results if not r["first_sync"]]),
+        "login": {**latency_summary([t for t in login_times if t is not None]), "errors": login_errors},
+        "bytes_sent": sum(r["bytes_sent"] for r in results), "bytes_received": sum(r.get("bytes_received", 0) for r in results),
+        "server_phases": {name: latency_summary(values) for name, values in sorted(phases.items())},
+        "locks": locks,
+    }
+
+def print_summary(s: dict, out=sys.stdout):
+    def ms(v): return f"{v * 1000:.0f} ms"
+    out.write(f"\nSincronizzazioni: {s['syncs']} (ok {s['success']}, conflitti {s['conflicts']}, errori {s['errors']}, "
+              f"tasso di errore {s['error_rate']:.1%})\n")
+    if s["errors_by_kind"]:
+        out.write(f"  Errori: {s['errors_by_kind']}\n")
+    out.write(f"Durata: {s['wall_time']:.1f} s, throughput {s['throughput_syncs_per_second']:.2f} sync/s, "
+              f"{s['throughput_rows_per_second']:.0f} record/s\n")
+    for label, key in (("Latenza /sync", "latency"), ("  prima sync", "latency_first_sync"),
+                       ("  incrementale", "latency_incremental"), ("Login (Argon2)", "login")):
+        l = s[key]
+        if l["count"]:
+            out.write(f"{label:<16} p50 {ms(l['p50']):>9}  p95 {ms(l['p95']):>9}  p99 {ms(l['p99']):>9}  max {ms(l['max']):>9}  (n={l['count']})\n")
+    locks = s["locks"]
+    out.write(f"Lock: sessioni in attesa max {locks['max_sessions_waiting']}, campioni con attese "
+              f"{locks['samples_with_lock_waits']}/{locks['samples']}, attesa stimata {locks['estimated_lock_wait_seconds']} s, "
+              f"deadlock {locks['deadlocks']}, connessioni max {locks['max_connections']}\n")
+    if s["server_phases"]:
+        out.write("Fasi lato server (p50 / p95):\n")
+        for name, l in s["server_phases"].items():
+            out.write(f"  {name:<28} {ms(l['p50']):>9} / {ms(l['p95']):>9}\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.sync_load", description="Test di carico di /sync con client simulati.")
+    parser.add_argument("--db-name", required=True, help="database PostgreSQL di prova (viene svuotato!)")
+    parser.add_argument("--url", help="server già in esecuzione da usare (predefinito: avvia real_server in locale)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--offline-days", type=int, default=5)
+    parser.add_argument("--verifications-per-day", type=int, default=15)
+    parser.add_argument("--device-edits-per-day", type=int, default=3)
+    parser.add_argument("--first-sync-ratio", type=float, default=0.1, help="quota di client alla prima sincronizzazione")
+    parser.add_argument("--overlap", type=float, default=0.2, help="quota di modifiche ai dispositivi su un gruppo comune")
+    parser.add_argument("--customers", type=int, default=300, help="clienti nei dati di partenza")
+    parser.add_argument("--ramp", type=float, default=0.0, help="secondi in cui distribuire le partenze (0 = tutti insieme)")
+    parser.add_argument("--syncs", type=int, default=1, help="sincronizzazioni per client (le successive sono incrementali)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=62353)
+    parser.add_argument("--force", action="store_true", help="consente di usare il database configurato per il server (DB_NAME)")
+    parser.add_argument("--json", help="file in cui salvare il report")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    params = db_params(args.db_name)
+    if args.db_name == os.getenv("DB_NAME") and not args.force:
+        parser.error(f"'{args.db_name}' è il database del server (DB_NAME): il test lo svuoterebbe. Usare un database di prova o --force.")
+    print(f"Preparazione del database '{args.db_name}'...")
+    seed_data = prepare_database(params, args.clients, args.customers, args.seed, args.offline_days)
+    print(f"  {len(seed_data['destinations'])} destinazioni, {len(seed_data['devices'])} dispositivi")
+    plans = build_client_payloads(seed_data, args.clients, args.offline_days, args.verifications_per_day,
+                                  args.device_edits_per_day, args.first_sync_ratio, args.overlap, args.seed)
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        server, _ = start_server(params, args.port)
+        base_url = f"http://127.0.0.1:{args.port}"
+    print(f"Avvio di {args.clients} client su {base_url}...")
+    try:
+        summary = run_load_test(base_url, params, plans, args.ramp, args.syncs, args.timeout)
+    finally:
+        if server:
+            server.should_exit = True
+    print_summary(summary)
+
+    if args.json:
+        scenario = {k: getattr(args, k) for k in ("clients", "offline_days", "verifications_per_day", "device_edits_per_day",
+                                                  "first_sync_ratio", "overlap", "customers", "ramp", "syncs", "seed")}
+        save_report(build_report([], {"scenario": scenario, "load_test": summary}), args.json)
+        print(f"\nReport salvato in {args.json}")
+    return 1 if summary["error_rate"] > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
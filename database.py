@@ -5,9 +5,14 @@ import os
 import logging
 from datetime import datetime, timezone
 import re
-import serial
+import sys
+import time
+import threading
+import unicodedata
 from app import config
+from app.logging_config import SLOW_QUERY_LOGGER
 from app.data_models import VerificationProfile, Test, Limit
+from dataclasses import asdict
 import uuid
 
 IGNORABLE_ERROR_SNIPPETS = (
@@ -23,22 +28,179 @@ os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 # SEZIONE 1: GESTORE DI CONTESTO PER LA CONNESSIONE AL DATABASE
 # ==============================================================================
 
+# --- Strumentazione delle query ---
+# Ogni statement eseguito tramite DatabaseConnection viene misurato (esecuzione +
+# lettura delle righe) e aggregato per (funzione chiamante, testo SQL). Le query
+# più lente della soglia configurata finiscono nel log dedicato SLOW_QUERY_LOGGER.
+_slow_query_log = logging.getLogger(SLOW_QUERY_LOGGER)
+
+# Funzioni della strumentazione da saltare quando si cerca il chiamante
+_INSTRUMENTATION_FRAMES = {"execute", "executemany", "fetchone", "fetchmany", "fetchall", "__next__",
+                           "_start", "_finish", "close", "_query_caller"}
+
+def _normalize_sql(sql: str) -> str:
+    return " ".join(sql.split())[:500]
+
+def _query_caller() -> str:
+    """Primo frame fuori dalla strumentazione: 'modulo.funzione' del DAO chiamante."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if not (code.co_filename == __file__ and code.co_name in _INSTRUMENTATION_FRAMES):
+            module = os.path.splitext(os.path.basename(code.co_filename))[0]
+            return f"{module}.{code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+class QueryStats:
+    """Statistiche cumulative delle query dall'avvio (thread-safe)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.started_at = datetime.now()
+
+    def record(self, caller: str, sql: str, duration: float, rows: int):
+        threshold = config.DIAGNOSTICS_SETTINGS["slow_query_ms"] / 1000
+        with self._lock:
+            entry = self._stats.get((caller, sql))
+            if entry is None:
+                entry = self._stats[(caller, sql)] = {"caller": caller, "sql": sql, "count": 0, "total_time": 0.0,
+                                                      "max_time": 0.0, "rows": 0, "slow_count": 0}
+            entry["count"] += 1
+            entry["total_time"] += duration
+            entry["max_time"] = max(entry["max_time"], duration)
+            entry["rows"] += rows
+            if threshold and duration >= threshold:
+                entry["slow_count"] += 1
+        if threshold and duration >= threshold:
+            _slow_query_log.warning(f"{duration * 1000:.1f} ms | {rows} righe | {caller} | {sql}")
+
+    def top(self, n: int = 20, key: str = "total_time") -> list:
+        """Le n query con il valore più alto di 'key' (total_time, max_time, count, rows)."""
+        with self._lock:
+            entries = [dict(e) for e in self._stats.values()]
+        entries.sort(key=lambda e: e[key], reverse=True)
+        return entries[:n]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.started_at = datetime.now()
+
+query_stats = QueryStats()
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursore che misura ogni statement: il tempo comprende l'esecuzione e la
+    lettura delle righe (fetch*/iterazione), registrato quando il risultato è
+    esaurito, alla successiva execute o alla chiusura della connessione.
+    """
+    _pending = None
+
+    def _start(self, sql):
+        self._finish()
+        self._pending = [_query_caller(), _normalize_sql(sql), 0.0, 0]
+        self.connection._pending_cursors.add(self)
+
+    def _finish(self):
+        pending = self._pending
+        if pending is not None:
+            self._pending = None
+            self.connection._pending_cursors.discard(self)
+            # Per INSERT/UPDATE/DELETE conta le righe modificate
+            rows = pending[3] if pending[3] or self.rowcount < 0 else self.rowcount
+            query_stats.record(pending[0], pending[1], pending[2], rows)
+
+    def _timed(self, start, rows=0, exhausted=False):
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - start
+            self._pending[3] += rows
+            if exhausted:
+                self._finish()
+
+    def execute(self, sql, parameters=()):
+        self._start(sql)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._timed(start, exhausted=self.description is None)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._start(sql)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._timed(start, exhausted=True)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._timed(start, row is not None, exhausted=row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._timed(start, len(rows), exhausted=not rows)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._timed(start, len(rows), exhausted=True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._timed(start, exhausted=True)
+            raise
+        self._timed(start, 1)
+        return row
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connessione i cui cursori (anche quelli impliciti di execute) sono InstrumentedCursor."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pending_cursors = set()
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        for cursor in list(self._pending_cursors):
+            cursor._finish()
+        super().close()
+
+
 class DatabaseConnection:
     """
     Un gestore di contesto robusto per la connessione al database SQLite.
     Gestisce automaticamente l'apertura, la chiusura, il commit e il rollback.
     """
-    def __init__(self, db_name=DB_PATH):
-        self.db_name = db_name
+    def __init__(self, db_name=None):
+        # DB_PATH letto a ogni apertura: i benchmark lo puntano su un database sintetico
+        self.db_name = db_name or DB_PATH
         self.conn = None
 
     def __enter__(self):
         """Metodo chiamato quando si entra nel blocco 'with'."""
         try:
-            self.conn = sqlite3.connect(self.db_name)
+            factory = InstrumentedConnection if config.DIAGNOSTICS_SETTINGS["query_stats"] else sqlite3.Connection
+            self.conn = sqlite3.connect(self.db_name, factory=factory)
             self.conn.row_factory = sqlite3.Row
             self.conn.execute("PRAGMA foreign_keys = ON;")
-            logging.info("Connessione al database aperta.")
+            logging.debug("Connessione al database aperta.")
             return self.conn
         except sqlite3.Error as e:
             logging.error(f"Errore di connessione al database: {e}", exc_info=True)
@@ -51,13 +213,13 @@ class DatabaseConnection:
             if self.conn is not None:
                 self.conn.rollback()
         else:
-            logging.info("Transazione DB completata, modifiche confermate (commit).")
+            logging.debug("Transazione DB completata, modifiche confermate (commit).")
             if self.conn is not None:
                 self.conn.commit()
         
         if self.conn is not None:
             self.conn.close()
-        logging.info("Connessione al database chiusa.")
+        logging.debug("Connessione al database chiusa.")
         return False # Non sopprime eventuali eccezioni
 
 # ==============================================================================
@@ -94,11 +256,463 @@ def _execute_sql_script_compat(conn, sql_script: str) -> None:
             raise
     cur.close()
 
+def _next_due_date_sql(date_expr: str, interval_expr: str) -> str:
+    """
+    Espressione SQL della prossima scadenza: data verifica + intervallo in mesi.
+    Come relativedelta, a fine mese la data viene troncata all'ultimo giorno
+    (31/01 + 1 mese = 28/02) invece di sconfinare nel mese successivo.
+    """
+    shifted = f"date({date_expr}, '+' || {interval_expr} || ' months')"
+    clamped = f"date({date_expr}, 'start of month', '+' || ({interval_expr} + 1) || ' months', '-1 day')"
+    return (f"CASE WHEN {date_expr} IS NULL OR {interval_expr} IS NULL OR {interval_expr} <= 0 THEN NULL "
+            f"WHEN strftime('%d', {shifted}) <> strftime('%d', {date_expr}) THEN {clamped} "
+            f"ELSE {shifted} END")
+
+_DEVICE_NEXT_DUE_SQL = _next_due_date_sql(
+    "(SELECT verification_date FROM device_last_verification WHERE device_id = devices.id)",
+    "devices.verification_interval")
+
+# Riepilogo della dashboard per cliente: un dispositivo conta se attivo e non eliminato;
+# l'esito è quello della sua ultima verifica (device_last_verification).
+_DASHBOARD_PASSED_SQL = "(dlv.overall_status IS 'PASSATO')"
+_DASHBOARD_FAILED_SQL = "(dlv.device_id IS NOT NULL AND dlv.overall_status IS NOT 'PASSATO')"
+
+def _dashboard_device_sql(row: str, sign: int) -> str:
+    """Aggiunge (sign=1) o toglie (sign=-1) il dispositivo {row} (NEW/OLD) dai riepiloghi per cliente."""
+    counted = f"{row}.status = 'active' AND {row}.is_deleted = 0"
+    return f"""
+            INSERT INTO customer_dashboard (customer_id, devices, passed, failed)
+                SELECT dest.customer_id, {sign}, {sign} * {_DASHBOARD_PASSED_SQL}, {sign} * {_DASHBOARD_FAILED_SQL}
+                FROM destinations dest LEFT JOIN device_last_verification dlv ON dlv.device_id = {row}.id
+                WHERE dest.id = {row}.destination_id AND {counted}
+                ON CONFLICT(customer_id) DO UPDATE SET devices = devices + excluded.devices,
+                    passed = passed + excluded.passed, failed = failed + excluded.failed;
+            INSERT INTO customer_due_dates (customer_id, due_date, devices)
+                SELECT customer_id, {row}.next_verification_date, {sign} FROM destinations
+                WHERE id = {row}.destination_id AND {counted} AND {row}.next_verification_date IS NOT NULL
+                ON CONFLICT(customer_id, due_date) DO UPDATE SET devices = devices + excluded.devices;
+            DELETE FROM customer_due_dates WHERE devices = 0 AND due_date = {row}.next_verification_date
+                AND customer_id = (SELECT customer_id FROM destinations WHERE id = {row}.destination_id);"""
+
+def _dashboard_rebuild_sql(customer_expr: str = None) -> str:
+    """Ricalcola i riepiloghi del cliente indicato (di tutti, senza customer_expr)."""
+    where = f" WHERE customer_id = {customer_expr}" if customer_expr else ""
+    and_customer = f" AND dest.customer_id = {customer_expr}" if customer_expr else ""
+    return f"""
+            DELETE FROM customer_dashboard{where};
+            DELETE FROM customer_due_dates{where};
+            INSERT INTO customer_dashboard (customer_id, devices, passed, failed)
+                SELECT dest.customer_id, COUNT(*), SUM({_DASHBOARD_PASSED_SQL}), SUM({_DASHBOARD_FAILED_SQL})
+                FROM devices d JOIN destinations dest ON dest.id = d.destination_id
+                LEFT JOIN device_last_verification dlv ON dlv.device_id = d.id
+                WHERE d.status = 'active' AND d.is_deleted = 0{and_customer}
+                GROUP BY dest.customer_id;
+            INSERT INTO customer_due_dates (customer_id, due_date, devices)
+                SELECT dest.customer_id, d.next_verification_date, COUNT(*)
+                FROM devices d JOIN destinations dest ON dest.id = d.destination_id
+                WHERE d.status = 'active' AND d.is_deleted = 0 AND d.next_verification_date IS NOT NULL{and_customer}
+                GROUP BY dest.customer_id, d.next_verification_date;"""
+
+# Estensioni di schema gestite dal codice (tabelle locali di supporto, indici, trigger).
+# Ogni script usa solo DDL idempotente (IF NOT EXISTS) e viene riapplicato a ogni
+# avvio, dopo le migrazioni numerate.
+SCHEMA_EXTENSIONS = {
+    # Serie complete di letture MREAD (solo locali, non sincronizzate).
+    # Il blob contiene timestamp e valori float32 compressi con zlib.
+    "verification_captures": """
+        CREATE TABLE IF NOT EXISTS verification_captures (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            verification_id INTEGER NOT NULL REFERENCES verifications(id) ON DELETE CASCADE,
+            result_index INTEGER NOT NULL,
+            test_name TEXT,
+            sample_count INTEGER NOT NULL DEFAULT 0,
+            started_at TEXT,
+            data BLOB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_verification_captures_verification
+            ON verification_captures (verification_id, result_index);
+    """,
+    # Ultima verifica valida di ogni dispositivo, mantenuta dai trigger su 'verifications'.
+    # Evita di ricalcolare ROW_NUMBER() sull'intera tabella delle verifiche ad ogni lettura.
+    "device_last_verification": """
+        CREATE INDEX IF NOT EXISTS idx_verifications_device_date
+            ON verifications (device_id, verification_date);
+        CREATE TABLE IF NOT EXISTS device_last_verification (
+            device_id INTEGER PRIMARY KEY,
+            verification_id INTEGER NOT NULL,
+            verification_date TEXT,
+            overall_status TEXT,
+            technician_name TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_device_last_verification_date
+            ON device_last_verification (verification_date);
+        CREATE TRIGGER IF NOT EXISTS trg_dlv_verification_insert
+        AFTER INSERT ON verifications
+        BEGIN
+            DELETE FROM device_last_verification WHERE device_id = NEW.device_id;
+            INSERT INTO device_last_verification (device_id, verification_id, verification_date, overall_status, technician_name)
+                SELECT device_id, id, verification_date, overall_status, technician_name FROM verifications
+                WHERE device_id = NEW.device_id AND is_deleted = 0
+                ORDER BY verification_date DESC, id DESC LIMIT 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_dlv_verification_update
+        AFTER UPDATE OF device_id, verification_date, overall_status, technician_name, is_deleted ON verifications
+        BEGIN
+            DELETE FROM device_last_verification WHERE device_id IN (OLD.device_id, NEW.device_id);
+            INSERT INTO device_last_verification (device_id, verification_id, verification_date, overall_status, technician_name)
+                SELECT device_id, id, verification_date, overall_status, technician_name FROM verifications
+                WHERE device_id = NEW.device_id AND is_deleted = 0
+                ORDER BY verification_date DESC, id DESC LIMIT 1;
+            INSERT INTO device_last_verification (device_id, verification_id, verification_date, overall_status, technician_name)
+                SELECT device_id, id, verification_date, overall_status, technician_name FROM verifications
+                WHERE device_id = OLD.device_id AND OLD.device_id <> NEW.device_id AND is_deleted = 0
+                ORDER BY verification_date DESC, id DESC LIMIT 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_dlv_verification_delete
+        AFTER DELETE ON verifications
+        BEGIN
+            DELETE FROM device_last_verification WHERE device_id = OLD.device_id;
+            INSERT INTO device_last_verification (device_id, verification_id, verification_date, overall_status, technician_name)
+                SELECT device_id, id, verification_date, overall_status, technician_name FROM verifications
+                WHERE device_id = OLD.device_id AND is_deleted = 0
+                ORDER BY verification_date DESC, id DESC LIMIT 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_dlv_device_delete
+        AFTER DELETE ON devices
+        BEGIN
+            DELETE FROM device_last_verification WHERE device_id = OLD.id;
+        END;
+    """,
+    # Scadenziario: next_verification_date = data dell'ultima verifica + intervallo,
+    # ricalcolata dai trigger a ogni variazione dell'ultima verifica o dell'intervallo
+    # (salvataggio locale, importazione .stm, sincronizzazione).
+    # È un dato derivato locale: ogni client lo ricalcola dalle verifiche e dagli
+    # intervalli sincronizzati, e un valore diverso ricevuto dal server viene subito
+    # sostituito (trg_schedule_device_insert/_interval). Per questo i trigger non
+    # toccano is_synced/last_modified: segnare il dispositivo da inviare a ogni
+    # verifica ricevuta lo rimanderebbe al server a ogni sincronizzazione.
+    "verification_schedule": f"""
+        CREATE INDEX IF NOT EXISTS idx_devices_due
+            ON devices (status, is_deleted, next_verification_date);
+        CREATE TRIGGER IF NOT EXISTS trg_schedule_last_insert
+        AFTER INSERT ON device_last_verification
+        BEGIN
+            UPDATE devices SET next_verification_date = {_DEVICE_NEXT_DUE_SQL} WHERE id = NEW.device_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_schedule_last_delete
+        AFTER DELETE ON device_last_verification
+        BEGIN
+            UPDATE devices SET next_verification_date = NULL WHERE id = OLD.device_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_schedule_device_insert
+        AFTER INSERT ON devices
+        BEGIN
+            UPDATE devices SET next_verification_date = {_DEVICE_NEXT_DUE_SQL} WHERE id = NEW.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_schedule_device_interval
+        AFTER UPDATE OF verification_interval, next_verification_date ON devices
+        WHEN NEW.next_verification_date IS NOT {_next_due_date_sql(
+            "(SELECT verification_date FROM device_last_verification WHERE device_id = NEW.id)",
+            "NEW.verification_interval")}
+        BEGIN
+            UPDATE devices SET next_verification_date = {_DEVICE_NEXT_DUE_SQL} WHERE id = NEW.id;
+        END;
+    """,
+    # Indici per la paginazione keyset delle tabelle del manager anagrafiche.
+    "manager_paging": """
+        CREATE INDEX IF NOT EXISTS idx_devices_destination_status
+            ON devices (destination_id, COALESCE(status, ''), COALESCE(description, ''));
+        CREATE INDEX IF NOT EXISTS idx_customers_name
+            ON customers (COALESCE(name, ''));
+    """,
+    # Allocatore dei verification_code: un contatore per prefisso (iniziali del tecnico)
+    # e i blocchi di numeri riservati dal server durante la sincronizzazione.
+    # Il trigger tiene ogni contatore oltre il codice più alto mai visto in locale.
+    "verification_code_allocator": """
+        CREATE INDEX IF NOT EXISTS idx_verifications_code
+            ON verifications (verification_code);
+        CREATE TABLE IF NOT EXISTS verification_code_counters (
+            prefix TEXT PRIMARY KEY,
+            next_number INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS verification_code_blocks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            prefix TEXT NOT NULL,
+            next_number INTEGER NOT NULL,
+            end_number INTEGER NOT NULL,
+            reserved_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_verification_code_blocks_prefix
+            ON verification_code_blocks (prefix, id);
+        CREATE TRIGGER IF NOT EXISTS trg_code_counter_insert
+        AFTER INSERT ON verifications
+        WHEN NEW.verification_code GLOB '[A-Z][A-Z][0-9]*'
+        BEGIN
+            INSERT INTO verification_code_counters (prefix, next_number)
+                VALUES (substr(NEW.verification_code, 1, 2), CAST(substr(NEW.verification_code, 3) AS INTEGER) + 1)
+                ON CONFLICT(prefix) DO UPDATE SET next_number = MAX(next_number, excluded.next_number);
+        END;
+    """,
+    # Versione dei dati dei profili, incrementata dai trigger a ogni modifica di
+    # profili e test (servizi, sincronizzazione, risoluzione conflitti), e copia
+    # "compilata" dei profili valida finché la versione non cambia.
+    "profile_cache": """
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        INSERT OR IGNORE INTO data_versions (name, version) VALUES ('profiles', 0);
+        CREATE TABLE IF NOT EXISTS compiled_profiles (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            data_version INTEGER NOT NULL,
+            payload TEXT NOT NULL
+        );
+        CREATE TRIGGER IF NOT EXISTS trg_profiles_version_insert AFTER INSERT ON profiles
+        BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'profiles'; END;
+        CREATE TRIGGER IF NOT EXISTS trg_profiles_version_update
+        AFTER UPDATE OF profile_key, name, is_deleted ON profiles
+        BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'profiles'; END;
+        CREATE TRIGGER IF NOT EXISTS trg_profiles_version_delete AFTER DELETE ON profiles
+        BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'profiles'; END;
+        CREATE TRIGGER IF NOT EXISTS trg_profile_tests_version_insert AFTER INSERT ON profile_tests
+        BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'profiles'; END;
+        CREATE TRIGGER IF NOT EXISTS trg_profile_tests_version_update
+        AFTER UPDATE OF profile_id, name, parameter, limits_json, is_applied_part_test, is_deleted ON profile_tests
+        BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'profiles'; END;
+        CREATE TRIGGER IF NOT EXISTS trg_profile_tests_version_delete AFTER DELETE ON profile_tests
+        BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'profiles'; END;
+    """,
+    # Storico delle ultime sincronizzazioni con i tempi di ogni fase (client e
+    # server), le righe inviate/ricevute per tabella e i byte trasferiti.
+    "sync_history": """
+        CREATE TABLE IF NOT EXISTS sync_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at TEXT NOT NULL,
+            duration REAL,
+            status TEXT NOT NULL,
+            full_sync INTEGER NOT NULL DEFAULT 0,
+            bytes_sent INTEGER,
+            bytes_received INTEGER,
+            pushed_json TEXT,
+            pulled_json TEXT,
+            phases_json TEXT,
+            server_phases_json TEXT,
+            error TEXT
+        );
+    """,
+    # Misure delle verifiche estratte da results_json, una riga per risultato, per
+    # interrogare valori e andamenti senza decodificare ogni verifica. Contengono solo
+    # le verifiche non eliminate; dispositivo e data seguono quelli della verifica.
+    "verification_measurements": """
+        CREATE TABLE IF NOT EXISTS verification_measurements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            verification_id INTEGER NOT NULL REFERENCES verifications(id) ON DELETE CASCADE,
+            device_id INTEGER NOT NULL,
+            verification_date TEXT,
+            result_index INTEGER NOT NULL,
+            test_name TEXT NOT NULL,
+            parameter TEXT,
+            applied_part TEXT,
+            applied_part_type TEXT,
+            value REAL,
+            value_text TEXT,
+            unit TEXT,
+            limit_value REAL,
+            passed INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_measurements_test_value
+            ON verification_measurements (test_name, value);
+        CREATE INDEX IF NOT EXISTS idx_measurements_device_date
+            ON verification_measurements (device_id, verification_date);
+        CREATE INDEX IF NOT EXISTS idx_measurements_verification
+            ON verification_measurements (verification_id);
+        CREATE TRIGGER IF NOT EXISTS trg_measurements_verification_move
+        AFTER UPDATE OF device_id, verification_date ON verifications
+        BEGIN
+            UPDATE verification_measurements SET device_id = NEW.device_id, verification_date = NEW.verification_date
+            WHERE verification_id = NEW.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_measurements_verification_soft_delete
+        AFTER UPDATE OF is_deleted ON verifications
+        WHEN NEW.is_deleted = 1
+        BEGIN
+            DELETE FROM verification_measurements WHERE verification_id = NEW.id;
+        END;
+    """,
+    # Riepilogo della dashboard mantenuto dai trigger, al posto dei conteggi sulle tabelle:
+    # - dashboard_counters: clienti e dispositivi non eliminati;
+    # - customer_dashboard: per cliente, dispositivi attivi ed esito della loro ultima verifica;
+    # - customer_due_dates: per cliente, dispositivi attivi per data di scadenza
+    #   (scadute e in scadenza si contano al momento della lettura, dipendono dalla data).
+    # I trigger sommano e sottraggono il contributo di ogni dispositivo, quindi l'ordine
+    # in cui scattano rispetto a quelli dello scadenziario è indifferente.
+    "dashboard_summary": f"""
+        CREATE TABLE IF NOT EXISTS dashboard_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        );
+        INSERT OR IGNORE INTO dashboard_counters (name, value) VALUES ('customers', 0), ('devices', 0);
+        CREATE TABLE IF NOT EXISTS customer_dashboard (
+            customer_id INTEGER PRIMARY KEY,
+            devices INTEGER NOT NULL DEFAULT 0,
+            passed INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS customer_due_dates (
+            customer_id INTEGER NOT NULL,
+            due_date TEXT NOT NULL,
+            devices INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (customer_id, due_date)
+        );
+        CREATE INDEX IF NOT EXISTS idx_customer_due_dates_date
+            ON customer_due_dates (due_date, customer_id);
+        CREATE TRIGGER IF NOT EXISTS trg_dashboard_customer_insert
+        AFTER INSERT ON customers WHEN NEW.is_deleted IS 0
+        BEGIN
+            UPDATE dashboard_counters SET value = value + 1 WHERE name = 'customers';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_dashboard_customer_update
+        AFTER UPDATE OF is_deleted ON customers WHEN OLD.is_deleted IS NOT NEW.is_deleted
+        BEGIN
+            UPDATE dashboard_counters SET value = value + (NEW.is_deleted IS 0) - (OLD.is_deleted IS 0) WHERE name = 'customers';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_dashboard_customer_delete
+        AFTER DELETE ON customers
+        BEGIN
+            UPDATE dashboard_counters SET value = value - (OLD.is_deleted IS 0) WHERE name = 'customers';
+            DELETE FROM customer_dashboard WHERE customer_id = OLD.id;
+            DELETE FROM customer_due_dates WHERE customer_id = OLD.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_dashboard_device_insert
+        AFTER INSERT ON devices
+        BEGIN
+            UPDATE dashboard_counters SET value = value + (NEW.is_deleted IS 0) WHERE name = 'devices';{_dashboard_device_sql("NEW", 1)}
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_dashboard_device_update
+        AFTER UPDATE OF destination_id, status, is_deleted, next_verification_date ON devices
+        WHEN OLD.destination_id IS NOT NEW.destination_id OR OLD.status IS NOT NEW.status
+            OR OLD.is_deleted IS NOT NEW.is_deleted OR OLD.next_verification_date IS NOT NEW.next_verification_date
+        BEGIN
+            UPDATE dashboard_counters SET value = value + (NEW.is_deleted IS 0) - (OLD.is_deleted IS 0) WHERE name = 'devices';{_dashboard_device_sql("OLD", -1)}{_dashboard_device_sql("NEW", 1)}
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_dashboard_device_delete
+        AFTER DELETE ON devices
+        BEGIN
+            UPDATE dashboard_counters SET value = value - (OLD.is_deleted IS 0) WHERE name = 'devices';{_dashboard_device_sql("OLD", -1)}
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_dashboard_last_insert
+        AFTER INSERT ON device_last_verification
+        BEGIN
+            UPDATE customer_dashboard SET passed = passed + (NEW.overall_status IS 'PASSATO'), failed = failed + (NEW.overall_status IS NOT 'PASSATO')
+            WHERE customer_id = (SELECT dest.customer_id FROM devices d JOIN destinations dest ON dest.id = d.destination_id
+                                 WHERE d.id = NEW.device_id AND d.status = 'active' AND d.is_deleted = 0);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_dashboard_last_delete
+        AFTER DELETE ON device_last_verification
+        BEGIN
+            UPDATE customer_dashboard SET passed = passed - (OLD.overall_status IS 'PASSATO'), failed = failed - (OLD.overall_status IS NOT 'PASSATO')
+            WHERE customer_id = (SELECT dest.customer_id FROM devices d JOIN destinations dest ON dest.id = d.destination_id
+                                 WHERE d.id = OLD.device_id AND d.status = 'active' AND d.is_deleted = 0);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_dashboard_destination_customer
+        AFTER UPDATE OF customer_id ON destinations WHEN OLD.customer_id IS NOT NEW.customer_id
+        BEGIN{_dashboard_rebuild_sql("OLD.customer_id")}{_dashboard_rebuild_sql("NEW.customer_id")}
+        END;
+    """,
+    # Versione dei dati letti dall'analisi del parco (misure delle verifiche e
+    # anagrafica di dispositivi, destinazioni e clienti): app.analytics riusa i
+    # risultati finché non cambia. data_versions è creata da profile_cache.
+    "fleet_version": """
+        INSERT OR IGNORE INTO data_versions (name, version) VALUES ('fleet', 0);
+        CREATE TRIGGER IF NOT EXISTS trg_fleet_version_verification_insert AFTER INSERT ON verifications
+        BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'fleet'; END;
+        CREATE TRIGGER IF NOT EXISTS trg_fleet_version_verification_update
+        AFTER UPDATE OF device_id, verification_date, results_json, is_deleted ON verifications
+        BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'fleet'; END;
+        CREATE TRIGGER IF NOT EXISTS trg_fleet_version_verification_delete AFTER DELETE ON verifications
+        BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'fleet'; END;
+        CREATE TRIGGER IF NOT EXISTS trg_fleet_version_device_update
+        AFTER UPDATE OF destination_id, status, is_deleted, description, serial_number, manufacturer, model, ams_inventory ON devices
+        BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'fleet'; END;
+        CREATE TRIGGER IF NOT EXISTS trg_fleet_version_device_delete AFTER DELETE ON devices
+        BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'fleet'; END;
+        CREATE TRIGGER IF NOT EXISTS trg_fleet_version_destination_update
+        AFTER UPDATE OF customer_id, name ON destinations
+        BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'fleet'; END;
+        CREATE TRIGGER IF NOT EXISTS trg_fleet_version_customer_update AFTER UPDATE OF name ON customers
+        BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'fleet'; END;
+    """,
+}
+
+# Popolamento iniziale dei dati gestiti da SCHEMA_EXTENSIONS: ogni script viene
+# eseguito una sola volta (registrato in schema_backfills), poi provvedono i trigger.
+# Al posto dello script SQL si può indicare una funzione, che riceve la connessione.
+SCHEMA_BACKFILLS = {
+    "device_last_verification": """
+        INSERT OR REPLACE INTO device_last_verification (device_id, verification_id, verification_date, overall_status, technician_name)
+        SELECT device_id, id, verification_date, overall_status, technician_name FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY device_id ORDER BY verification_date DESC, id DESC) AS rn
+            FROM verifications WHERE is_deleted = 0
+        ) WHERE rn = 1;
+    """,
+    "verification_schedule": f"""
+        UPDATE devices SET next_verification_date = {_DEVICE_NEXT_DUE_SQL};
+    """,
+    "verification_code_allocator": """
+        INSERT OR REPLACE INTO verification_code_counters (prefix, next_number)
+        SELECT substr(verification_code, 1, 2), MAX(CAST(substr(verification_code, 3) AS INTEGER)) + 1
+        FROM verifications
+        WHERE verification_code GLOB '[A-Z][A-Z][0-9]*'
+        GROUP BY substr(verification_code, 1, 2);
+    """,
+    "verification_measurements": lambda conn: refresh_verification_measurements(conn),
+    "dashboard_summary": f"""
+        UPDATE dashboard_counters SET value = (SELECT COUNT(*) FROM customers WHERE is_deleted = 0) WHERE name = 'customers';
+        UPDATE dashboard_counters SET value = (SELECT COUNT(*) FROM devices WHERE is_deleted = 0) WHERE name = 'devices';{_dashboard_rebuild_sql()}
+    """,
+}
+
+def apply_schema_extensions():
+    """
+    Applica gli script di SCHEMA_EXTENSIONS; un errore non blocca gli altri, ma
+    al termine viene sollevato un sqlite3.DatabaseError con le estensioni non applicate.
+    Dopo ogni estensione esegue, se non ancora fatto, il relativo SCHEMA_BACKFILLS.
+    """
+    failed = []
+    with DatabaseConnection() as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS schema_backfills (name TEXT PRIMARY KEY, applied_at TEXT)")
+        done = {r[0] for r in conn.execute("SELECT name FROM schema_backfills")}
+        for name, script in SCHEMA_EXTENSIONS.items():
+            try:
+                conn.executescript(script)
+                if name in SCHEMA_BACKFILLS and name not in done:
+                    logging.info(f"[migrate] Popolamento iniziale di '{name}'...")
+                    backfill = SCHEMA_BACKFILLS[name]
+                    if callable(backfill):
+                        conn.execute("BEGIN")
+                        backfill(conn)
+                        conn.commit()
+                    else:
+                        conn.executescript(f"BEGIN; {backfill} COMMIT;")
+                    conn.execute("INSERT INTO schema_backfills (name, applied_at) VALUES (?, ?)", (name, datetime.now(timezone.utc).isoformat()))
+            except sqlite3.Error as e:
+                if conn.in_transaction:
+                    conn.rollback()
+                logging.error(f"[migrate] Estensione di schema '{name}' non applicata: {e}")
+                failed.append(f"{name}: {e}")
+    if failed:
+        raise sqlite3.DatabaseError("Estensioni di schema non applicate: " + "; ".join(failed))
+
 def migrate_database():
-    """Applica le migrazioni SQL al database in modo sequenziale."""
+    """
+    Applica le migrazioni SQL al database in modo sequenziale.
+    Non viene più eseguita all'import del modulo: all'avvio la lancia lo
+    StartupWorker in background, dopo il backup.
+    """
     migrations_path = os.path.join(config.BASE_DIR, 'migrations') 
     if not os.path.isdir(migrations_path):
         logging.info(f"Cartella delle migrazioni '{migrations_path}' non trovata. Migrazione saltata.")
+        apply_schema_extensions()
         return
 
     try:
@@ -135,6 +749,7 @@ def migrate_database():
                 
                 current_version = file_version
                 logging.info(f"Database aggiornato alla versione {current_version}.")
+        apply_schema_extensions()
     except Exception as e:
         logging.critical("Errore critico durante la migrazione del database.", exc_info=True)
         raise
@@ -320,6 +935,73 @@ def device_exists(serial_number: str):
     with DatabaseConnection() as conn:
         return conn.execute("SELECT id FROM devices WHERE serial_number = ? AND is_deleted = 0 AND status = 'active'", (serial_number,)).fetchone() is not None
 
+def get_active_serials_index() -> dict:
+    """
+    Indice {matricola: (id, is_deleted)} dei dispositivi con stato 'active',
+    caricato con una sola query per l'importazione massiva.
+    """
+    with DatabaseConnection() as conn:
+        rows = conn.execute(
+            "SELECT id, serial_number, is_deleted FROM devices WHERE serial_number IS NOT NULL AND status = 'active'"
+        ).fetchall()
+    index = {}
+    for row in rows:
+        # Un record attivo ha la precedenza su uno eliminato con la stessa matricola
+        if row['serial_number'] not in index or not row['is_deleted']:
+            index[row['serial_number']] = (row['id'], row['is_deleted'])
+    return index
+
+_BULK_DEVICE_INSERT = """
+    INSERT INTO devices (
+        uuid, destination_id, serial_number, description, manufacturer,
+        model, department, applied_parts_json, customer_inventory,
+        ams_inventory, verification_interval, default_profile_key,
+        last_modified, is_synced, is_deleted, status
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, '[]', ?, ?, ?, ?, ?, 0, 0, 'active')
+"""
+_BULK_DEVICE_REACTIVATE = """
+    UPDATE devices SET
+        uuid = COALESCE(uuid, ?), destination_id = ?, serial_number = ?, description = ?,
+        manufacturer = ?, model = ?, department = ?, applied_parts_json = '[]',
+        customer_inventory = ?, ams_inventory = ?, verification_interval = ?,
+        default_profile_key = ?, last_modified = ?, is_synced = 0, is_deleted = 0
+    WHERE id = ?
+"""
+
+def bulk_import_devices(new_devices: list, reactivations: list) -> list:
+    """
+    Inserisce (e riattiva) un lotto di dispositivi in un'unica transazione.
+    new_devices: tuple (row_label, uuid, destination_id, serial, desc, mfg, model, department,
+                        customer_inv, ams_inv, interval, profile_key, timestamp)
+    reactivations: come sopra con in coda l'id del dispositivo eliminato da riattivare.
+    Se il lotto fallisce in blocco, ripiega su inserimenti riga per riga per
+    attribuire l'errore alla riga giusta. Restituisce [(row_label, messaggio)].
+    """
+    failures = []
+    with DatabaseConnection() as conn:
+        try:
+            conn.execute("SAVEPOINT bulk_devices")
+            conn.executemany(_BULK_DEVICE_INSERT, [r[1:] for r in new_devices])
+            conn.executemany(_BULK_DEVICE_REACTIVATE, [r[1:] for r in reactivations])
+            conn.execute("RELEASE SAVEPOINT bulk_devices")
+            return failures
+        except sqlite3.Error as e:
+            logging.warning(f"Inserimento a lotti fallito ({e}), ripiego riga per riga.")
+            conn.execute("ROLLBACK TO SAVEPOINT bulk_devices")
+            conn.execute("RELEASE SAVEPOINT bulk_devices")
+
+        for query, batch in ((_BULK_DEVICE_INSERT, new_devices), (_BULK_DEVICE_REACTIVATE, reactivations)):
+            for record in batch:
+                try:
+                    conn.execute("SAVEPOINT bulk_row")
+                    conn.execute(query, record[1:])
+                    conn.execute("RELEASE SAVEPOINT bulk_row")
+                except sqlite3.Error as e:
+                    conn.execute("ROLLBACK TO SAVEPOINT bulk_row")
+                    conn.execute("RELEASE SAVEPOINT bulk_row")
+                    failures.append((record[0], f"Errore database ({e})"))
+    return failures
+
 def get_device_count_for_customer(customer_id):
     with DatabaseConnection() as conn:
         return conn.execute("""
@@ -329,24 +1011,67 @@ def get_device_count_for_customer(customer_id):
             WHERE dest.customer_id = ? AND d.is_deleted = 0
         """, (customer_id,)).fetchone()[0]
 
-def get_devices_needing_verification(days_in_future=30):
-    """Recupera i dispositivi ATTIVI con verifica scaduta o in scadenza."""
+def _due_limit_date(days_in_future: int) -> str:
     from datetime import date, timedelta
-    future_date = date.today() + timedelta(days=days_in_future)
-    
+    return (date.today() + timedelta(days=days_in_future)).strftime('%Y-%m-%d')
+
+def get_devices_needing_verification(days_in_future=30, customer_id: int = None, limit: int = None, offset: int = 0):
+    """
+    Recupera i dispositivi ATTIVI con verifica scaduta o in scadenza, in ordine di scadenza.
+    La ricerca usa l'indice (status, is_deleted, next_verification_date); con 'limit'
+    e 'offset' restituisce una pagina, con 'customer_id' i soli dispositivi del cliente.
+    """
+    query = """
+        SELECT d.*, c.name as customer_name, c.id as customer_id
+        FROM devices d
+        JOIN destinations dest ON d.destination_id = dest.id
+        JOIN customers c ON dest.customer_id = c.id
+        WHERE d.status = 'active' AND d.is_deleted = 0
+        AND d.next_verification_date <= ?
+    """
+    params = [_due_limit_date(days_in_future)]
+    if customer_id is not None:
+        query += " AND c.id = ?"
+        params.append(customer_id)
+    query += " ORDER BY d.next_verification_date ASC, d.id ASC"
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
     with DatabaseConnection() as conn:
-        query = """
-            SELECT d.*, c.name as customer_name 
-            FROM devices d
-            JOIN destinations dest ON d.destination_id = dest.id
-            JOIN customers c ON dest.customer_id = c.id
-            WHERE d.next_verification_date IS NOT NULL 
-            AND d.next_verification_date <= ?
-            AND d.is_deleted = 0 AND d.status = 'active'
-            ORDER BY d.next_verification_date ASC
-        """
-        return conn.execute(query, (future_date.strftime('%Y-%m-%d'),)).fetchall()
-    
+        return conn.execute(query, params).fetchall()
+
+def _due_summary_by_customer(conn, days_in_future: int) -> list:
+    from datetime import date
+    query = """
+        SELECT c.id AS customer_id, c.name AS customer_name, due.overdue, due.upcoming, due.first_due_date,
+               COALESCE(cd.devices, 0) AS devices, COALESCE(cd.passed, 0) AS passed, COALESCE(cd.failed, 0) AS failed
+        FROM (
+            SELECT customer_id,
+                   SUM(CASE WHEN due_date < :today THEN devices ELSE 0 END) AS overdue,
+                   SUM(CASE WHEN due_date >= :today THEN devices ELSE 0 END) AS upcoming,
+                   MIN(due_date) AS first_due_date
+            FROM customer_due_dates
+            WHERE due_date <= :limit_date AND devices > 0
+            GROUP BY customer_id
+        ) due
+        JOIN customers c ON c.id = due.customer_id
+        LEFT JOIN customer_dashboard cd ON cd.customer_id = due.customer_id
+        ORDER BY due.first_due_date ASC, c.name
+    """
+    params = {"today": date.today().strftime('%Y-%m-%d'), "limit_date": _due_limit_date(days_in_future)}
+    return conn.execute(query, params).fetchall()
+
+def get_due_verification_summary_by_customer(days_in_future=30):
+    """
+    Raggruppa per cliente i dispositivi scaduti e in scadenza, leggendo il riepilogo
+    mantenuto dai trigger (customer_due_dates). Restituisce righe (customer_id,
+    customer_name, overdue, upcoming, first_due_date, devices, passed, failed)
+    ordinate per prima scadenza; devices/passed/failed sono i dispositivi attivi
+    del cliente e l'esito della loro ultima verifica.
+    """
+    with DatabaseConnection() as conn:
+        return _due_summary_by_customer(conn, days_in_future)
+
 def search_device_globally(search_term):
     """
     Cerca un dispositivo in tutto il database e restituisce anche il nome del cliente
@@ -374,51 +1099,58 @@ def search_device_globally(search_term):
         results = [_decode_json_fields(row, ['applied_parts_json']) for row in rows]
         return results
 
+_DEVICES_LAST_VERIFICATION_QUERY = """
+    SELECT
+        CASE
+            WHEN d.status = "active" THEN "ATTIVO"
+            WHEN d.status = "inactive" THEN "DISMESSO"
+        END AS "STATO",
+        d.ams_inventory AS "INVENTARIO AMS",
+        d.customer_inventory AS "INVENTARIO CLIENTE",
+        d.description AS "DENOMINAZIONE", 
+        d.manufacturer AS "MARCA",
+        d.model AS "MODELLO",
+        d.serial_number AS "MATRICOLA",
+        d.department AS "REPARTO",
+        v.verification_date AS "DATA",
+        v.technician_name AS "TECNICO",
+        CASE
+            WHEN v.overall_status = "PASSATO" THEN "CONFORME"
+            WHEN v.overall_status = "FALLITO" THEN "NON CONFORME"
+        END AS "ESITO",
+        dest.name AS "DESTINAZIONE" 
+    FROM
+        devices d
+    LEFT JOIN
+        device_last_verification v ON v.device_id = d.id
+    JOIN
+        destinations dest ON d.destination_id = dest.id
+    WHERE
+        d.destination_id = ? AND d.is_deleted = 0
+    ORDER BY
+        d.description;
+"""
+
 def get_devices_with_last_verification_for_destination(destination_id: int):
     """
     Recupera tutti i dispositivi di una destinazione con i dati della loro ultima verifica.
     Ora include l'inventario cliente e il nome della destinazione.
     """
     with DatabaseConnection() as conn:
-        
-        query = """
-            SELECT
-                CASE
-                    WHEN d.status = "active" THEN "ATTIVO"
-                    WHEN d.status = "inactive" THEN "DISMESSO"
-                END AS "STATO",
-                d.ams_inventory AS "INVENTARIO AMS",
-                d.customer_inventory AS "INVENTARIO CLIENTE",
-                d.description AS "DENOMINAZIONE", 
-                d.manufacturer AS "MARCA",
-                d.model AS "MODELLO",
-                d.serial_number AS "MATRICOLA",
-                d.department AS "REPARTO",
-                v.verification_date AS "DATA",
-                v.technician_name AS "TECNICO",
-                CASE
-                    WHEN v.overall_status = "PASSATO" THEN "CONFORME"
-                    WHEN v.overall_status = "FALLITO" THEN "NON CONFORME"
-                END AS "ESITO",
-                dest.name AS "DESTINAZIONE" 
-            FROM
-                devices d
-            LEFT JOIN
-                (
-                    SELECT
-                        *,
-                        ROW_NUMBER() OVER(PARTITION BY device_id ORDER BY verification_date DESC) as rn
-                    FROM verifications
-                    WHERE is_deleted = 0
-                ) v ON d.id = v.device_id AND v.rn = 1
-            JOIN
-                destinations dest ON d.destination_id = dest.id
-            WHERE
-                d.destination_id = ? AND d.is_deleted = 0
-            ORDER BY
-                d.description;
-        """
-        return conn.execute(query, (destination_id,)).fetchall()
+        return conn.execute(_DEVICES_LAST_VERIFICATION_QUERY, (destination_id,)).fetchall()
+
+def iter_devices_with_last_verification_for_destination(destination_id: int, batch_size: int = 500):
+    """
+    Come get_devices_with_last_verification_for_destination, ma restituisce le righe
+    a blocchi direttamente dal cursore, senza caricarle tutte in memoria.
+    """
+    with DatabaseConnection() as conn:
+        cursor = conn.execute(_DEVICES_LAST_VERIFICATION_QUERY, (destination_id,))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
 
 def add_destination(uuid, customer_id, name, address, timestamp):
     """Aggiunge una nuova destinazione."""
@@ -550,6 +1282,89 @@ def get_all_customers(search_query=None):
         query += " ORDER BY name"
         return conn.execute(query, params).fetchall()
 
+# --- Paginazione keyset per le tabelle del manager ---
+# Le pagine successive partono dalla chiave dell'ultima riga ricevuta (valori di
+# ordinamento + id): nessun OFFSET, costo costante qualunque sia la pagina.
+MANAGER_PAGE_SIZE = 200
+
+CUSTOMER_SORT_COLUMNS = {
+    "id": [],
+    "name": ["COALESCE(c.name, '')"],
+}
+
+DEVICE_SORT_COLUMNS = {
+    "id": [],
+    "description": ["COALESCE(d.description, '')"],
+    "department": ["COALESCE(d.department, '')"],
+    "serial_number": ["COALESCE(d.serial_number, '')"],
+    "manufacturer": ["COALESCE(d.manufacturer, '')"],
+    "model": ["COALESCE(d.model, '')"],
+    "customer_inventory": ["COALESCE(d.customer_inventory, '')"],
+    "ams_inventory": ["COALESCE(d.ams_inventory, '')"],
+    "verification_interval": ["COALESCE(d.verification_interval, -1)"],
+    "status": ["COALESCE(d.status, '')", "COALESCE(d.description, '')"],
+}
+
+def _keyset_page(conn, select_sql: str, where: list, params: list, sort_exprs: list, id_expr: str,
+                 descending: bool, after, limit: int):
+    """
+    Esegue una query paginata a chiave. Ogni riga restituita contiene anche le colonne
+    _k0.._kN (valori di ordinamento e id) da ripassare come 'after' per la pagina successiva.
+    """
+    key_exprs = sort_exprs + [id_expr]
+    key_cols = ", ".join(f"{expr} AS _k{i}" for i, expr in enumerate(key_exprs))
+    where, params = list(where), list(params)
+    if after:
+        op = "<" if descending else ">"
+        where.append(f"({', '.join(key_exprs)}) {op} ({', '.join('?' for _ in key_exprs)})")
+        params.extend(after)
+    direction = " DESC" if descending else ""
+    query = (f"{select_sql.replace('SELECT ', f'SELECT {key_cols}, ', 1)} WHERE {' AND '.join(where)} "
+             f"ORDER BY {', '.join(expr + direction for expr in key_exprs)} LIMIT ?")
+    return conn.execute(query, params + [limit]).fetchall()
+
+def page_key(row) -> tuple:
+    """Chiave keyset di una riga restituita da una funzione *_page."""
+    return tuple(row[k] for k in row.keys() if k.startswith("_k"))
+
+def get_customers_page(search_query=None, sort_key: str = "name", descending: bool = False,
+                       after=None, limit: int = MANAGER_PAGE_SIZE):
+    """Pagina di clienti (non eliminati), filtrata per nome e ordinata in SQL."""
+    where, params = ["c.is_deleted = 0"], []
+    if search_query:
+        where.append("c.name LIKE ?")
+        params.append(f"%{search_query}%")
+    with DatabaseConnection() as conn:
+        return _keyset_page(conn, "SELECT c.* FROM customers c", where, params,
+                            CUSTOMER_SORT_COLUMNS.get(sort_key, CUSTOMER_SORT_COLUMNS["name"]), "c.id",
+                            descending, after, limit)
+
+def get_devices_page(destination_id: int = None, customer_id: int = None, search_query=None,
+                     sort_key: str = None, descending: bool = False, after=None, limit: int = MANAGER_PAGE_SIZE):
+    """
+    Pagina di dispositivi (attivi e dismessi) di una destinazione o di tutte le
+    destinazioni di un cliente. Senza sort_key: per stato e descrizione come in passato
+    per la singola destinazione, per descrizione per il cliente.
+    """
+    where, params = ["d.is_deleted = 0"], []
+    if destination_id is not None:
+        select_sql = "SELECT d.* FROM devices d"
+        where.append("d.destination_id = ?")
+        params.append(destination_id)
+        sort_key = sort_key or "status"
+    else:
+        select_sql = "SELECT d.* FROM devices d JOIN destinations dest ON d.destination_id = dest.id"
+        where.append("dest.customer_id = ?")
+        params.append(customer_id)
+        sort_key = sort_key or "description"
+    if search_query:
+        where.append("(d.description LIKE ? OR d.serial_number LIKE ? OR d.model LIKE ?)")
+        params.extend([f"%{search_query}%"] * 3)
+    with DatabaseConnection() as conn:
+        return _keyset_page(conn, select_sql, where, params,
+                            DEVICE_SORT_COLUMNS.get(sort_key, DEVICE_SORT_COLUMNS["description"]), "d.id",
+                            descending, after, limit)
+
 def get_customer_by_id(customer_id):
     with DatabaseConnection() as conn:
         return conn.execute("SELECT * FROM customers WHERE id = ? AND is_deleted = 0", (customer_id,)).fetchone()
@@ -571,51 +1386,87 @@ def get_signature_by_username(username: str):
 
 # --- Gestione Verifiche (Verifications) ---
 
-def generate_verification_code(conn, technician_name: str = "", technician_username: str = "") -> str:
+CODE_PREFIX_FALLBACK = "XX"
+
+def _normalize_code_prefix(prefix: str) -> str:
+    """Stessa regola del server (^[A-Z]{2}$): accenti rimossi, altrimenti CODE_PREFIX_FALLBACK."""
+    ascii_prefix = unicodedata.normalize("NFKD", prefix).encode("ascii", "ignore").decode("ascii").upper()
+    return ascii_prefix if re.fullmatch(r"[A-Z]{2}", ascii_prefix) else CODE_PREFIX_FALLBACK
+
+def verification_code_prefix(technician_name: str = "", technician_username: str = "") -> str:
     """
-    Genera un codice univoco per verifica: 2 iniziali + 6 cifre progressivo.
-    Usa le iniziali di nome cognome (o username se disponibile).
-    Esempio: EM000001
-    """
-    def _initials_from(name: str) -> str:
-        name = (name or "").strip()
-        if not name and technician_username:
-            return technician_username[:2].upper()
-        parts = name.split()
-        if len(parts) >= 2:
-            return (parts[0][0] + parts[1][0]).upper()
-        if len(parts) == 1 and parts[0]:
-            return (parts[0][0] * 2).upper()  # es. "Elson" -> "EE"
-        return "XX"
-
-    prefix = _initials_from(technician_name)
-
-    cur = conn.execute("""
-        SELECT verification_code
-        FROM verifications
-        WHERE verification_code LIKE ?
-        ORDER BY verification_code DESC
-        LIMIT 1
-    """, (prefix + "%",))
-    row = cur.fetchone()
+    Prefisso dei codici di verifica: iniziali di nome e cognome (o username se
+    il nome non è disponibile). Esempio: "Elson Meta" -> "EM", "Élodie Marì" -> "EM".
+    Prefissi che non sono due lettere (es. username "m.rossi") diventano "XX".
+    """
+    name = (technician_name or "").strip()
+    if not name and technician_username:
+        return _normalize_code_prefix(technician_username[:2])
+    parts = name.split()
+    if len(parts) >= 2:
+        return _normalize_code_prefix(parts[0][0] + parts[1][0])
+    if len(parts) == 1 and parts[0]:
+        return _normalize_code_prefix(parts[0][0] * 2)  # es. "Elson" -> "EE"
+    return CODE_PREFIX_FALLBACK
+
+def allocate_verification_code(conn, technician_name: str = "", technician_username: str = "") -> str:
+    """
+    Assegna il prossimo codice di verifica (2 iniziali + 6 cifre, es. EM000001)
+    in tempo costante, all'interno della transazione del chiamante.
+    Usa per primi i numeri dei blocchi riservati dal server, univoci fra tutte le
+    postazioni; senza blocchi disponibili (es. primo utilizzo offline) ripiega sul
+    contatore locale del prefisso.
+    """
+    prefix = verification_code_prefix(technician_name, technician_username)
+    while True:
+        block = conn.execute(
+            "SELECT id, next_number FROM verification_code_blocks WHERE prefix = ? AND next_number <= end_number ORDER BY id LIMIT 1",
+            (prefix,)).fetchone()
+        if block:
+            number = block[1]
+            conn.execute("UPDATE verification_code_blocks SET next_number = next_number + 1 WHERE id = ?", (block[0],))
+        else:
+            number = conn.execute("""
+                INSERT INTO verification_code_counters (prefix, next_number) VALUES (?, 2)
+                ON CONFLICT(prefix) DO UPDATE SET next_number = next_number + 1
+                RETURNING next_number - 1
+            """, (prefix,)).fetchone()[0]
+        code = f"{prefix}{number:06d}"
+        # Controllo di sicurezza (via indice) contro codici già presenti
+        if not conn.execute("SELECT 1 FROM verifications WHERE verification_code = ? LIMIT 1", (code,)).fetchone():
+            return code
 
-    if row and row[0]:
-        try:
-            last_num = int(row[0][2:])
-        except Exception:
-            last_num = 0
-        new_num = last_num + 1
-    else:
-        new_num = 1
+def generate_verification_code(conn, technician_name: str = "", technician_username: str = "") -> str:
+    """Compatibilità: equivale ad allocate_verification_code."""
+    return allocate_verification_code(conn, technician_name, technician_username)
 
-    return f"{prefix}{new_num:06d}"
+def get_code_block_request(prefix: str, block_size: int, low_watermark: int):
+    """
+    Richiesta di un nuovo blocco di codici da inviare con la sincronizzazione,
+    oppure None se i numeri riservati ancora disponibili per il prefisso bastano.
+    """
+    with DatabaseConnection() as conn:
+        remaining = conn.execute(
+            "SELECT COALESCE(SUM(end_number - next_number + 1), 0) FROM verification_code_blocks WHERE prefix = ? AND next_number <= end_number",
+            (prefix,)).fetchone()[0]
+    if remaining >= low_watermark:
+        return None
+    return {"prefix": prefix, "size": block_size}
 
+def store_code_blocks(conn, blocks: list):
+    """Registra i blocchi di codici riservati dal server (lista di {prefix, start, end})."""
+    now = datetime.now(timezone.utc).isoformat()
+    for block in blocks or []:
+        conn.execute(
+            "INSERT INTO verification_code_blocks (prefix, next_number, end_number, reserved_at) VALUES (?, ?, ?, ?)",
+            (block["prefix"], int(block["start"]), int(block["end"]), now))
+        logging.info(f"Riservati dal server i codici {block['prefix']}{int(block['start']):06d}-{block['prefix']}{int(block['end']):06d}.")
 
 def save_verification(uuid, device_id, profile_name, results, overall_status,
                       visual_inspection_data, mti_info,
                       technician_name, technician_username,
                       timestamp, verification_date=None,
-                      verification_code: str = None):
+                      verification_code: str = None, captures: list = None):
     if verification_date is None:
         verification_date = datetime.now().strftime('%Y-%m-%d')
 
@@ -625,10 +1476,13 @@ def save_verification(uuid, device_id, profile_name, results, overall_status,
 
     with DatabaseConnection() as conn:
         cursor = conn.cursor()
+        # Prende subito il lock di scrittura: avanzamento del contatore dei codici
+        # e INSERT avvengono nella stessa transazione, evitando codici duplicati.
+        cursor.execute("BEGIN IMMEDIATE")
 
-        # Se non passato, generiamo qui il codice
+        # Se non passato, assegniamo qui il codice
         if not verification_code:
-            verification_code = generate_verification_code(conn, technician_name, technician_username)
+            verification_code = allocate_verification_code(conn, technician_name, technician_username)
 
         sql_query = """
             INSERT INTO verifications (
@@ -654,8 +1508,31 @@ def save_verification(uuid, device_id, profile_name, results, overall_status,
         )
         cursor.execute(sql_query, params)
         new_id = cursor.lastrowid
+        _insert_measurements(conn, _measurement_rows(new_id, device_id, verification_date, results))
+
+        # Le catture complete delle letture vanno in una tabella separata,
+        # nella stessa transazione della verifica.
+        if captures:
+            cursor.executemany(
+                "INSERT INTO verification_captures (verification_id, result_index, test_name, sample_count, started_at, data) VALUES (?, ?, ?, ?, ?, ?)",
+                [(new_id, c['result_index'], c.get('test_name'), c['sample_count'], c.get('started_at'), sqlite3.Binary(c['data'])) for c in captures]
+            )
         return verification_code, new_id
 
+def get_verification_captures_index(verification_id: int) -> list:
+    """Elenco delle catture di una verifica (solo metadati, senza caricare i blob)."""
+    with DatabaseConnection() as conn:
+        return conn.execute(
+            "SELECT id, result_index, test_name, sample_count, started_at FROM verification_captures WHERE verification_id = ? ORDER BY result_index",
+            (verification_id,)
+        ).fetchall()
+
+def get_verification_capture_data(capture_id: int):
+    """Restituisce (started_at, blob) di una singola cattura, o None."""
+    with DatabaseConnection() as conn:
+        row = conn.execute("SELECT started_at, data FROM verification_captures WHERE id = ?", (capture_id,)).fetchone()
+    return (row['started_at'], bytes(row['data'])) if row else None
+
 def verification_exists(device_id: int, verification_date: str, profile_name: str) -> bool:
     """Verifica se esiste già una verifica per dispositivo/data/profilo."""
     with DatabaseConnection() as conn:
@@ -681,38 +1558,217 @@ def get_verifications_for_destination_by_date_range(destination_id: int, start_d
         """
         return conn.execute(query, (destination_id, start_date, end_date)).fetchall()
 
-def get_full_verification_data_for_date(target_date: str) -> dict:
+# Destinazione usata per i clienti importati da archivio che non ne hanno una
+STM_DEFAULT_DESTINATION = "Sede Principale"
+
+def _stm_json_field(value, default):
+    """I campi JSON dell'archivio possono essere stringhe (formato 1.0) o già decodificati."""
+    if value is None or value == "":
+        return default
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+# Formati dell'archivio .stm: 1.0 = campi JSON annidati come stringhe, 2.0 = strutture decodificate
+STM_FORMAT_V1 = "1.0"
+STM_FORMAT_V2 = "2.0"
+
+_STM_EXPORT_QUERY = """
+    SELECT v.*, d.serial_number, d.description, d.manufacturer, d.model, d.department,
+           d.applied_parts_json, d.customer_inventory, d.ams_inventory,
+           d.verification_interval, d.default_profile_key,
+           dest.name as destination_name, dest.address as destination_address,
+           c.name as customer_name, c.address as customer_address
+    FROM verifications v
+    JOIN devices d ON v.device_id = d.id
+    JOIN destinations dest ON d.destination_id = dest.id
+    JOIN customers c ON dest.customer_id = c.id
+"""
+
+def build_stm_package(row, format_version: str = STM_FORMAT_V1) -> dict:
+    """Converte una riga della query di export nel pacchetto .stm della versione richiesta."""
+    mti_info = {"instrument": row["mti_instrument"], "serial": row["mti_serial"], "version": row["mti_version"], "cal_date": row["mti_cal_date"]}
+    if format_version == STM_FORMAT_V1:
+        return {
+            "customer": {"name": row["customer_name"], "address": row["customer_address"]},
+            "device": {"serial_number": row["serial_number"], "description": row["description"], "manufacturer": row["manufacturer"], "model": row["model"], "applied_parts_json": row["applied_parts_json"], "customer_inventory": row["customer_inventory"], "ams_inventory": row["ams_inventory"]},
+            "verification_details": {"verification_date": row["verification_date"], "profile_name": row["profile_name"], "results_json": row["results_json"], "overall_status": row["overall_status"], "visual_inspection_json": row["visual_inspection_json"], "technician_name": row["technician_name"], "mti_info": mti_info}
+        }
+    return {
+        "customer": {"name": row["customer_name"], "address": row["customer_address"]},
+        "destination": {"name": row["destination_name"], "address": row["destination_address"]},
+        "device": {"serial_number": row["serial_number"], "description": row["description"], "manufacturer": row["manufacturer"], "model": row["model"], "department": row["department"],
+                   "applied_parts": _stm_json_field(row["applied_parts_json"], []), "customer_inventory": row["customer_inventory"], "ams_inventory": row["ams_inventory"],
+                   "verification_interval": row["verification_interval"], "default_profile_key": row["default_profile_key"]},
+        "verification_details": {"verification_date": row["verification_date"], "profile_name": row["profile_name"], "verification_code": row["verification_code"],
+                                 "results": _stm_json_field(row["results_json"], []), "overall_status": row["overall_status"],
+                                 "visual_inspection": _stm_json_field(row["visual_inspection_json"], {}),
+                                 "technician_name": row["technician_name"], "technician_username": row["technician_username"], "mti_info": mti_info}
+    }
+
+def iter_verifications_for_export(start_date: str, end_date: str, format_version: str = STM_FORMAT_V1, batch_size: int = 500):
     """
-    Recupera tutte le verifiche di una data specifica per l'export STM,
-    usando la nuova struttura a destinazioni.
+    Generatore dei pacchetti .stm delle verifiche nell'intervallo di date (estremi inclusi).
+    Le righe vengono lette dal cursore a blocchi di batch_size: in memoria resta
+    solo il blocco corrente, qualunque sia l'ampiezza dell'intervallo.
     """
-    from datetime import datetime
+    query = _STM_EXPORT_QUERY + " WHERE v.verification_date BETWEEN ? AND ? AND v.is_deleted = 0"
+    query += " ORDER BY v.verification_date, c.name, d.description"
     with DatabaseConnection() as conn:
-        # --- UPDATED QUERY ---
-        # We now use a double JOIN to get from the device to the customer
-        query = """
-            SELECT v.*, d.serial_number, d.description, d.manufacturer, d.model,
-                   d.applied_parts_json, d.customer_inventory, d.ams_inventory,
-                   c.name as customer_name, c.address as customer_address
-            FROM verifications v
-            JOIN devices d ON v.device_id = d.id
-            JOIN destinations dest ON d.destination_id = dest.id
-            JOIN customers c ON dest.customer_id = c.id
-            WHERE v.verification_date = ? AND v.is_deleted = 0
-            ORDER BY c.name, d.description
-        """
-        rows = conn.execute(query, (target_date,)).fetchall()
+        cursor = conn.execute(query, (start_date, end_date))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield build_stm_package(row, format_version)
+
+def count_verifications_for_export(start_date: str, end_date: str) -> int:
+    """Numero di verifiche che iter_verifications_for_export restituirebbe (per l'avanzamento)."""
+    query = """
+        SELECT COUNT(*) FROM verifications v
+        JOIN devices d ON v.device_id = d.id
+        JOIN destinations dest ON d.destination_id = dest.id
+        WHERE v.verification_date BETWEEN ? AND ? AND v.is_deleted = 0
+    """
+    with DatabaseConnection() as conn:
+        return conn.execute(query, (start_date, end_date)).fetchone()[0]
 
-    export_structure = {"export_format_version": "1.0", "export_creation_date": datetime.now().isoformat(), "verifications_for_date": target_date, "verifications": []}
-    for row_proxy in rows:
-        row = dict(row_proxy)
-        export_structure["verifications"].append({
-            "customer": {"name": row["customer_name"], "address": row["customer_address"]},
-            "device": {"serial_number": row["serial_number"], "description": row["description"], "manufacturer": row["manufacturer"], "model": row["model"], "applied_parts_json": row["applied_parts_json"], "customer_inventory": row["customer_inventory"], "ams_inventory": row["ams_inventory"]},
-            "verification_details": {"verification_date": row["verification_date"], "profile_name": row["profile_name"], "results_json": row["results_json"], "overall_status": row["overall_status"], "visual_inspection_json": row["visual_inspection_json"], "technician_name": row.get("technician_name"), "mti_info": {"instrument": row["mti_instrument"], "serial": row["mti_serial"], "version": row["mti_version"], "cal_date": row["mti_cal_date"]}}
-        })
+def get_full_verification_data_for_date(target_date: str) -> dict:
+    """
+    Recupera tutte le verifiche di una data specifica per l'export STM
+    (formato 1.0, interamente in memoria: per intervalli ampi usare iter_verifications_for_export).
+    """
+    export_structure = {"export_format_version": STM_FORMAT_V1, "export_creation_date": datetime.now().isoformat(), "verifications_for_date": target_date, "verifications": []}
+    export_structure["verifications"].extend(iter_verifications_for_export(target_date, target_date))
     return export_structure
 
+def import_stm_packages(packages, placeholder_serials=(), timestamp: str = None) -> dict:
+    """
+    Importa i pacchetti di un archivio .stm in un'unica transazione.
+    Clienti, destinazioni, dispositivi e chiavi delle verifiche esistenti vengono
+    precaricati una sola volta; i pacchetti non validi vengono scartati senza
+    interrompere l'importazione. 'packages' può essere un qualsiasi iterabile
+    (anche un parser in streaming).
+    """
+    timestamp = timestamp or datetime.now(timezone.utc).isoformat()
+    counts = {"verifications_imported": 0, "verifications_skipped": 0, "invalid_packages": 0,
+              "devices_created": 0, "customers_created": 0, "destinations_created": 0}
+
+    with DatabaseConnection() as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        customers = {r['name']: r['id'] for r in cur.execute("SELECT id, name FROM customers WHERE is_deleted = 0")}
+        destinations, default_destination = {}, {}
+        for r in cur.execute("SELECT id, customer_id, name FROM destinations WHERE is_deleted = 0 ORDER BY id"):
+            destinations[(r['customer_id'], r['name'])] = r['id']
+            default_destination.setdefault(r['customer_id'], r['id'])
+        devices_by_serial, devices_by_ams = {}, {}
+        for r in cur.execute("""
+            SELECT d.id, d.serial_number, d.ams_inventory, dest.customer_id
+            FROM devices d JOIN destinations dest ON d.destination_id = dest.id
+            WHERE d.is_deleted = 0
+        """):
+            if r['serial_number']: devices_by_serial.setdefault(r['serial_number'], r['id'])
+            if r['ams_inventory']: devices_by_ams.setdefault((r['customer_id'], r['ams_inventory']), r['id'])
+        verification_keys = {tuple(r) for r in cur.execute(
+            "SELECT device_id, verification_date, profile_name FROM verifications WHERE is_deleted = 0")}
+        used_codes = {r[0] for r in cur.execute("SELECT verification_code FROM verifications WHERE verification_code IS NOT NULL")}
+        known_tests = _known_test_names(conn)
+
+        for package in packages:
+            # --- 1. Validazione completa prima di qualsiasi scrittura ---
+            try:
+                customer_data = package['customer']
+                device_data = package['device']
+                details = package['verification_details']
+                customer_name = (customer_data.get('name') or '').strip()
+                if not customer_name:
+                    raise ValueError("nome cliente mancante")
+                destination_name = ((package.get('destination') or {}).get('name') or '').strip()
+                serial = (device_data.get('serial_number') or '').strip().upper() or None
+                if serial in placeholder_serials:
+                    serial = None
+                ams_inv = (device_data.get('ams_inventory') or '').strip()
+                applied_parts = _stm_json_field(device_data.get('applied_parts_json', device_data.get('applied_parts')), [])
+                results = _stm_json_field(details.get('results_json', details.get('results')), [])
+                visual = _stm_json_field(details.get('visual_inspection_json', details.get('visual_inspection')), {})
+                verif_date = details['verification_date']
+                profile_name = details['profile_name']
+                overall_status = details['overall_status']
+                mti = details.get('mti_info') or {}
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                logging.warning(f"Pacchetto .stm non valido, scartato: {e}")
+                counts["invalid_packages"] += 1
+                continue
+
+            # --- 2. Cliente ---
+            customer_id = customers.get(customer_name)
+            if customer_id is None:
+                cur.execute(
+                    "INSERT INTO customers (uuid, name, address, phone, email, last_modified, is_synced, is_deleted) VALUES (?, ?, ?, '', '', ?, 0, 0)",
+                    (str(uuid.uuid4()), customer_name, customer_data.get('address') or '', timestamp))
+                customer_id = customers[customer_name] = cur.lastrowid
+                counts["customers_created"] += 1
+
+            # --- 3. Dispositivo (e destinazione, solo se va creato) ---
+            device_id = devices_by_serial.get(serial) if serial else None
+            if device_id is None and not serial and ams_inv:
+                device_id = devices_by_ams.get((customer_id, ams_inv))
+            if device_id is None:
+                if destination_name:
+                    destination_id = destinations.get((customer_id, destination_name))
+                else:
+                    destination_id = default_destination.get(customer_id)
+                    destination_name = STM_DEFAULT_DESTINATION
+                if destination_id is None:
+                    cur.execute(
+                        "INSERT INTO destinations (uuid, customer_id, name, address, last_modified, is_synced, is_deleted) VALUES (?, ?, ?, ?, ?, 0, 0)",
+                        (str(uuid.uuid4()), customer_id, destination_name, customer_data.get('address') or '', timestamp))
+                    destination_id = destinations[(customer_id, destination_name)] = cur.lastrowid
+                    default_destination.setdefault(customer_id, destination_id)
+                    counts["destinations_created"] += 1
+                cur.execute("""
+                    INSERT INTO devices (
+                        uuid, destination_id, serial_number, description, manufacturer, model, department,
+                        applied_parts_json, customer_inventory, ams_inventory, verification_interval,
+                        default_profile_key, last_modified, is_synced, is_deleted, status
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 0, 'active')
+                """, (str(uuid.uuid4()), destination_id, serial, device_data.get('description') or '',
+                      device_data.get('manufacturer') or '', device_data.get('model') or '', device_data.get('department') or '',
+                      json.dumps(applied_parts), device_data.get('customer_inventory') or '', ams_inv,
+                      device_data.get('verification_interval'), device_data.get('default_profile_key'), timestamp))
+                device_id = cur.lastrowid
+                if serial: devices_by_serial[serial] = device_id
+                elif ams_inv: devices_by_ams[(customer_id, ams_inv)] = device_id
+                counts["devices_created"] += 1
+
+            # --- 4. Verifica ---
+            key = (device_id, verif_date, profile_name)
+            if key in verification_keys:
+                counts["verifications_skipped"] += 1
+                continue
+            technician_name = details.get('technician_name') or ''
+            code = details.get('verification_code')
+            if not code or code in used_codes:
+                code = allocate_verification_code(conn, technician_name)
+            cur.execute("""
+                INSERT INTO verifications (
+                    uuid, device_id, verification_date, profile_name, results_json, overall_status,
+                    visual_inspection_json, mti_instrument, mti_serial, mti_version, mti_cal_date,
+                    technician_name, technician_username, verification_code, last_modified, is_deleted, is_synced
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 0)
+            """, (str(uuid.uuid4()), device_id, verif_date, profile_name, json.dumps(results), overall_status,
+                  json.dumps(visual), mti.get('instrument'), mti.get('serial'), mti.get('version'), mti.get('cal_date'),
+                  technician_name, details.get('technician_username'), code, timestamp))
+            _insert_measurements(conn, _measurement_rows(cur.lastrowid, device_id, verif_date, results, known_tests))
+            verification_keys.add(key)
+            used_codes.add(code)
+            counts["verifications_imported"] += 1
+
+    logging.info(f"Importazione archivio .stm completata: {counts}")
+    return counts
+
 def soft_delete_verification(verification_id, timestamp):
     """Esegue un 'soft delete' di una singola verifica."""
     with DatabaseConnection() as conn:
@@ -750,40 +1806,60 @@ def get_verifications_for_destination_by_month(destination_id: int, year: int, m
         """
         return conn.execute(query, (year_str, month_str, destination_id)).fetchall()
 
-def update_device_next_verification_date(device_id, interval_months, timestamp):
+def compute_next_verification_date(verification_date: str, interval_months) -> str:
+    """Prossima scadenza (YYYY-MM-DD) a partire dalla data effettiva della verifica."""
     from dateutil.relativedelta import relativedelta
-    next_date = datetime.now() + relativedelta(months=int(interval_months))
-    next_date_str = next_date.strftime('%Y-%m-%d')
+    if not verification_date or interval_months in (None, "", "Nessuno") or int(interval_months) <= 0:
+        return None
+    base = datetime.strptime(verification_date[:10], '%Y-%m-%d')
+    return (base + relativedelta(months=int(interval_months))).strftime('%Y-%m-%d')
+
+def update_device_next_verification_date(device_id, interval_months, timestamp):
+    """
+    Ricalcola la scadenza del dispositivo dalla sua ultima verifica.
+    Normalmente non serve chiamarla: i trigger dello scadenziario la mantengono aggiornata.
+    """
     with DatabaseConnection() as conn:
+        row = conn.execute("SELECT verification_date FROM device_last_verification WHERE device_id = ?", (device_id,)).fetchone()
+        next_date_str = compute_next_verification_date(row[0] if row else None, interval_months)
         conn.execute("UPDATE devices SET next_verification_date = ?, last_modified = ?, is_synced = 0 WHERE id = ?", (next_date_str, timestamp, device_id))
 
 
+# Un dispositivo è verificato nel periodo se la sua ultima verifica vi ricade; solo se
+# l'ultima verifica è successiva al periodo serve cercarne una precedente (via indice).
+_VERIFIED_IN_PERIOD_SQL = """
+    CASE
+        WHEN lv.verification_date BETWEEN :start_date AND :end_date THEN 1
+        WHEN lv.verification_date > :end_date THEN EXISTS (
+            SELECT 1 FROM verifications v
+            WHERE v.device_id = d.id AND v.is_deleted = 0
+            AND v.verification_date BETWEEN :start_date AND :end_date)
+        ELSE 0
+    END
+"""
+
 def get_devices_verification_status_by_period(destination_id: int, start_date: str, end_date: str):
     """
     Recupera tutti i dispositivi di una specifica destinazione e controlla il loro
     stato di verifica in un dato intervallo di date.
     """
+    query = f"""
+        SELECT d.id, d.description, d.serial_number, d.model, {_VERIFIED_IN_PERIOD_SQL} AS verified_in_period
+        FROM devices d
+        LEFT JOIN device_last_verification lv ON lv.device_id = d.id
+        WHERE d.destination_id = :destination_id AND d.is_deleted = 0
+        ORDER BY d.description
+    """
+    params = {"destination_id": destination_id, "start_date": start_date, "end_date": end_date}
     with DatabaseConnection() as conn:
-        # 1. Recupera tutti i dispositivi attivi della destinazione selezionata
-        all_devices_query = "SELECT id, description, serial_number, model FROM devices WHERE destination_id = ? AND is_deleted = 0 ORDER BY description"
-        all_devices = conn.execute(all_devices_query, (destination_id,)).fetchall()
-
-        # 2. Recupera gli ID dei dispositivi di QUESTA destinazione che sono stati verificati nel periodo
-        verified_devices_query = """
-            SELECT DISTINCT device_id FROM verifications
-            WHERE device_id IN (SELECT id FROM devices WHERE destination_id = ?)
-            AND verification_date BETWEEN ? AND ?
-            AND is_deleted = 0
-        """
-        verified_ids_cursor = conn.execute(verified_devices_query, (destination_id, start_date, end_date))
-        verified_ids = {row['device_id'] for row in verified_ids_cursor}
+        rows = conn.execute(query, params).fetchall()
 
     verified_list = []
     unverified_list = []
 
-    for device_row in all_devices:
+    for device_row in rows:
         device_dict = dict(device_row)
-        if device_dict['id'] in verified_ids:
+        if device_dict.pop('verified_in_period'):
             verified_list.append(device_dict)
         else:
             unverified_list.append(device_dict)
@@ -812,35 +1888,15 @@ def get_unverified_devices_for_destination_in_period(destination_id: int, start_
     Returns a list of devices for a specific destination that have NOT had
     a verification within the specified period.
     """
+    query = f"""
+        SELECT d.* FROM devices d
+        LEFT JOIN device_last_verification lv ON lv.device_id = d.id
+        WHERE d.destination_id = :destination_id AND d.is_deleted = 0
+        AND NOT {_VERIFIED_IN_PERIOD_SQL}
+        ORDER BY d.description
+    """
     with DatabaseConnection() as conn:
-        # First, find the IDs of devices in this destination that WERE verified in the period
-        verified_devices_query = """
-            SELECT DISTINCT device_id FROM verifications
-            WHERE device_id IN (SELECT id FROM devices WHERE destination_id = ?)
-            AND verification_date BETWEEN ? AND ?
-            AND is_deleted = 0
-        """
-        verified_ids_cursor = conn.execute(verified_devices_query, (destination_id, start_date, end_date))
-        verified_ids = {row['device_id'] for row in verified_ids_cursor}
-
-        # Now, get all devices from this destination that are NOT in the verified list
-        # We need to handle the case where verified_ids is empty
-        if not verified_ids:
-            unverified_devices_query = "SELECT * FROM devices WHERE destination_id = ? AND is_deleted = 0 ORDER BY description"
-            params = (destination_id,)
-        else:
-            # Create a string of placeholders for the IN clause
-            placeholders = ', '.join('?' for _ in verified_ids)
-            unverified_devices_query = f"""
-                SELECT * FROM devices
-                WHERE destination_id = ?
-                AND is_deleted = 0
-                AND id NOT IN ({placeholders})
-                ORDER BY description
-            """
-            params = (destination_id, *verified_ids)
-
-        return conn.execute(unverified_devices_query, params).fetchall()
+        return conn.execute(query, {"destination_id": destination_id, "start_date": start_date, "end_date": end_date}).fetchall()
 
 # --- Gestione Strumenti (Instruments) ---
 
@@ -865,17 +1921,333 @@ def set_default_instrument(inst_id, timestamp):
         conn.execute("UPDATE mti_instruments SET is_default = 0, last_modified=?, is_synced=0", (timestamp,))
         conn.execute("UPDATE mti_instruments SET is_default = 1, last_modified=?, is_synced=0 WHERE id = ?", (timestamp, inst_id))
 
+# --- Misure delle verifiche (verification_measurements) ---
+_RESULT_WITH_PARAMETER = re.compile(r"^(.*) \(([^()]*)\)$")
+# Nome composto "Test - Parte applicata - Tipo": il tipo chiude sempre il nome
+_RESULT_WITH_APPLIED_PART = re.compile(r"^(.+) - (ST|B|BF|CF)$")
+_MEASUREMENT_COLUMNS = ("verification_id", "device_id", "verification_date", "result_index", "test_name", "parameter",
+                        "applied_part", "applied_part_type", "value", "value_text", "unit", "limit_value", "passed")
+
+def parse_result_name(result: dict, known_tests=()) -> tuple:
+    """
+    (test, parametro, parte applicata, tipo parte applicata) di un risultato.
+    I risultati recenti riportano i campi separati; per quelli più vecchi vengono
+    ricavati dal nome composto in widgets.py: "Test (parametro)" oppure
+    "Test - Parte applicata - Tipo". Nel secondo caso il nome del test (che può
+    contenere " - ", come quello della parte applicata) viene riconosciuto tra
+    known_tests, i nomi dei test dei profili; in mancanza si divide sull'ultimo " - ".
+    """
+    if result.get("test_name"):
+        return (result["test_name"], result.get("parameter") or None,
+                result.get("applied_part") or None, result.get("applied_part_type") or None)
+    name = (result.get("name") or "").strip()
+    match = _RESULT_WITH_APPLIED_PART.match(name)
+    if match:
+        test_and_part, part_type = match.groups()
+        test_name = max((t for t in known_tests if test_and_part.startswith(f"{t} - ")), key=len, default=None)
+        if test_name:
+            return test_name, None, test_and_part[len(test_name) + 3:], part_type
+        test_name, separator, applied_part = test_and_part.rpartition(" - ")
+        if separator:
+            return test_name, None, applied_part, part_type
+    match = _RESULT_WITH_PARAMETER.match(name)
+    if match:
+        return match.group(1), match.group(2), None, None
+    return name, None, None, None
+
+def _measurement_number(value):
+    """Valore numerico di una misura come lo interpreta widgets.py, o None."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(re.sub(r'[^\d.-]', '', str(value).replace(',', '.')))
+    except ValueError:
+        return None
+
+def _known_test_names(conn) -> frozenset:
+    """Nomi dei test dei profili, per scomporre i nomi composti dei risultati più vecchi."""
+    return frozenset(r[0] for r in conn.execute("SELECT DISTINCT name FROM profile_tests WHERE name IS NOT NULL"))
+
+def _measurement_rows(verification_id, device_id, verification_date, results, known_tests=()) -> list:
+    rows = []
+    for index, result in enumerate(results or []):
+        if not isinstance(result, dict):
+            continue
+        test_name, parameter, applied_part, applied_part_type = parse_result_name(result, known_tests)
+        if not test_name:
+            continue
+        value = result.get("value")
+        passed = result.get("passed")
+        rows.append((verification_id, device_id, verification_date, index, test_name, parameter, applied_part,
+                     applied_part_type, _measurement_number(value), None if value is None else str(value),
+                     result.get("unit") or None, _measurement_number(result.get("limit_value")),
+                     None if passed is None else int(bool(passed))))
+    return rows
+
+def _insert_measurements(conn, rows: list):
+    if rows:
+        conn.executemany(
+            f"INSERT INTO verification_measurements ({', '.join(_MEASUREMENT_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(_MEASUREMENT_COLUMNS))})", rows)
+
+def refresh_verification_measurements(conn, uuids: list = None, batch_size: int = 500) -> int:
+    """
+    Ricostruisce le misure delle verifiche indicate per uuid (tutte se None) a
+    partire da results_json, nella transazione del chiamante. Usata dalla
+    sincronizzazione per le verifiche ricevute e dal popolamento iniziale.
+    Restituisce il numero di misure scritte.
+    """
+    if uuids is not None and not uuids:
+        return 0
+    if uuids is None:
+        conn.execute("DELETE FROM verification_measurements")
+        batches = [None]
+    else:
+        batches = [uuids[i:i + batch_size] for i in range(0, len(uuids), batch_size)]
+
+    written = 0
+    known_tests = _known_test_names(conn)
+    for batch in batches:
+        query = "SELECT id, device_id, verification_date, results_json FROM verifications WHERE is_deleted = 0"
+        params = []
+        if batch is not None:
+            placeholders = ", ".join("?" * len(batch))
+            conn.execute(f"DELETE FROM verification_measurements WHERE verification_id IN "
+                         f"(SELECT id FROM verifications WHERE uuid IN ({placeholders}))", batch)
+            query += f" AND uuid IN ({placeholders})"
+            params = batch
+        cursor = conn.execute(query, params)
+        while True:
+            chunk = cursor.fetchmany(batch_size)
+            if not chunk:
+                break
+            rows = []
+            for r in chunk:
+                try:
+                    results = json.loads(r[3]) if r[3] else []
+                except (TypeError, ValueError):
+                    logging.warning(f"results_json non valido per la verifica ID {r[0]}, misure non estratte.")
+                    continue
+                rows.extend(_measurement_rows(r[0], r[1], r[2], results, known_tests))
+            _insert_measurements(conn, rows)
+            written += len(rows)
+    return written
+
+def _measurement_filters(test_name=None, parameter=None, applied_part_type=None, date_from=None, date_to=None,
+                         min_value=None, max_value=None, passed=None, device_id=None, manufacturer=None, model=None):
+    """Clausola WHERE (su m = misure, d = dispositivi) e parametri dei filtri indicati."""
+    filters = {"m.test_name = :test_name": test_name, "m.parameter = :parameter": parameter,
+               "m.applied_part_type = :applied_part_type": applied_part_type,
+               "m.verification_date >= :date_from": date_from, "m.verification_date <= :date_to": date_to,
+               "m.value >= :min_value": min_value, "m.value <= :max_value": max_value,
+               "m.passed = :passed": None if passed is None else int(bool(passed)),
+               "m.device_id = :device_id": device_id, "d.manufacturer = :manufacturer": manufacturer, "d.model = :model": model}
+    clauses = [clause for clause, value in filters.items() if value is not None]
+    params = {clause.split(":")[1]: value for clause, value in filters.items() if value is not None}
+    return (" AND ".join(clauses) or "1"), params
+
+def get_measured_tests() -> list:
+    """Test e parametri presenti nelle misure, con unità e numero di misure."""
+    with DatabaseConnection() as conn:
+        rows = conn.execute("""
+            SELECT test_name, parameter, MAX(unit) AS unit, COUNT(*) AS measurements, COUNT(value) AS numeric_values
+            FROM verification_measurements
+            GROUP BY test_name, parameter
+            ORDER BY test_name, parameter
+        """).fetchall()
+    return [dict(r) for r in rows]
+
+def find_measurements(test_name: str, min_value: float = None, max_value: float = None, date_from: str = None,
+                      date_to: str = None, parameter: str = None, applied_part_type: str = None, passed: bool = None,
+                      manufacturer: str = None, model: str = None, limit: int = None) -> list:
+    """
+    Misure di un test che soddisfano i filtri (valori e date inclusi negli
+    estremi), con i dati del dispositivo e del cliente. Esempio: resistenza di
+    terra oltre 0,2 Ω nel 2025 ->
+    find_measurements("Resistenza di terra", min_value=0.2, date_from="2025-01-01", date_to="2025-12-31").
+    """
+    where, params = _measurement_filters(test_name, parameter, applied_part_type, date_from, date_to,
+                                         min_value, max_value, passed, None, manufacturer, model)
+    query = f"""
+        SELECT m.*, v.uuid AS verification_uuid, v.verification_code, d.serial_number, d.description,
+               d.manufacturer, d.model, dest.name AS destination_name, c.name AS customer_name
+        FROM verification_measurements m
+        JOIN devices d ON d.id = m.device_id
+        JOIN verifications v ON v.id = m.verification_id
+        JOIN destinations dest ON dest.id = d.destination_id
+        JOIN customers c ON c.id = dest.customer_id
+        WHERE {where}
+        ORDER BY m.value DESC, m.verification_date DESC
+    """
+    if limit:
+        query += " LIMIT :limit"
+        params["limit"] = int(limit)
+    with DatabaseConnection() as conn:
+        return [dict(r) for r in conn.execute(query, params).fetchall()]
+
+def get_measurement_trend(test_name: str, period: str = "month", parameter: str = None, applied_part_type: str = None,
+                          manufacturer: str = None, model: str = None, device_id: int = None,
+                          date_from: str = None, date_to: str = None) -> list:
+    """
+    Andamento di un test per periodo ('month' o 'year'): numero di misure,
+    media, minimo, massimo ed esiti negativi, eventualmente per un solo
+    modello/costruttore o dispositivo.
+    """
+    formats = {"month": "%Y-%m", "year": "%Y"}
+    if period not in formats:
+        raise ValueError(f"Periodo non valido '{period}': usare 'month' o 'year'.")
+    where, params = _measurement_filters(test_name, parameter, applied_part_type, date_from, date_to,
+                                         device_id=device_id, manufacturer=manufacturer, model=model)
+    params["period_format"] = formats[period]
+    query = f"""
+        SELECT strftime(:period_format, m.verification_date) AS period, COUNT(m.value) AS count,
+               AVG(m.value) AS mean, MIN(m.value) AS min, MAX(m.value) AS max,
+               SUM(CASE WHEN m.passed = 0 THEN 1 ELSE 0 END) AS failed, MAX(m.unit) AS unit
+        FROM verification_measurements m
+        JOIN devices d ON d.id = m.device_id
+        WHERE {where}
+        GROUP BY period
+        ORDER BY period
+    """
+    with DatabaseConnection() as conn:
+        return [dict(r) for r in conn.execute(query, params).fetchall()]
+
+def get_device_measurements(device_id: int, test_name: str = None) -> list:
+    """Storico delle misure di un dispositivo (di un solo test, se indicato), dalla più recente."""
+    where, params = _measurement_filters(test_name, device_id=device_id)
+    with DatabaseConnection() as conn:
+        rows = conn.execute(f"""
+            SELECT m.* FROM verification_measurements m
+            WHERE {where}
+            ORDER BY m.verification_date DESC, m.verification_id DESC, m.result_index
+        """, params).fetchall()
+    return [dict(r) for r in rows]
+
+def iter_measurement_series(customer_id: int = None, batch_size: int = 50_000):
+    """
+    Misure numeriche con un limite dei dispositivi attivi (di un cliente, se
+    indicato), a blocchi di batch_size righe (test, parametro, device_id, parte
+    applicata, giorno giuliano, valore, limite), per l'analisi del parco in
+    app.analytics. Senza cliente la tabella viene letta in un'unica scansione
+    sequenziale; con il cliente si passa dall'indice (device_id, verification_date).
+    """
+    query = """
+        SELECT m.test_name, m.parameter, m.device_id, COALESCE(m.applied_part, ''),
+               julianday(m.verification_date), m.value, m.limit_value
+        FROM verification_measurements m
+        WHERE m.value IS NOT NULL AND m.limit_value IS NOT NULL AND m.verification_date IS NOT NULL
+    """
+    params = {}
+    if customer_id is not None:
+        query += """ AND m.device_id IN (
+            SELECT d.id FROM devices d JOIN destinations dest ON dest.id = d.destination_id
+            WHERE dest.customer_id = :customer_id AND d.is_deleted = 0 AND COALESCE(d.status, 'active') = 'active')"""
+        params["customer_id"] = customer_id
+    else:
+        query += " AND m.device_id NOT IN (SELECT id FROM devices WHERE is_deleted = 1 OR COALESCE(status, 'active') <> 'active')"
+    with DatabaseConnection() as conn:
+        cursor = conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+
+def get_fleet_data_version():
+    """Versione corrente dei dati dell'analisi del parco (None se non disponibile)."""
+    with DatabaseConnection() as conn:
+        return get_data_version(conn, FLEET_DATA_VERSION)
+
+def get_measurement_unit(test_name: str, parameter: str = None):
+    """Unità di misura di un test (dalla prima misura che la riporta)."""
+    with DatabaseConnection() as conn:
+        row = conn.execute("""
+            SELECT unit FROM verification_measurements
+            WHERE test_name = ? AND parameter IS ? AND unit IS NOT NULL LIMIT 1
+        """, (test_name, parameter)).fetchone()
+    return row[0] if row else None
+
+def get_devices_overview(device_ids, batch_size: int = 500) -> dict:
+    """Descrizione, matricola, cliente e destinazione dei dispositivi indicati, per id."""
+    device_ids = list(device_ids)
+    overview = {}
+    with DatabaseConnection() as conn:
+        for i in range(0, len(device_ids), batch_size):
+            batch = device_ids[i:i + batch_size]
+            rows = conn.execute(f"""
+                SELECT d.id, d.description, d.serial_number, d.manufacturer, d.model, d.ams_inventory,
+                       dest.name AS destination_name, c.id AS customer_id, c.name AS customer_name
+                FROM devices d
+                JOIN destinations dest ON dest.id = d.destination_id
+                JOIN customers c ON c.id = dest.customer_id
+                WHERE d.id IN ({', '.join('?' * len(batch))})
+            """, batch).fetchall()
+            overview.update({r['id']: dict(r) for r in rows})
+    return overview
+
 # --- Statistiche ---
+def _dashboard_totals(conn) -> dict:
+    counters = dict(conn.execute("SELECT name, value FROM dashboard_counters").fetchall())
+    # L'ultima verifica valida è la più recente tra le ultime dei dispositivi (indice sulla data)
+    last_verif_date = conn.execute("SELECT MAX(verification_date) FROM device_last_verification").fetchone()[0]
+    return {"devices": counters.get("devices", 0), "customers": counters.get("customers", 0),
+            "last_verif": last_verif_date if last_verif_date else "Nessuna"}
+
 def get_stats():
+    """Clienti, dispositivi e data dell'ultima verifica, dal riepilogo mantenuto dai trigger."""
     with DatabaseConnection() as conn:
         try:
-            device_count = conn.execute("SELECT COUNT(id) FROM devices WHERE is_deleted = 0").fetchone()[0]
-            customer_count = conn.execute("SELECT COUNT(id) FROM customers WHERE is_deleted = 0").fetchone()[0]
-            last_verif_date = conn.execute("SELECT MAX(verification_date) FROM verifications WHERE is_deleted = 0").fetchone()[0]
-        except (TypeError, IndexError):
+            return _dashboard_totals(conn)
+        except sqlite3.Error:
             return {"devices": 0, "customers": 0, "last_verif": "N/A"}
-    return {"devices": device_count, "customers": customer_count, "last_verif": last_verif_date if last_verif_date else "Nessuna"}
 
+def get_dashboard_summary(days_in_future=30) -> dict:
+    """
+    Tutti i dati della dashboard in una lettura: i totali di get_stats(), l'esito
+    dell'ultima verifica dei dispositivi attivi (passed, failed, not_verified) e,
+    in 'due_by_customer', le righe di get_due_verification_summary_by_customer().
+    """
+    with DatabaseConnection() as conn:
+        summary = _dashboard_totals(conn)
+        active, passed, failed = conn.execute(
+            "SELECT COALESCE(SUM(devices), 0), COALESCE(SUM(passed), 0), COALESCE(SUM(failed), 0) FROM customer_dashboard").fetchone()
+        summary.update(active_devices=active, passed=passed, failed=failed, not_verified=active - passed - failed,
+                       due_by_customer=_due_summary_by_customer(conn, days_in_future))
+    return summary
+
+# --- Storico sincronizzazioni ---
+SYNC_HISTORY_LIMIT = 200  # Sincronizzazioni conservate in sync_history
+
+def record_sync_history(entry: dict):
+    """Registra una sincronizzazione in sync_history, conservando solo le ultime SYNC_HISTORY_LIMIT."""
+    with DatabaseConnection() as conn:
+        conn.execute("""
+            INSERT INTO sync_history (started_at, duration, status, full_sync, bytes_sent, bytes_received,
+                                      pushed_json, pulled_json, phases_json, server_phases_json, error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (entry["started_at"], entry.get("duration"), entry["status"], int(bool(entry.get("full_sync"))),
+              entry.get("bytes_sent"), entry.get("bytes_received"),
+              json.dumps(entry.get("pushed") or {}), json.dumps(entry.get("pulled") or {}),
+              json.dumps(entry.get("phases") or {}), json.dumps(entry.get("server_phases") or {}),
+              entry.get("error")))
+        conn.execute("DELETE FROM sync_history WHERE id <= (SELECT MAX(id) FROM sync_history) - ?", (SYNC_HISTORY_LIMIT,))
+
+def get_sync_history(limit: int = 50) -> list:
+    """Ultime sincronizzazioni registrate, dalla più recente, con i campi JSON già decodificati."""
+    with DatabaseConnection() as conn:
+        rows = conn.execute("SELECT * FROM sync_history ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    history = []
+    for row in rows:
+        data = dict(row)
+        for field in ("pushed_json", "pulled_json", "phases_json", "server_phases_json"):
+            try:
+                data[field[:-5]] = json.loads(data.pop(field) or "{}")
+            except (json.JSONDecodeError, TypeError):
+                data[field[:-5]] = {}
+        history.append(data)
+    return history
 
 def force_update_timestamp(table_name, uuid, timestamp):
     """Aggiorna solo il timestamp di un record e lo marca come non sincronizzato."""
@@ -923,40 +2295,86 @@ def overwrite_local_record(table_name: str, record_data: dict):
 # SEZIONE 4: GESTORE PROFILI DI VERIFICA
 # ==============================================================================
 
+PROFILES_DATA_VERSION = "profiles"
+FLEET_DATA_VERSION = "fleet"
+
+_PROFILES_WITH_TESTS_QUERY = """
+    SELECT p.id AS profile_id, p.profile_key, p.name AS profile_name,
+           t.id AS test_id, t.name AS test_name, t.parameter, t.limits_json, t.is_applied_part_test
+    FROM profiles p
+    LEFT JOIN profile_tests t ON t.profile_id = p.id AND t.is_deleted = 0
+    WHERE p.is_deleted = 0
+    ORDER BY p.id, t.id
+"""
+
+# Ultima copia compilata letta in questo processo: (versione dei dati, payload)
+_compiled_profiles_memo = (None, None)
+
+def get_data_version(conn, name: str):
+    """Versione corrente di un insieme di dati (None se la tabella non è disponibile)."""
+    try:
+        row = conn.execute("SELECT version FROM data_versions WHERE name = ?", (name,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+def _compile_profiles(conn) -> list:
+    """
+    Legge profili e test con una sola query e li riduce a una struttura JSON compatta:
+    [[profile_key, nome, [[nome test, parametro, limiti, is_applied_part_test], ...]], ...]
+    """
+    compiled, current = [], None
+    for row in conn.execute(_PROFILES_WITH_TESTS_QUERY):
+        if current is None or current[0] != row['profile_id']:
+            current = (row['profile_id'], [row['profile_key'], row['profile_name'], []])
+            compiled.append(current[1])
+        if row['test_id'] is not None:
+            current[1][2].append([row['test_name'], row['parameter'], json.loads(row['limits_json'] or '{}'),
+                                  bool(row['is_applied_part_test'])])
+    return compiled
+
+def _profiles_from_compiled(compiled: list) -> dict:
+    # Oggetti sempre nuovi: chi li modifica (es. l'editor dei profili) non altera la cache
+    return {
+        profile_key: VerificationProfile(name=name, tests=[
+            Test(name=t_name, parameter=parameter, limits={k: Limit(**v) for k, v in limits.items()},
+                 is_applied_part_test=is_ap)
+            for t_name, parameter, limits, is_ap in tests
+        ])
+        for profile_key, name, tests in compiled
+    }
+
 def get_all_profiles_from_db():
     """
     Legge i profili e i test dal database locale e li ricostruisce
     nello stesso formato del vecchio file JSON.
+    La forma compilata viene salvata in compiled_profiles insieme alla versione
+    dei dati: finché i trigger non la incrementano, basta un solo json.loads.
     """
-    profiles_dict = {}
+    global _compiled_profiles_memo
     with DatabaseConnection() as conn:
-        # 1. Recupera tutti i profili
-        profiles_rows = conn.execute("SELECT * FROM profiles WHERE is_deleted = 0").fetchall()
-
-        for profile_row in profiles_rows:
-            profile_id = profile_row['id']
-            profile_key = profile_row['profile_key']
-
-            # 2. Per ogni profilo, recupera i suoi test
-            tests_rows = conn.execute("SELECT * FROM profile_tests WHERE profile_id = ? AND is_deleted = 0", (profile_id,)).fetchall()
-
-            tests_list = []
-            for test_row in tests_rows:
-                limits_data = json.loads(test_row['limits_json'] or '{}')
-                limits_obj = {key: Limit(**data) for key, data in limits_data.items()}
-
-                tests_list.append(Test(
-                    name=test_row['name'],
-                    parameter=test_row['parameter'],
-                    limits=limits_obj,
-                    is_applied_part_test=bool(test_row['is_applied_part_test'])
-                ))
-
-            profiles_dict[profile_key] = VerificationProfile(
-                name=profile_row['name'],
-                tests=tests_list
-            )
-
+        # La versione viene letta prima dei dati: se cambia durante la lettura,
+        # la copia salvata risulta già superata e verrà ricompilata.
+        version = get_data_version(conn, PROFILES_DATA_VERSION)
+        compiled = None
+        if version is not None and _compiled_profiles_memo[0] == version:
+            compiled = _compiled_profiles_memo[1]
+        elif version is not None:
+            row = conn.execute("SELECT data_version, payload FROM compiled_profiles WHERE id = 1").fetchone()
+            if row and row['data_version'] == version:
+                try:
+                    compiled = json.loads(row['payload'])
+                except ValueError:
+                    logging.warning("Cache dei profili compilati non leggibile: verrà ricostruita.")
+        if compiled is None:
+            compiled = _compile_profiles(conn)
+            if version is not None:
+                conn.execute("INSERT OR REPLACE INTO compiled_profiles (id, data_version, payload) VALUES (1, ?, ?)",
+                             (version, json.dumps(compiled, separators=(',', ':'))))
+        if version is not None:
+            _compiled_profiles_memo = (version, compiled)
+
+    profiles_dict = _profiles_from_compiled(compiled)
     logging.info(f"Caricati {len(profiles_dict)} profili dal database locale.")
     return profiles_dict
 
@@ -977,7 +2395,7 @@ def add_profile_with_tests(profile_key, profile_name, tests_list, timestamp):
             for test in tests_list:
                 tests_to_insert.append((
                     str(uuid.uuid4()), profile_id, test.name, test.parameter,
-                    json.dumps({k: v.__dict__ for k, v in test.limits.items()}),
+                    json.dumps({k: asdict(v) for k, v in test.limits.items()}),
                     test.is_applied_part_test, timestamp
                 ))
 
@@ -1008,7 +2426,7 @@ def update_profile_with_tests(profile_id, profile_name, tests_list, timestamp):
             for test in tests_list:
                 tests_to_insert.append((
                     str(uuid.uuid4()), profile_id, test.name, test.parameter,
-                    json.dumps({k: v.__dict__ for k, v in test.limits.items()}),
+                    json.dumps({k: asdict(v) for k, v in test.limits.items()}),
                     test.is_applied_part_test, timestamp
                 ))
 
@@ -1129,11 +2547,4 @@ def mark_everything_for_full_push(conn: sqlite3.Connection) -> dict:
             res[t] = {"rows_marked": cur.rowcount, "uuid_added": created[t]}
 
     logging.info(f"[full-push] Marcate come da sincronizzare: {res}")
-    return res
-
-# ==============================================================================
-# ESECUZIONE INIZIALE
-# ==============================================================================
-
-# Applica le migrazioni del database all'avvio del modulo
-migrate_database()
\ No newline at end of file
+    return res
\ No newline at end of file
@@ -1,18 +1,18 @@
 # main.py
+import time
+_PROCESS_START = time.perf_counter()
+
 import logging
 import sys
 import os
 from PySide6.QtWidgets import QApplication, QMessageBox, QDialog
-from jose import jwt, JWTError
-import app.auth_manager as auth_manager
 from app import auth_manager
 from dotenv import load_dotenv
 from app.config import STYLESHEET, load_verification_profiles
-from app.ui.main_window import MainWindow
 from app.logging_config import setup_logging
-from app.backup_manager import create_backup
-from app.ui.dialogs.login_dialog import LoginDialog
 from app import config
+# I moduli pesanti (finestra principale, dialog, pandas, reportlab, jose...) vengono
+# importati solo quando servono, dopo che lo splash screen è già visibile.
 
 load_dotenv()
 # La SECRET_KEY qui deve essere IDENTICA a quella in real_server.py
@@ -32,7 +32,12 @@ if __name__ == '__main__':
     logging.info(f"DB_PATH: {config.DB_PATH}")
     logging.info(f"BACKUP_DIR: {config.BACKUP_DIR}")
     
-    create_backup()
+    # Backup e migrazioni girano in background mentre è visibile lo splash screen
+    from app.startup import run_startup_tasks, record_startup_timings
+    startup_timings, splash = run_startup_tasks(app)
+    ui_import_start = time.perf_counter()
+    from app.ui.main_window import MainWindow
+    startup_timings["ui_import"] = time.perf_counter() - ui_import_start
     
     # 2. Avvia un ciclo che permette il login e il riavvio
     while True:
@@ -42,6 +47,11 @@ if __name__ == '__main__':
         if auth_manager.load_session_from_disk():
             logged_in_successfully = True
         else:
+            from app.ui.dialogs.login_dialog import LoginDialog
+            from jose import jwt, JWTError
+            if splash is not None:
+                splash.close()
+                splash = None
             login_dialog = LoginDialog()
             if login_dialog.exec() == QDialog.Accepted:
                 try:
@@ -66,6 +76,14 @@ if __name__ == '__main__':
             app.setStyleSheet(config.STYLESHEET)
             window = MainWindow()
             window.show()
+            if splash is not None:
+                splash.finish(window)
+                splash = None
+                # Solo il primo avvio (con sessione salvata) misura il percorso fino alla finestra
+                startup_timings["to_main_window"] = time.perf_counter() - _PROCESS_START
+            if startup_timings:
+                record_startup_timings(startup_timings)
+                startup_timings = {}
             
             app.exec() # Avvia il ciclo degli eventi, che si blocca finché la finestra non si chiude
     
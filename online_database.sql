@@ -152,3 +152,33 @@ CREATE INDEX IF NOT EXISTS idx_profile_tests_profile_id ON profile_tests(profile
 CREATE UNIQUE INDEX IF NOT EXISTS idx_devices_serial_unique
     ON devices(serial_number)
     WHERE serial_number IS NOT NULL AND serial_number <> '';
+
+-- --- Allocazione dei verification_code ---
+-- Ogni client riceve durante la sync blocchi di numeri riservati per il proprio
+-- prefisso (iniziali del tecnico): i codici restano univoci anche offline.
+ALTER TABLE verifications ADD COLUMN IF NOT EXISTS verification_code TEXT;
+CREATE INDEX IF NOT EXISTS idx_verifications_code ON verifications(verification_code);
+
+CREATE TABLE IF NOT EXISTS verification_code_counters (
+    prefix TEXT PRIMARY KEY,
+    next_number INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS verification_code_blocks (
+    id SERIAL PRIMARY KEY,
+    prefix TEXT NOT NULL,
+    start_number INTEGER NOT NULL,
+    end_number INTEGER NOT NULL,
+    username TEXT,
+    reserved_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Contatori dei prefissi già usati prima dell'introduzione dei blocchi: il prossimo
+-- numero parte oltre il codice più alto presente (idempotente, si può rieseguire).
+INSERT INTO verification_code_counters (prefix, next_number)
+SELECT SUBSTRING(verification_code FROM 1 FOR 2), MAX(CAST(SUBSTRING(verification_code FROM 3) AS INTEGER)) + 1
+FROM verifications
+WHERE verification_code ~ '^[A-Z]{2}[0-9]+$'
+GROUP BY SUBSTRING(verification_code FROM 1 FOR 2)
+ON CONFLICT (prefix) DO UPDATE
+SET next_number = GREATEST(verification_code_counters.next_number, EXCLUDED.next_number);
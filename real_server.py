@@ -1,27 +1,40 @@
 # real_server.py
 
-from fastapi import FastAPI, HTTPException, Depends, File, UploadFile
+from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, Request, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from typing import List, Optional
 import psycopg2
 from psycopg2 import errors
 from psycopg2.extras import RealDictCursor
+from psycopg2.extensions import connection as PgConnection
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from starlette.routing import Match
 from datetime import datetime, timezone, date, timedelta
 import logging
 import base64
 import os
 import json
+import re
+import time
+import zlib
+from contextlib import contextmanager
 from dotenv import load_dotenv
 # Sicurezza
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError, InvalidHash
 from jose import JWTError, jwt
+import server_metrics as metrics
 load_dotenv()
 # --- CONFIGURAZIONE DI SICUREZZA ---
 SECRET_KEY = os.getenv("SECRET_KEY") # IN PRODUZIONE, QUESTA CHIAVE DOVREBBE ESSERE GESTITA IN MODO SICURO
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60 * 24 * 30)) # 30 giorni
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # Se impostato, /metrics richiede "Authorization: Bearer <token>"
+# Dimensione massima di un corpo di richiesta compresso, una volta decompresso
+MAX_DECOMPRESSED_BODY = int(os.getenv("MAX_DECOMPRESSED_BODY_MB", 512)) * 1024 * 1024
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 ph = PasswordHasher()
@@ -41,20 +54,125 @@ TABLES_TO_SYNC = ["customers", "mti_instruments", "signatures", "profiles", "pro
 # --- AVVIO APPLICAZIONE API ---
 app = FastAPI(title="Safety Test Sync API")
 
+# --- COMPRESSIONE ---
+class GzipRequestMiddleware:
+    """
+    Decomprime i corpi delle richieste inviati con "Content-Encoding: gzip" (il
+    client comprime i payload di /sync e gli altri JSON sopra una certa soglia),
+    così gli endpoint ricevono il JSON come prima.
+    Ogni risposta dichiara "Accept-Encoding: gzip" (RFC 7694): il client comprime
+    le richieste solo dopo averlo visto, così resta compatibile con i server
+    precedenti che non sanno decomprimerle.
+    """
+    def __init__(self, app, max_size: int = MAX_DECOMPRESSED_BODY):
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_accept_encoding(message):
+            if message["type"] == "http.response.start":
+                message = dict(message, headers=[*message.get("headers", []), (b"accept-encoding", b"gzip")])
+            await send(message)
+        if Headers(scope=scope).get("content-encoding", "").lower() != "gzip":
+            await self.app(scope, receive, send_with_accept_encoding)
+            return
+        chunks, more_body = [], True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(b"".join(chunks), self.max_size + 1)
+        except zlib.error:
+            await JSONResponse({"detail": "Corpo gzip non valido"}, status_code=400)(scope, receive, send_with_accept_encoding)
+            return
+        if len(body) > self.max_size:
+            await JSONResponse({"detail": "Corpo della richiesta troppo grande"}, status_code=413)(scope, receive, send_with_accept_encoding)
+            return
+        if not decompressor.eof:
+            await JSONResponse({"detail": "Corpo gzip incompleto"}, status_code=400)(scope, receive, send_with_accept_encoding)
+            return
+
+        headers = [(k, v) for k, v in scope["headers"] if k not in (b"content-encoding", b"content-length")]
+        headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        delivered = False
+
+        async def receive_decompressed():
+            nonlocal delivered
+            if not delivered:
+                delivered = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+        await self.app(dict(scope, headers=headers), receive_decompressed, send_with_accept_encoding)
+
+# Ordine: le metriche (registrate per ultime) vedono le dimensioni compresse in rete,
+# poi la compressione delle risposte, poi la decompressione delle richieste.
+app.add_middleware(GzipRequestMiddleware)
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+# --- METRICHE ---
+def _route_label(request: Request) -> str:
+    """Percorso della route (es. /users/{username}), per non creare un'etichetta per ogni URL."""
+    partial = None
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path  # percorso giusto, metodo non ammesso (405)
+    return partial or "unmatched"
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    route = _route_label(request)
+    labels = {"method": request.method, "route": route}
+    metrics.HTTP_REQUESTS_IN_PROGRESS.inc(**labels)
+    if request.headers.get("content-length", "").isdigit():
+        metrics.HTTP_REQUEST_SIZE.observe(int(request.headers["content-length"]), route=route)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if response.headers.get("content-length", "").isdigit():
+            metrics.HTTP_RESPONSE_SIZE.observe(int(response.headers["content-length"]), route=route)
+        return response
+    finally:
+        metrics.HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, **labels)
+        metrics.HTTP_REQUESTS.inc(status=str(status), **labels)
+        metrics.HTTP_REQUESTS_IN_PROGRESS.dec(**labels)
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Token delle metriche non valido")
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 # --- UTILITY DI SICUREZZA ---
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica una password usando Argon2 in modo robusto."""
+    start = time.perf_counter()
+    result = "error"
     try:
         # Il metodo corretto è ph.verify()
         ph.verify(hashed_password, plain_password)
+        result = "ok"
         return True
     except (VerifyMismatchError, InvalidHash):
         # Se la password non corrisponde o l'hash non è valido, l'eccezione viene
         # catturata e la funzione restituisce False, come previsto.
+        result = "mismatch"
         return False
     except Exception as e:
         logging.error(f"Errore imprevisto durante la verifica della password: {e}")
         return False
+    finally:
+        metrics.PASSWORD_VERIFY_DURATION.observe(time.perf_counter() - start, result=result)
 
 def get_password_hash(password: str) -> str:
     return ph.hash(password)
@@ -154,9 +272,14 @@ class SyncChanges(BaseModel):
     profile_tests: List[SyncRecord]
     destinations: List[SyncRecord]
 
+class CodeBlockRequest(BaseModel):
+    prefix: str
+    size: int = 200
+
 class SyncPayload(BaseModel):
     last_sync_timestamp: Optional[str]
     changes: SyncChanges
+    code_block_request: Optional[CodeBlockRequest] = None
 
 # --- DEPENDENCY PER LA SICUREZZA ---
 def get_current_user(token: str = Depends(oauth2_scheme)):
@@ -178,8 +301,31 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
     return {"username": username, "role": role, "full_name": payload.get("full_name")}
 
 # --- FUNZIONI DATABASE SERVER ---
+class TrackedConnection(PgConnection):
+    """Connessione psycopg2 che tiene aggiornato il numero di connessioni aperte nelle metriche."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        metrics.DB_CONNECTIONS_OPEN.inc()
+        metrics.DB_CONNECTIONS_OPENED.inc()
+
+    def close(self):
+        if not self.closed:
+            metrics.DB_CONNECTIONS_OPEN.dec()
+        super().close()
+
+    def __del__(self):
+        if not self.closed:
+            metrics.DB_CONNECTIONS_OPEN.dec()
+
 def get_db_connection():
-    return psycopg2.connect(**DB_PARAMS)
+    start = time.perf_counter()
+    try:
+        conn = psycopg2.connect(connection_factory=TrackedConnection, **DB_PARAMS)
+    except psycopg2.Error:
+        metrics.DB_CONNECTION_ERRORS.inc()
+        raise
+    metrics.DB_CONNECT_DURATION.observe(time.perf_counter() - start)
+    return conn
 
 # In real_server.py
 
@@ -327,6 +473,120 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
     access_token = create_access_token(data={"sub": user['username'], "role": user['role'], "full_name": full_name}, expires_delta=access_token_expires)
     return {"access_token": access_token, "token_type": "bearer"}
 
+# --- ALLOCAZIONE VERIFICATION_CODE ---
+CODE_PREFIX_PATTERN = re.compile(r"^[A-Z]{2}$")
+CODE_PATTERN = re.compile(r"^([A-Z]{2})(\d+)$")
+MAX_CODE_BLOCK_SIZE = 1000
+
+def _seed_code_counter(cursor, prefix: str, next_number: int = 1) -> None:
+    """
+    Crea o porta avanti il contatore del prefisso: il prossimo numero supera sia
+    next_number sia i codici del prefisso già presenti sul server (es. ricevuti
+    da altri client o da sincronizzazioni precedenti all'introduzione dei contatori).
+    """
+    cursor.execute("""
+        INSERT INTO verification_code_counters (prefix, next_number)
+        SELECT %s, GREATEST(COALESCE(MAX(CAST(SUBSTRING(verification_code FROM 3) AS INTEGER)), 0) + 1, %s)
+        FROM verifications WHERE verification_code ~ ('^' || %s || '[0-9]+$')
+        ON CONFLICT (prefix) DO UPDATE
+        SET next_number = GREATEST(verification_code_counters.next_number, EXCLUDED.next_number)
+    """, (prefix, next_number, prefix))
+
+def _existing_code_counters(cursor, prefixes) -> set:
+    cursor.execute("SELECT prefix FROM verification_code_counters WHERE prefix = ANY(%s)", (list(prefixes),))
+    return {row["prefix"] for row in cursor.fetchall()}
+
+def advance_code_counters(cursor, verification_records: list[dict]) -> None:
+    """
+    Porta i contatori oltre i codici appena ricevuti dai client (es. codici assegnati
+    offline prima di avere un blocco), così i blocchi futuri non li sovrappongono.
+    I contatori nuovi partono anche oltre i codici già presenti sul server.
+    """
+    highest = {}
+    for rec in verification_records:
+        match = CODE_PATTERN.match(rec.get("verification_code") or "")
+        if match:
+            prefix, number = match.group(1), int(match.group(2))
+            highest[prefix] = max(highest.get(prefix, 0), number)
+    if not highest:
+        return
+    existing = _existing_code_counters(cursor, highest)
+    for prefix, number in highest.items():
+        if prefix not in existing:
+            _seed_code_counter(cursor, prefix, number + 1)
+            continue
+        cursor.execute("""
+            UPDATE verification_code_counters SET next_number = GREATEST(next_number, %s) WHERE prefix = %s
+        """, (number + 1, prefix))
+
+def reserve_code_block(cursor, prefix: str, size: int, username: str) -> Optional[dict]:
+    """
+    Riserva atomicamente 'size' numeri consecutivi per il prefisso indicato.
+    Con un prefisso non valido non riserva nulla e restituisce None: il client
+    continua a usare il proprio contatore locale e la sincronizzazione prosegue.
+    """
+    if not CODE_PREFIX_PATTERN.match(prefix or ""):
+        logging.warning(f"Prefisso codice non valido da {username}: {prefix!r}. Blocco di codici non riservato.")
+        return None
+    size = max(1, min(int(size), MAX_CODE_BLOCK_SIZE))
+    # Primo blocco per il prefisso: il contatore parte dal codice più alto già presente
+    if not _existing_code_counters(cursor, [prefix]):
+        _seed_code_counter(cursor, prefix)
+    cursor.execute("""
+        UPDATE verification_code_counters SET next_number = next_number + %s
+        WHERE prefix = %s RETURNING next_number - %s AS start_number
+    """, (size, prefix, size))
+    start = cursor.fetchone()["start_number"]
+    end = start + size - 1
+    cursor.execute(
+        "INSERT INTO verification_code_blocks (prefix, start_number, end_number, username) VALUES (%s, %s, %s, %s)",
+        (prefix, start, end, username))
+    logging.info(f"Riservato il blocco codici {prefix}{start:06d}-{prefix}{end:06d} per {username}.")
+    return {"prefix": prefix, "start": start, "end": end}
+
+class SyncTimings:
+    """
+    Tempi delle fasi di handle_sync e righe ricevute/inviate per tabella,
+    restituiti al client nel campo "timings" della risposta. lap(nome) assegna
+    alla fase il tempo trascorso dalla fase precedente.
+    """
+    def __init__(self):
+        self._start = self._last = time.perf_counter()
+        self.phases = {}
+        self.pushed = {}
+        self.pulled = {}
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self._last
+        self._last = now
+
+    @contextmanager
+    def phase(self, name):
+        self._last = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.lap(name)
+
+    def as_dict(self) -> dict:
+        self.phases["total"] = time.perf_counter() - self._start
+        return {"phases": {k: round(v, 4) for k, v in self.phases.items()},
+                "pushed": self.pushed, "pulled": self.pulled}
+
+    def record_metrics(self, status: str, first_sync: bool):
+        """Aggiorna le metriche di /sync con i tempi e i conteggi raccolti."""
+        metrics.SYNC_REQUESTS.inc(status=status, first_sync=str(first_sync).lower())
+        for table, count in self.pushed.items():
+            metrics.SYNC_ROWS_PUSHED.inc(count, table=table)
+        for table, count in self.pulled.items():
+            metrics.SYNC_ROWS_PULLED.inc(count, table=table)
+        metrics.SYNC_PUSH_ROWS.observe(sum(self.pushed.values()))
+        if status == "success":
+            metrics.SYNC_PULL_ROWS.observe(sum(self.pulled.values()))
+        for phase, seconds in self.phases.items():
+            metrics.SYNC_PHASE_DURATION.observe(seconds, phase=phase)
+
 # --- ENDPOINT PROTETTI ---
 @app.post("/sync")
 def handle_sync(payload: SyncPayload, current_user: User = Depends(get_current_user)):
@@ -336,6 +596,8 @@ def handle_sync(payload: SyncPayload, current_user: User = Depends(get_current_u
     changes_to_send = {}
     final_uuid_map = {}  # non più usato, ma lasciamo il campo nella risposta per retro-compat
     new_sync_timestamp = datetime.now(timezone.utc)
+    timings = SyncTimings()
+    conn = None
 
     try:
         conn = get_db_connection()
@@ -344,6 +606,7 @@ def handle_sync(payload: SyncPayload, current_user: User = Depends(get_current_u
                 logging.info("Fase PUSH: Ricezione dati con rilevamento conflitti...")
 
                 changes_dict = payload.changes.model_dump()
+                timings.lap("connect")
 
                 # IMPORTANTE: l’ordine evita FK mancanti (customers -> destinations -> devices -> verifications)
                 # Se TABLES_TO_SYNC è già in questo ordine, usa quello. Altrimenti usa questa lista:
@@ -355,9 +618,12 @@ def handle_sync(payload: SyncPayload, current_user: User = Depends(get_current_u
                     if not records:
                         continue
                     logging.info(f"Processando {len(records)} record per la tabella '{table}'...")
+                    timings.pushed[table] = len(records)
                     # process_client_changes deve ACCETTARE un CURSOR e ACCODARE i conflitti in all_conflicts
-                    table_conflicts, _, table_uuid_map = process_client_changes(conn, table, records, current_user.role)
+                    with timings.phase(f"push.{table}"):
+                        table_conflicts, _, table_uuid_map = process_client_changes(conn, table, records, current_user.role)
                     if table_conflicts:
+                        metrics.SYNC_CONFLICTS.inc(len(table_conflicts), table=table)
                         all_conflicts.extend(table_conflicts)
                     if table_uuid_map:
                         final_uuid_map.update(table_uuid_map)
@@ -365,9 +631,28 @@ def handle_sync(payload: SyncPayload, current_user: User = Depends(get_current_u
                 if all_conflicts:
                     # Il with conn farà rollback uscendo dal blocco
                     logging.warning(f"Rilevati {len(all_conflicts)} conflitti. PUSH annullato.")
-                    return {"status": "conflict", "conflicts": all_conflicts}
+                    sync_timings = timings.as_dict()
+                    timings.record_metrics("conflict", payload.last_sync_timestamp is None)
+                    return {"status": "conflict", "conflicts": all_conflicts, "timings": sync_timings}
 
                 logging.info("Fase PUSH completata con successo.")
+
+                advance_code_counters(cursor, changes_dict.get("verifications", []))
+                code_blocks = []
+                if payload.code_block_request:
+                    # Un errore nella prenotazione non annulla il PUSH: il client riproverà alla prossima sync
+                    cursor.execute("SAVEPOINT code_block")
+                    try:
+                        block = reserve_code_block(cursor, payload.code_block_request.prefix,
+                                                   payload.code_block_request.size, current_user.username)
+                        cursor.execute("RELEASE SAVEPOINT code_block")
+                    except psycopg2.Error as e:
+                        cursor.execute("ROLLBACK TO SAVEPOINT code_block")
+                        logging.error(f"Prenotazione del blocco codici non riuscita: {e}")
+                        block = None
+                    if block:
+                        code_blocks.append(block)
+                timings.lap("code_counters")
                 logging.info("Fase PULL: Invio aggiornamenti al client...")
 
                 # ------- PULL -------
@@ -465,6 +750,8 @@ def handle_sync(payload: SyncPayload, current_user: User = Depends(get_current_u
                         WHERE v.last_modified > %s AND v.last_modified <= %s
                     """, (last_sync_dt, new_sync_timestamp))
                     changes_to_send["verifications"] = cursor.fetchall()
+                timings.lap("pull_queries")
+                timings.pulled = {table: len(rows) for table, rows in changes_to_send.items()}
 
                 # Firma: base64 per i blob
                 if "signatures" in changes_to_send:
@@ -478,19 +765,29 @@ def handle_sync(payload: SyncPayload, current_user: User = Depends(get_current_u
                         for key, value in list(row.items()):
                             if isinstance(value, (datetime, date)):
                                 row[key] = value.isoformat()
+                timings.lap("serialize")
 
         # Se siamo qui, il with conn ha COMMITTATO
+        timings.lap("commit")
+        sync_timings = timings.as_dict()
+        timings.record_metrics("success", payload.last_sync_timestamp is None)
+        logging.info(f"Sync di {current_user.username} completato: {json.dumps(sync_timings)}")
         return {
             "status": "success",
             "new_sync_timestamp": new_sync_timestamp.isoformat(),
             "changes": changes_to_send,
-            "uuid_map": final_uuid_map
+            "uuid_map": final_uuid_map,
+            "code_blocks": code_blocks,
+            "timings": sync_timings
         }
 
     except Exception as e:
         logging.error(f"Errore grave durante la sincronizzazione: {e}", exc_info=True)
+        metrics.SYNC_REQUESTS.inc(status="error", first_sync=str(payload.last_sync_timestamp is None).lower())
         # Il with conn avrebbe già fatto rollback; se eccezione prima del with, non c'è transazione aperta
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if conn: conn.close()
 
 @app.get("/users", response_model=List[User])
 def read_users(current_user: User = Depends(get_current_user)):
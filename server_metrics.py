@@ -0,0 +1,195 @@
+# server_metrics.py
+"""
+Metriche del server di sincronizzazione nel formato testuale di Prometheus
+(esposte da real_server.py su /metrics). Contatori, gauge e istogrammi sono
+tenuti in memoria nel processo e protetti da un lock, perché FastAPI esegue gli
+endpoint sincroni in un pool di thread.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Limiti (secondi) degli istogrammi di durata: dal millisecondo ai due minuti
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Limiti (byte) degli istogrammi di dimensione di richieste e risposte
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 5_000_000, 20_000_000, 100_000_000)
+# Limiti (righe) degli istogrammi del numero di record per sincronizzazione
+ROW_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(labelnames, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        if not self.labelnames and self.kind in ("counter", "gauge"):
+            self._values[()] = 0  # Le metriche senza etichette sono esposte fin dall'avvio
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: etichette attese {self.labelnames}, ricevute {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """Valore che può solo crescere (richieste, righe, conflitti...)."""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Un contatore non può diminuire.")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Valore istantaneo che sale e scende (connessioni aperte, richieste in corso...)."""
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Distribuzione di osservazioni in bucket cumulativi, con somma e conteggio."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Osserva la durata (secondi) del blocco with."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_sample(self, key, value) -> list:
+        counts, total, count = value
+        lines = [f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(b))])} {c}"
+                 for b, c in zip(self.buckets, counts)]
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metrica già registrata: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# --- METRICHE DEL SERVER ---
+PROCESS_START_TIME = REGISTRY.gauge("process_start_time_seconds", "Avvio del processo (Unix time).")
+PROCESS_START_TIME.set(time.time())
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "Richieste HTTP completate, per metodo, route e codice di stato.", ("method", "route", "status"))
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "Durata delle richieste HTTP.", ("method", "route"))
+HTTP_REQUESTS_IN_PROGRESS = REGISTRY.gauge(
+    "http_requests_in_progress", "Richieste HTTP in corso.", ("method", "route"))
+HTTP_REQUEST_SIZE = REGISTRY.histogram(
+    "http_request_size_bytes", "Dimensione del corpo delle richieste (Content-Length).", ("route",), SIZE_BUCKETS)
+HTTP_RESPONSE_SIZE = REGISTRY.histogram(
+    "http_response_size_bytes", "Dimensione del corpo delle risposte (Content-Length).", ("route",), SIZE_BUCKETS)
+
+SYNC_REQUESTS = REGISTRY.counter("sync_requests_total", "Sincronizzazioni per esito e tipo.", ("status", "first_sync"))
+SYNC_ROWS_PUSHED = REGISTRY.counter("sync_rows_pushed_total", "Record ricevuti dai client, per tabella.", ("table",))
+SYNC_ROWS_PULLED = REGISTRY.counter("sync_rows_pulled_total", "Record inviati ai client, per tabella.", ("table",))
+SYNC_PUSH_ROWS = REGISTRY.histogram(
+    "sync_push_rows", "Record ricevuti in una singola sincronizzazione.", (), ROW_BUCKETS)
+SYNC_PULL_ROWS = REGISTRY.histogram(
+    "sync_pull_rows", "Record inviati in una singola sincronizzazione.", (), ROW_BUCKETS)
+SYNC_CONFLICTS = REGISTRY.counter("sync_conflicts_total", "Conflitti rilevati durante il push, per tabella.", ("table",))
+SYNC_PHASE_DURATION = REGISTRY.histogram(
+    "sync_phase_duration_seconds", "Durata delle fasi di /sync (push per tabella, pull, serializzazione...).", ("phase",))
+
+DB_CONNECTIONS_OPEN = REGISTRY.gauge("db_connections_open", "Connessioni PostgreSQL aperte dal server.")
+DB_CONNECTIONS_OPENED = REGISTRY.counter("db_connections_opened_total", "Connessioni PostgreSQL aperte dall'avvio.")
+DB_CONNECTION_ERRORS = REGISTRY.counter("db_connection_errors_total", "Tentativi di connessione a PostgreSQL falliti.")
+DB_CONNECT_DURATION = REGISTRY.histogram("db_connect_duration_seconds", "Tempo di apertura di una connessione PostgreSQL.")
+
+PASSWORD_VERIFY_DURATION = REGISTRY.histogram(
+    "password_verify_duration_seconds", "Durata della verifica Argon2 delle password, per esito.", ("result",),
+    (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
@@ -0,0 +1,111 @@
+# tests/test_code_counters.py
+"""
+Allocazione dei verification_code: prefissi normalizzati dal client e contatori
+/blocchi del server (advance_code_counters, reserve_code_block).
+
+I test sul server che eseguono SQL richiedono PostgreSQL: indicare la connessione
+in STM_TEST_DATABASE_URL (es. "dbname=stm_test user=postgres"). Ogni test lavora
+in uno schema temporaneo dentro una transazione annullata alla fine.
+"""
+import os
+import uuid
+
+import pytest
+
+import database
+import real_server
+
+
+class RecordingCursor:
+    """Cursore finto che registra le query: per i casi che non devono toccare il database."""
+    def __init__(self):
+        self.queries = []
+
+    def execute(self, sql, params=None):
+        self.queries.append((sql, params))
+
+
+@pytest.mark.parametrize("name, username, expected", [
+    ("Elson Meta", "", "EM"),
+    ("Élodie Marì", "", "EM"),
+    ("Elson", "", "EE"),
+    ("", "mrossi", "MR"),
+    ("", "m.rossi", "XX"),
+    ("", "", "XX"),
+    ("Łukasz Øster", "", "XX"),
+])
+def test_client_prefix_matches_server_rule(name, username, expected):
+    prefix = database.verification_code_prefix(name, username)
+    assert prefix == expected
+    assert real_server.CODE_PREFIX_PATTERN.match(prefix)
+
+@pytest.mark.parametrize("prefix", ["M.", "ÉM", "", None, "ABC"])
+def test_reserve_code_block_skips_invalid_prefix(prefix):
+    cursor = RecordingCursor()
+    assert real_server.reserve_code_block(cursor, prefix, 100, "mrossi") is None
+    assert cursor.queries == []
+
+
+@pytest.fixture
+def pg_cursor():
+    dsn = os.getenv("STM_TEST_DATABASE_URL")
+    if not dsn:
+        pytest.skip("STM_TEST_DATABASE_URL non impostata: test PostgreSQL saltati")
+    psycopg2 = pytest.importorskip("psycopg2")
+    from psycopg2.extras import RealDictCursor
+    conn = psycopg2.connect(dsn)
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        schema = f"test_codes_{uuid.uuid4().hex[:8]}"
+        cursor.execute(f"CREATE SCHEMA {schema}; SET LOCAL search_path TO {schema};")
+        cursor.execute("""
+            CREATE TABLE verifications (id SERIAL PRIMARY KEY, verification_code TEXT);
+            CREATE TABLE verification_code_counters (prefix TEXT PRIMARY KEY, next_number INTEGER NOT NULL);
+            CREATE TABLE verification_code_blocks (
+                id SERIAL PRIMARY KEY, prefix TEXT NOT NULL, start_number INTEGER NOT NULL,
+                end_number INTEGER NOT NULL, username TEXT, reserved_at TIMESTAMPTZ NOT NULL DEFAULT NOW());
+        """)
+        yield cursor
+    finally:
+        conn.rollback()
+        conn.close()
+
+def _store_codes(cursor, *codes):
+    for code in codes:
+        cursor.execute("INSERT INTO verifications (verification_code) VALUES (%s)", (code,))
+
+def _counter(cursor, prefix):
+    cursor.execute("SELECT next_number FROM verification_code_counters WHERE prefix = %s", (prefix,))
+    row = cursor.fetchone()
+    return row["next_number"] if row else None
+
+def test_reserve_code_block_starts_after_existing_server_codes(pg_cursor):
+    _store_codes(pg_cursor, "EM000041", "EM000007", "MR000900")
+    block = real_server.reserve_code_block(pg_cursor, "EM", 10, "emeta")
+    assert block == {"prefix": "EM", "start": 42, "end": 51}
+    assert _counter(pg_cursor, "EM") == 52
+
+def test_advance_code_counters_seeds_new_counter_from_server_max(pg_cursor):
+    # Codici di altri client già sul server, più alti di quelli appena ricevuti
+    _store_codes(pg_cursor, "EM000500", "EM000003")
+    real_server.advance_code_counters(pg_cursor, [{"verification_code": "EM000003"}])
+    assert _counter(pg_cursor, "EM") == 501
+    block = real_server.reserve_code_block(pg_cursor, "EM", 5, "emeta")
+    assert block["start"] == 501
+
+def test_advance_code_counters_uses_pushed_max_when_higher(pg_cursor):
+    _store_codes(pg_cursor, "EM000010")
+    real_server.advance_code_counters(pg_cursor, [{"verification_code": "EM000120"}, {"verification_code": "bad"}])
+    assert _counter(pg_cursor, "EM") == 121
+
+def test_advance_code_counters_never_moves_existing_counter_back(pg_cursor):
+    _store_codes(pg_cursor, "EM000010")
+    real_server.reserve_code_block(pg_cursor, "EM", 100, "emeta")
+    real_server.advance_code_counters(pg_cursor, [{"verification_code": "EM000020"}])
+    assert _counter(pg_cursor, "EM") == 111
+
+def test_reserve_code_block_invalid_prefix_leaves_counters_untouched(pg_cursor):
+    _store_codes(pg_cursor, "EM000010")
+    assert real_server.reserve_code_block(pg_cursor, "M.", 10, "mrossi") is None
+    pg_cursor.execute("SELECT COUNT(*) AS n FROM verification_code_counters")
+    assert pg_cursor.fetchone()["n"] == 0
@@ -0,0 +1,32 @@
+# tests/test_measurements.py
+"""
+Scomposizione dei nomi dei risultati in verification_measurements
+(parse_result_name), sia dai campi separati sia dai nomi composti più vecchi.
+"""
+import pytest
+
+import database
+
+KNOWN_TESTS = {"Corrente di dispersione parte applicata", "Corrente - metodo diretto"}
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("Corrente di dispersione parte applicata - Paziente - BF",
+     ("Corrente di dispersione parte applicata", None, "Paziente", "BF")),
+    # " - " sia nel nome del test sia in quello della parte applicata
+    ("Corrente - metodo diretto - Elettrodi - ECG - CF", ("Corrente - metodo diretto", None, "Elettrodi - ECG", "CF")),
+    # Test non presente nei profili: si divide sull'ultimo " - " prima del tipo
+    ("Test rimosso - Sensore - B", ("Test rimosso", None, "Sensore", "B")),
+    ("Resistenza di isolamento (500 V)", ("Resistenza di isolamento", "500 V", None, None)),
+    # Senza un tipo di parte applicata in coda il nome resta intero
+    ("Misura - confronto - riferimento", ("Misura - confronto - riferimento", None, None, None)),
+    ("Resistenza conduttore di protezione", ("Resistenza conduttore di protezione", None, None, None)),
+])
+def test_parse_legacy_result_name(name, expected):
+    assert database.parse_result_name({"name": name}, KNOWN_TESTS) == expected
+
+
+def test_parse_result_prefers_structured_fields():
+    result = {"name": "A - B - C - BF", "test_name": "A - B", "parameter": "",
+              "applied_part": "C", "applied_part_type": "BF"}
+    assert database.parse_result_name(result) == ("A - B", None, "C", "BF")